@@ -0,0 +1,282 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app.core import cache, canasta
+from app.core.database import SessionLocal
+from app.models import models
+
+# Motor de análisis de inventario.
+# Todo el catálogo se clasifica de una vez con NumPy: una consulta para el
+# catálogo y una consulta agrupada por SKU sobre el rollup diario de ventas.
+
+DIAS_HISTORIA = 730
+DIAS_RECIENTES = 30
+PESO_RECIENTE = 0.7 # Peso de la tasa de los últimos 30 días frente a la histórica
+
+# Cobertura en días de inventario (stock / venta diaria)
+COBERTURA_CRITICA = 7
+COBERTURA_BAJA = 21
+COBERTURA_EXCESO = 120
+
+# Percentiles de la tasa de venta (entre productos que sí venden)
+PERCENTIL_ROTACION_ALTA = 80
+PERCENTIL_ROTACION_MEDIA = 40
+
+MAX_SUGERENCIAS_POR_ACCION = 5
+
+def _catalogo(db: Session):
+    """Variantes y productos de reventa en dos consultas (sin lazy-loading)."""
+    v = models.VarianteProducto
+    pf = models.ProductoFabricado
+    variantes = db.execute(
+        select(v.id, func.concat(pf.nombre, " - ", v.talla, " ", v.color), v.stockActual)
+        .join(pf, pf.id == v.producto_fabricado_id)
+        .order_by(v.id)
+    ).all()
+    r = models.ProductoReventa
+    reventa = db.execute(select(r.id, r.nombre, r.stockActual).order_by(r.id)).all()
+    return variantes, reventa
+
+def _ventas_por_sku(db: Session, hoy: date) -> np.ndarray:
+    """
+    Ventas netas por SKU desde el rollup en una consulta agrupada, como matriz int64:
+    [variante_id | -1, reventa_id | -1, unidades en la historia, unidades recientes].
+    """
+    vd = models.VentaDiaria
+    netas = vd.unidades - vd.unidadesDevueltas
+    recientes = hoy - timedelta(days=DIAS_RECIENTES - 1)
+    filas = db.execute(
+        select(
+            func.coalesce(vd.variante_producto_id, -1),
+            func.coalesce(vd.producto_reventa_id, -1),
+            func.sum(netas),
+            func.coalesce(func.sum(netas).filter(vd.fecha >= recientes), 0)
+        )
+        .where(vd.fecha >= hoy - timedelta(days=DIAS_HISTORIA - 1))
+        .group_by(vd.variante_producto_id, vd.producto_reventa_id)
+    ).all()
+    if not filas:
+        return np.empty((0, 4), dtype=np.int64)
+    return np.array([tuple(f) for f in filas], dtype=np.int64)
+
+def _posiciones(ids: np.ndarray, desplazamiento: int) -> np.ndarray:
+    """Tabla id -> índice en el catálogo (-1 si no existe)."""
+    tabla = np.full(int(ids.max()) + 1 if ids.size else 1, -1, dtype=np.int64)
+    tabla[ids] = np.arange(ids.size) + desplazamiento
+    return tabla
+
+def _indice_sku(ids_sku: np.ndarray, tabla: np.ndarray) -> np.ndarray:
+    resultado = np.full(ids_sku.shape, -1, dtype=np.int64)
+    validos = (ids_sku >= 0) & (ids_sku < tabla.size)
+    resultado[validos] = tabla[ids_sku[validos]]
+    return resultado
+
+def calcular_metricas(db: Session) -> dict:
+    """
+    Arreglos alineados por producto (variantes primero, luego reventa):
+    tipo, id, nombre, stock, vendido total/reciente, tasa diaria y cobertura.
+    """
+    variantes, reventa = _catalogo(db)
+    n_var = len(variantes)
+    n = n_var + len(reventa)
+
+    ids = np.array([f[0] for f in variantes] + [f[0] for f in reventa], dtype=np.int64)
+    nombres = [f[1] for f in variantes] + [f[1] for f in reventa]
+    stock = np.array([f[2] for f in variantes] + [f[2] for f in reventa], dtype=np.float64)
+    es_variante = np.arange(n) < n_var
+
+    ventas = _ventas_por_sku(db, date.today())
+
+    vendido_total = np.zeros(n)
+    vendido_reciente = np.zeros(n)
+    if ventas.size and n:
+        idx_var = _indice_sku(ventas[:, 0], _posiciones(ids[:n_var], 0))
+        idx_rev = _indice_sku(ventas[:, 1], _posiciones(ids[n_var:], n_var))
+        idx = np.where(ventas[:, 0] >= 0, idx_var, idx_rev)
+        conocidos = idx >= 0
+        vendido_total = np.bincount(idx[conocidos], weights=ventas[conocidos, 2], minlength=n)
+        vendido_reciente = np.bincount(idx[conocidos], weights=ventas[conocidos, 3], minlength=n)
+
+    tasa = PESO_RECIENTE * vendido_reciente / DIAS_RECIENTES + (1 - PESO_RECIENTE) * vendido_total / DIAS_HISTORIA
+    tasa = np.maximum(tasa, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cobertura = np.where(tasa > 0, stock / tasa, np.inf)
+
+    return {
+        "ids": ids,
+        "nombres": nombres,
+        "es_variante": es_variante,
+        "stock": stock,
+        "vendido_total": vendido_total,
+        "vendido_reciente": vendido_reciente,
+        "tasa": tasa,
+        "cobertura": cobertura,
+    }
+
+def _clasificar(m: dict) -> Tuple[np.ndarray, np.ndarray]:
+    stock, tasa, cobertura = m["stock"], m["tasa"], m["cobertura"]
+
+    estado = np.select(
+        [stock <= 0, cobertura < COBERTURA_CRITICA, cobertura < COBERTURA_BAJA, cobertura > COBERTURA_EXCESO],
+        ["Agotado", "Crítico", "Bajo", "Exceso"],
+        default="Normal"
+    )
+
+    rotacion = np.full(stock.shape, "Nula", dtype=object)
+    activos = (m["vendido_total"] > 0) & (tasa > 0)
+    if activos.any():
+        umbral_alta, umbral_media = np.percentile(tasa[activos], [PERCENTIL_ROTACION_ALTA, PERCENTIL_ROTACION_MEDIA])
+        rotacion[activos] = np.select(
+            [tasa[activos] >= umbral_alta, tasa[activos] >= umbral_media],
+            ["Alta", "Media"],
+            default="Baja"
+        )
+    return estado, rotacion
+
+def _sugerencias(m: dict, estado: np.ndarray, rotacion: np.ndarray) -> List[dict]:
+    nombres, stock, cobertura, tasa = m["nombres"], m["stock"], m["cobertura"], m["tasa"]
+    sugerencias = []
+
+    # Reabastecer: se agota pronto y sí se vende
+    candidatos = np.flatnonzero(np.isin(estado, ["Agotado", "Crítico", "Bajo"]) & np.isin(rotacion, ["Alta", "Media"]))
+    for i in candidatos[np.argsort(cobertura[candidatos])][:MAX_SUGERENCIAS_POR_ACCION]:
+        dias = "sin stock" if stock[i] <= 0 else f"~{int(cobertura[i])} días de inventario"
+        sugerencias.append({
+            "titulo": f"Reabastecer {nombres[i]}",
+            "descripcion": f"Rotación {rotacion[i].lower()} y {dias} ({tasa[i]:.1f} u/día).",
+            "accion_sugerida": "Reabastecer",
+            "producto_objetivo": nombres[i]
+        })
+
+    # Descuento: inventario de sobra que no se mueve
+    estancados = np.flatnonzero((estado == "Exceso") & np.isin(rotacion, ["Baja", "Nula"]))
+    estancados = estancados[np.argsort(-stock[estancados])]
+    for i in estancados[:MAX_SUGERENCIAS_POR_ACCION]:
+        sugerencias.append({
+            "titulo": f"Liquidar {nombres[i]}",
+            "descripcion": f"{int(stock[i])} unidades con rotación {rotacion[i].lower()}. Considera un descuento.",
+            "accion_sugerida": "Descuento",
+            "producto_objetivo": nombres[i]
+        })
+
+    # Bundle: pares que ya se compran juntos (reglas de asociación), priorizando
+    # las que ayudan a mover un producto con exceso de inventario
+    sugerencias.extend(_sugerencias_bundle(m, estado))
+
+    return sugerencias
+
+def _sugerencias_bundle(m: dict, estado: np.ndarray) -> List[dict]:
+    reglas = canasta.reglas(min_lift=1.0, limite=None)
+    if not reglas:
+        return []
+
+    posicion = {
+        f"{'var' if es_var else 'rev'}-{id_}": i
+        for i, (id_, es_var) in enumerate(zip(m["ids"].tolist(), m["es_variante"].tolist()))
+    }
+    def con_exceso(r):
+        i = posicion.get(r["consecuente"])
+        return i is not None and estado[i] == "Exceso"
+    reglas = sorted((r for r in reglas if r["antecedente"] in posicion and r["consecuente"] in posicion),
+                    key=lambda r: not con_exceso(r))
+
+    sugerencias = []
+    for r in reglas[:MAX_SUGERENCIAS_POR_ACCION]:
+        a = m["nombres"][posicion[r["antecedente"]]]
+        b = m["nombres"][posicion[r["consecuente"]]]
+        sugerencias.append({
+            "titulo": f"Paquete {a} + {b}",
+            "descripcion": f"El {r['confianza']:.0%} de quienes compran {a} también llevan {b} (lift {r['lift']:.1f}).",
+            "accion_sugerida": "Bundle",
+            "producto_objetivo": b
+        })
+    return sugerencias
+
+def analizar_inventario(db: Session):
+    """Devuelve (analisis_productos, sugerencias) para /ia/analisis."""
+    m = calcular_metricas(db)
+    estado, rotacion = _clasificar(m)
+
+    analisis = [
+        {
+            "id": int(id_),
+            "nombre": nombre,
+            "tipo": "Variante" if es_var else "Reventa",
+            "stock_actual": int(stock),
+            "total_vendido": int(vendido),
+            "estado_stock": est,
+            "rotacion": rot
+        }
+        for id_, nombre, es_var, stock, vendido, est, rot in zip(
+            m["ids"].tolist(), m["nombres"], m["es_variante"].tolist(), m["stock"].tolist(),
+            m["vendido_total"].tolist(), estado.tolist(), rotacion.tolist()
+        )
+    ]
+    return analisis, _sugerencias(m, estado, rotacion)
+
+# --- Snapshot precalculado (lo refresca una tarea periódica, ver main.py) ---
+INTERVALO_REVISION = 60 # s entre revisiones del worker
+MAX_ANTIGUEDAD = 15 * 60 # s; pasado este tiempo se recalcula
+UMBRAL_VENTAS_NUEVAS = 25 # órdenes de venta nuevas que disparan un recálculo
+
+_CLAVE_SNAPSHOT = "ia_analisis"
+_snapshot: Optional[dict] = None
+_ventas_nuevas = 0
+
+def _generar_snapshot() -> dict:
+    global _snapshot, _ventas_nuevas
+    db = SessionLocal()
+    try:
+        ultima_venta_id = db.query(func.max(models.OrdenVenta.id)).scalar() or 0
+        analisis, sugerencias = analizar_inventario(db)
+    finally:
+        db.close()
+
+    _snapshot = {
+        "analisis_productos": analisis,
+        "sugerencias": sugerencias,
+        "generado_en": datetime.now(),
+        "ultima_venta_id": ultima_venta_id
+    }
+    _ventas_nuevas = 0
+    return _snapshot
+
+def recalcular_snapshot() -> dict:
+    """Recalcula el análisis; las llamadas concurrentes comparten el mismo cálculo."""
+    return cache.una_sola_vez(_CLAVE_SNAPSHOT, _generar_snapshot)
+
+def obtener_snapshot() -> dict:
+    """Último análisis disponible (solo se calcula aquí si aún no existe ninguno)."""
+    return _snapshot or recalcular_snapshot()
+
+def revisar_snapshot():
+    """Tarea periódica: recalcula si el snapshot es viejo o entraron suficientes ventas."""
+    global _ventas_nuevas
+    if _snapshot is None:
+        recalcular_snapshot()
+        return
+
+    db = SessionLocal()
+    try:
+        _ventas_nuevas = db.query(func.count(models.OrdenVenta.id)).filter(
+            models.OrdenVenta.id > _snapshot["ultima_venta_id"]
+        ).scalar()
+    finally:
+        db.close()
+
+    antiguedad = (datetime.now() - _snapshot["generado_en"]).total_seconds()
+    if antiguedad >= MAX_ANTIGUEDAD or _ventas_nuevas >= UMBRAL_VENTAS_NUEVAS:
+        recalcular_snapshot()
+
+def respuesta_snapshot(snapshot: dict) -> dict:
+    antiguedad = (datetime.now() - snapshot["generado_en"]).total_seconds()
+    return {
+        "analisis_productos": snapshot["analisis_productos"],
+        "sugerencias": snapshot["sugerencias"],
+        "generado_en": snapshot["generado_en"],
+        "antiguedad_segundos": round(antiguedad, 1),
+        "ventas_nuevas": _ventas_nuevas,
+        "desactualizado": antiguedad >= MAX_ANTIGUEDAD or _ventas_nuevas >= UMBRAL_VENTAS_NUEVAS
+    }
@@ -0,0 +1,141 @@
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List
+from sqlalchemy import select, insert, update, delete, func, literal, or_
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import kardex, meli
+from app.core.database import SessionLocal
+
+# Bandeja de salida hacia Mercado Libre (patrón outbox).
+# Cada cambio de stock (core/inventario.py) o de precio (edición de productos) de un
+# producto publicado (meli_id no nulo) deja una fila en la misma transacción: si la
+# transacción se revierte, la fila también. Un despachador periódico junta las filas
+# por SKU y envía solo el valor vigente (una llamada por publicación cambiada, sin
+# importar cuántas veces cambió). Las filas se toman (FOR UPDATE SKIP LOCKED + marca
+# `tomada`) y se confirma antes de llamar a la API: el envío no retiene una transacción
+# ni bloqueos, y otros procesos no envían lo mismo. Después se borran las enviadas y las
+# fallidas vuelven a la bandeja; si el proceso cae a mitad, las tomadas se liberan al
+# vencer ARRENDAMIENTO (se reenvía el valor vigente, lo que es inocuo).
+
+CAMPO_STOCK = "stock"
+CAMPO_PRECIO = "precio"
+INTERVALO_DESPACHO = 15 # s
+LOTE_DESPACHO = 500 # Filas por transacción de despacho
+MAX_INTENTOS = 10 # Después se descarta el cambio (queda en el log)
+ARRENDAMIENTO = 600 # s que una fila tomada queda reservada para quien la tomó
+
+PUBLICABLES = (models.VarianteProducto, models.ProductoReventa)
+
+logger = logging.getLogger(__name__)
+
+# --- Registro (dentro de la transacción del cambio) ---
+def _registrar(db: Session, modelo, campo: str, *condiciones):
+    db.execute(insert(models.CambioPublicacion).from_select(
+        ["sku", "campo"],
+        select(func.concat(kardex.PREFIJOS[modelo] + "-", modelo.id), literal(campo))
+        .where(modelo.meli_id.isnot(None), *condiciones)
+    ))
+
+def registrar(db: Session, modelo, ids: Iterable[int], campo: str):
+    """Encola el cambio de `campo` para los ids publicados (otras tablas se ignoran)."""
+    ids = list(ids)
+    if ids and modelo in PUBLICABLES:
+        _registrar(db, modelo, campo, modelo.id.in_(ids))
+
+def registrar_producto_fabricado(db: Session, producto_fabricado_id: int):
+    """El precio vive en el producto fabricado: encola todas sus variantes publicadas."""
+    v = models.VarianteProducto
+    _registrar(db, v, CAMPO_PRECIO, v.producto_fabricado_id == producto_fabricado_id)
+
+# --- Despacho ---
+def _valores(db: Session, skus: Iterable[str]) -> Dict[str, tuple]:
+    """Valores vigentes por SKU publicado: {sku: (meli_id, stock, precio)}."""
+    ids: Dict[str, List[int]] = {}
+    for sku in skus:
+        prefijo, id_ = sku.split("-", 1)
+        ids.setdefault(prefijo, []).append(int(id_))
+    v, pf, r = models.VarianteProducto, models.ProductoFabricado, models.ProductoReventa
+    consultas = []
+    if ids.get("var"):
+        consultas.append(("var", select(v.id, v.meli_id, v.stockActual, pf.precioVenta)
+                          .join(pf, pf.id == v.producto_fabricado_id)
+                          .where(v.id.in_(ids["var"]), v.meli_id.isnot(None))))
+    if ids.get("rev"):
+        consultas.append(("rev", select(r.id, r.meli_id, r.stockActual, r.precioVenta)
+                          .where(r.id.in_(ids["rev"]), r.meli_id.isnot(None))))
+    return {
+        f"{prefijo}-{id_}": (meli_id, stock, precio)
+        for prefijo, consulta in consultas
+        for id_, meli_id, stock, precio in db.execute(consulta)
+    }
+
+def _tomar(db: Session):
+    """Marca como tomadas hasta LOTE_DESPACHO filas libres (o con el arrendamiento vencido)."""
+    cp = models.CambioPublicacion
+    libres = (
+        select(cp.id)
+        .where(or_(cp.tomada.is_(None), cp.tomada < func.localtimestamp() - timedelta(seconds=ARRENDAMIENTO)))
+        .order_by(cp.id).limit(LOTE_DESPACHO)
+        .with_for_update(skip_locked=True)
+    )
+    return db.execute(
+        update(cp).where(cp.id.in_(libres.scalar_subquery()))
+        .values(tomada=func.localtimestamp())
+        .returning(cp.id, cp.sku, cp.campo, cp.intentos)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def despachar(db: Session) -> int:
+    """Envía un lote de la bandeja. Devuelve cuántas filas se procesaron."""
+    cp = models.CambioPublicacion
+    filas = _tomar(db)
+    if not filas:
+        db.commit()
+        return 0
+
+    # Coalescer: por SKU, los campos cambiados (el valor se lee ahora, no al encolar)
+    campos: Dict[str, set] = {}
+    for f in filas:
+        campos.setdefault(f.sku, set()).add(f.campo)
+    valores = _valores(db, campos)
+    db.commit() # Las filas quedan tomadas; las llamadas HTTP van sin transacción abierta
+
+    cambios = {}
+    sku_de = {}
+    for sku, (meli_id, stock, precio) in valores.items():
+        cambio = {}
+        if CAMPO_STOCK in campos[sku]: cambio["available_quantity"] = max(0, stock)
+        if CAMPO_PRECIO in campos[sku]: cambio["price"] = float(precio)
+        cambios[meli_id] = cambio
+        sku_de[meli_id] = sku
+
+    fallidos = set()
+    if cambios:
+        try:
+            errores = meli.ejecutar(lambda cliente: cliente.en_lote(cambios.items()))["errores"]
+        except Exception as e: # p. ej. el cliente no está disponible: todo el lote se reintenta
+            logger.exception("Error despachando la bandeja de salida")
+            errores = [{"meli_id": meli_id, "error": str(e)} for meli_id in cambios]
+        fallidos = {sku_de[e["meli_id"]] for e in errores}
+        for e in errores:
+            logger.warning("No se pudo sincronizar %s (%s): %s", sku_de[e["meli_id"]], e["meli_id"], e["error"])
+
+    # Enviados (o ya no publicados) se borran; los fallidos se liberan hasta MAX_INTENTOS
+    reintentar = [f.id for f in filas if f.sku in fallidos and f.intentos + 1 < MAX_INTENTOS]
+    borrar = [f.id for f in filas if f.sku not in fallidos or f.intentos + 1 >= MAX_INTENTOS]
+    if borrar:
+        db.execute(delete(cp).where(cp.id.in_(borrar)))
+    if reintentar:
+        db.execute(update(cp).where(cp.id.in_(reintentar)).values(intentos=cp.intentos + 1, tomada=None))
+    db.commit()
+    return len(filas)
+
+def despachar_periodico():
+    db = SessionLocal()
+    try:
+        # Lotes completos indican que hay más pendientes
+        while despachar(db) == LOTE_DESPACHO:
+            pass
+    finally:
+        db.close()
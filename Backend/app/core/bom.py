@@ -0,0 +1,246 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import cache, reabastecimiento
+from app.core.database import SessionLocal
+
+# Caché en proceso del BOM (producto fabricado -> [(materia prima, cantidad)]).
+# Se carga con una sola consulta y se invalida desde los endpoints que escriben
+# /produccion/bom (y al editar materia prima). El TTL cubre ediciones hechas
+# desde otro proceso.
+
+CLAVE_BOM = "bom"
+CLAVE_MATRIZ = "bom:matriz"
+TTL_BOM = 300 # s
+
+ESTADO_TERMINADO = "Terminado"
+
+class Componente(NamedTuple):
+    materia_prima_id: int
+    nombre: str
+    unidad: str
+    cantidad: Decimal # Por unidad producida (exacta: el consumo se trunca igual que antes)
+
+def _cargar() -> Dict[int, List[Componente]]:
+    lm = models.ListaMateriales
+    mp = models.MateriaPrima
+    db = SessionLocal()
+    try:
+        filas = db.execute(
+            select(lm.producto_fabricado_id, mp.id, mp.nombre, mp.unidadMedida, lm.cantidadRequerida)
+            .join(mp, mp.id == lm.materia_prima_id)
+            .order_by(lm.producto_fabricado_id, mp.id)
+        ).all()
+    finally:
+        db.close()
+    grafo: Dict[int, List[Componente]] = {}
+    for producto_id, materia_id, nombre, unidad, cantidad in filas:
+        grafo.setdefault(producto_id, []).append(Componente(materia_id, nombre, unidad, cantidad))
+    return grafo
+
+def grafo() -> Dict[int, List[Componente]]:
+    return cache.obtener(CLAVE_BOM, TTL_BOM, _cargar)
+
+def componentes(producto_fabricado_id: int) -> List[Componente]:
+    return grafo().get(producto_fabricado_id, [])
+
+def _construir_matriz() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    El BOM en formato coordenado: (producto, materia, cantidad por unidad), ordenado por producto.
+    En float solo para el cálculo vectorizado de capacidad; el stock se descuenta con consumo().
+    """
+    entradas = [(p, c.materia_prima_id, c.cantidad) for p, lista in grafo().items() for c in lista]
+    arr = np.array(entradas, dtype=float).reshape(-1, 3)
+    return arr[:, 0].astype(np.int64), arr[:, 1].astype(np.int64), arr[:, 2]
+
+def matriz() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return cache.obtener(CLAVE_MATRIZ, TTL_BOM, _construir_matriz)
+
+def invalidar():
+    cache.invalidar(CLAVE_BOM, CLAVE_MATRIZ)
+
+def consumo(producto_fabricado_id: int, cantidad: int) -> Dict[int, int]:
+    """Materia prima que consume una orden (mismo redondeo por orden que al terminarla)."""
+    return {c.materia_prima_id: int(c.cantidad * cantidad) for c in componentes(producto_fabricado_id)}
+
+def explotar(ordenes: Iterable[Tuple[int, int, int]]) -> Dict[int, int]:
+    """Suma el consumo de (producto_fabricado_id, cantidad por orden, número de órdenes)."""
+    total: Dict[int, int] = {}
+    for producto_id, cantidad, repeticiones in ordenes:
+        for materia_id, requerido in consumo(producto_id, cantidad).items():
+            total[materia_id] = total.get(materia_id, 0) + requerido * repeticiones
+    return total
+
+# --- MRP ---
+def mrp(db: Session) -> dict:
+    """Requerimiento de materia prima de todas las órdenes abiertas vs. stock y compras en camino."""
+    op = models.OrdenProduccion
+    v = models.VarianteProducto
+    mp = models.MateriaPrima
+
+    # Órdenes abiertas agrupadas por (producto, cantidad): el redondeo es por orden
+    abiertas = db.execute(
+        select(v.producto_fabricado_id, op.cantidadProducida, func.count(op.id))
+        .join(v, v.id == op.variante_producto_id)
+        .where(op.estado != ESTADO_TERMINADO)
+        .group_by(v.producto_fabricado_id, op.cantidadProducida)
+    ).all()
+    requerido = explotar(abiertas)
+
+    items = []
+    if requerido:
+        pendientes = reabastecimiento.en_camino(db)
+        materias = db.execute(
+            select(mp.id, mp.nombre, mp.unidadMedida, mp.stockActual, mp.proveedor_id)
+            .where(mp.id.in_(requerido)).order_by(mp.id)
+        ).all()
+        for m in materias:
+            camino = pendientes.get((reabastecimiento.TIPO_MATERIA, m.id), 0)
+            items.append({
+                "materia_prima_id": m.id,
+                "nombre": m.nombre,
+                "unidad": m.unidadMedida,
+                "proveedor_id": m.proveedor_id,
+                "requerido": requerido[m.id],
+                "stock_actual": m.stockActual,
+                "en_camino": camino,
+                "faltante": max(0, requerido[m.id] - m.stockActual),
+                "faltante_con_compras": max(0, requerido[m.id] - m.stockActual - camino),
+            })
+        items.sort(key=lambda i: (-i["faltante"], i["nombre"]))
+
+    return {
+        "ordenes_abiertas": sum(n for _, _, n in abiertas),
+        "items": items,
+    }
+
+# --- Capacidad: máximo producible por variante ---
+def capacidad(db: Session, adicional: Optional[Dict[int, int]] = None) -> List[dict]:
+    """
+    Unidades que aún se pueden fabricar de cada variante con el stock de materia prima
+    (+ `adicional`, p. ej. compras hipotéticas) y la materia que limita.
+    Mínimo de floor(stock / cantidad) sobre las entradas del BOM de cada producto,
+    calculado en bloque sobre todo el catálogo. Sin BOM no hay límite (None).
+    """
+    mp = models.MateriaPrima
+    v = models.VarianteProducto
+    pf = models.ProductoFabricado
+
+    materias = db.execute(select(mp.id, mp.nombre, mp.stockActual).order_by(mp.id)).all()
+    ids_materia = np.array([m.id for m in materias], dtype=np.int64)
+    stock = np.array([m.stockActual for m in materias], dtype=float)
+    nombres = {m.id: m.nombre for m in materias}
+    if adicional:
+        desconocidas = set(adicional) - set(nombres)
+        if desconocidas:
+            raise HTTPException(404, f"Materia prima no encontrada (id {', '.join(map(str, sorted(desconocidas)))})")
+        extra = np.array(sorted(adicional.items()), dtype=np.int64)
+        np.add.at(stock, np.searchsorted(ids_materia, extra[:, 0]), extra[:, 1])
+
+    # Razón stock / requerido de cada entrada del BOM (cantidad 0 no limita)
+    productos, componentes, cantidades = matriz()
+    disponible = stock[np.searchsorted(ids_materia, componentes)] if componentes.size else np.zeros(0)
+    with np.errstate(divide="ignore"):
+        razon = np.where(cantidades > 0, np.floor(np.maximum(disponible, 0) / cantidades + 1e-9), np.inf)
+
+    # Mínimo por producto: ordenar por (producto, razón) y tomar la primera entrada de cada producto
+    orden = np.lexsort((razon, productos))
+    primeros = orden[np.r_[True, productos[orden][1:] != productos[orden][:-1]]] if orden.size else orden
+    ids_producto = productos[primeros]
+    maximo = razon[primeros]
+    limitante = componentes[primeros]
+
+    variantes = db.execute(
+        select(v.id, v.talla, v.color, v.stockActual, v.producto_fabricado_id, pf.nombre)
+        .join(pf, pf.id == v.producto_fabricado_id)
+        .order_by(v.id)
+    ).all()
+    ids_var_producto = np.array([f.producto_fabricado_id for f in variantes], dtype=np.int64)
+    pos = np.searchsorted(ids_producto, ids_var_producto)
+    pos = np.minimum(pos, max(ids_producto.size - 1, 0))
+    con_bom = (ids_producto[pos] == ids_var_producto) if ids_producto.size else np.zeros(len(variantes), dtype=bool)
+
+    # Por variante; None donde el producto no tiene BOM (o solo cantidades 0)
+    limitada = con_bom & np.isfinite(maximo[pos]) if ids_producto.size else con_bom
+    maximos = np.where(limitada, maximo[pos], -1).astype(np.int64).tolist() if ids_producto.size else []
+    limitantes = np.where(limitada, limitante[pos], 0).tolist() if ids_producto.size else []
+
+    return [{
+        "variante_producto_id": f.id,
+        "producto_fabricado_id": f.producto_fabricado_id,
+        "producto": f.nombre,
+        "talla": f.talla,
+        "color": f.color,
+        "stock_actual": f.stockActual,
+        "maximo_producible": maximos[i] if tiene else None,
+        "materia_limitante_id": limitantes[i] if tiene else None,
+        "materia_limitante": nombres[limitantes[i]] if tiene else None,
+    } for i, (f, tiene) in enumerate(zip(variantes, limitada.tolist()))]
+
+# --- Asignación de materia prima entre órdenes abiertas ---
+def asignar(db: Session, criterios: Optional[Dict[int, Tuple[int, Optional[date]]]] = None) -> dict:
+    """
+    Reparte el stock de materia prima entre las órdenes abiertas (greedy).
+    Orden de atención: prioridad (mayor primero), fecha de entrega (más próxima primero,
+    sin fecha al final), antigüedad. Cada orden se asigna completa o no se asigna; las
+    bloqueadas no frenan a las siguientes si a estas sí les alcanza. La verificación y el
+    descuento son los mismos que al terminar la orden, así que el resultado equivale a
+    terminarlas una a una en ese orden. `criterios` es {orden_id: (prioridad, fecha_entrega)}.
+    """
+    op = models.OrdenProduccion
+    v = models.VarianteProducto
+    mp = models.MateriaPrima
+    criterios = criterios or {}
+
+    abiertas = db.execute(
+        select(op.id, op.variante_producto_id, op.cantidadProducida, op.fechaCreacion, v.producto_fabricado_id)
+        .join(v, v.id == op.variante_producto_id)
+        .where(op.estado != ESTADO_TERMINADO)
+    ).all()
+
+    def clave(orden):
+        prioridad, entrega = criterios.get(orden.id, (0, None))
+        return (-prioridad, entrega is None, entrega or date.max, orden.fechaCreacion, orden.id)
+    abiertas.sort(key=clave)
+
+    usadas = {c.materia_prima_id for o in abiertas for c in componentes(o.producto_fabricado_id)}
+    materias = db.execute(
+        select(mp.id, mp.nombre, mp.stockActual).where(mp.id.in_(usadas)).order_by(mp.id)
+    ).all() if usadas else []
+    disponible = {m.id: m.stockActual for m in materias}
+
+    ordenes = []
+    for o in abiertas:
+        lista = componentes(o.producto_fabricado_id)
+        faltantes = [c.nombre for c in lista if c.cantidad * o.cantidadProducida > disponible[c.materia_prima_id]]
+        if not faltantes:
+            for materia_id, cantidad in consumo(o.producto_fabricado_id, o.cantidadProducida).items():
+                disponible[materia_id] -= cantidad
+        prioridad, entrega = criterios.get(o.id, (0, None))
+        ordenes.append({
+            "orden_id": o.id,
+            "variante_producto_id": o.variante_producto_id,
+            "cantidad": o.cantidadProducida,
+            "prioridad": prioridad,
+            "fecha_entrega": entrega,
+            "completable": not faltantes,
+            "materias_faltantes": faltantes,
+        })
+
+    return {
+        "completables": sum(o["completable"] for o in ordenes),
+        "bloqueadas": sum(not o["completable"] for o in ordenes),
+        "ordenes": ordenes,
+        "materias": [{
+            "materia_prima_id": m.id,
+            "nombre": m.nombre,
+            "stock_actual": m.stockActual,
+            "asignado": m.stockActual - disponible[m.id],
+            "restante": disponible[m.id],
+        } for m in materias],
+    }
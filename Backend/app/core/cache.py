@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+# Caché en proceso con TTL corto para lecturas muy frecuentes (ej. dashboard).
+# Los routers que modifican datos llaman a invalidar() después de su commit.
+_lock = threading.Lock()
+_entradas: Dict[str, Tuple[float, Any]] = {}
+_generaciones: Dict[str, int] = {}
+_en_vuelo: Dict[str, Future] = {}
+
+CLAVE_DASHBOARD = "dashboard"
+
+def obtener(clave: str, ttl: float, calcular: Callable[[], Any]) -> Any:
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _entradas.get(clave)
+        if entrada and entrada[0] > ahora:
+            return entrada[1]
+        generacion = _generaciones.get(clave, 0)
+
+    valor = una_sola_vez(clave, calcular)
+
+    with _lock:
+        # Si alguien invalidó mientras calculábamos, no guardamos un valor viejo
+        if _generaciones.get(clave, 0) == generacion:
+            _entradas[clave] = (ahora + ttl, valor)
+    return valor
+
+def invalidar(*claves: str):
+    with _lock:
+        for clave in claves:
+            _entradas.pop(clave, None)
+            _generaciones[clave] = _generaciones.get(clave, 0) + 1
+
+def una_sola_vez(clave: str, calcular: Callable[[], Any]) -> Any:
+    """
+    Single-flight: si ya hay un cálculo en curso para `clave`, espera su
+    resultado en lugar de lanzar otro. El primero en llegar es quien calcula.
+    """
+    with _lock:
+        futuro = _en_vuelo.get(clave)
+        propio = futuro is None
+        if propio:
+            futuro = _en_vuelo[clave] = Future()
+
+    if not propio:
+        return futuro.result()
+
+    try:
+        valor = calcular()
+        futuro.set_result(valor)
+        return valor
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _en_vuelo.pop(clave, None)
@@ -0,0 +1,152 @@
+import threading
+from datetime import datetime
+from typing import List, Optional
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app.core import cache, masivo
+from app.core.database import SessionLocal
+from app.models import models
+
+# Análisis de canasta (reglas de asociación) sobre las líneas de venta.
+# Se mantiene la matriz de co-ocurrencia SKU x SKU (X^T X, con X la matriz
+# dispersa orden x SKU). Las órdenes nuevas se suman de forma incremental;
+# una reconstrucción completa periódica recoge devoluciones y borrados.
+
+INTERVALO_ACTUALIZACION = 5 * 60 # s
+INTERVALO_RECONSTRUCCION = 24 * 60 * 60 # s
+MIN_ORDENES_PAR = 3 # Soporte absoluto mínimo para considerar un par
+
+_CLAVE_REFRESCO = "canasta"
+_lock = threading.Lock()
+_estado = {
+    "claves": np.empty(0, dtype=np.int64), # SKU: variante -> id*2, reventa -> id*2+1
+    "pares": sparse.csr_matrix((0, 0), dtype=np.int64),
+    "ordenes": 0,
+    "ultima_orden_id": 0,
+    "reconstruido_en": None,
+    "generado_en": None,
+}
+
+def sku(clave: int) -> str:
+    return f"var-{clave // 2}" if clave % 2 == 0 else f"rev-{clave // 2}"
+
+def _lineas(db: Session, desde_id: int) -> np.ndarray:
+    """[orden_id, clave SKU] distintas de órdenes válidas con id > desde_id."""
+    d = models.DetalleOrdenVenta
+    ov = models.OrdenVenta
+    clave = func.coalesce(d.variante_producto_id * 2, d.producto_reventa_id * 2 + 1)
+    return masivo.matriz(db, select(d.orden_venta_id, clave).distinct()
+        .join(ov, ov.id == d.orden_venta_id)
+        .where(ov.id > desde_id, ov.estado != "Devolución", clave.isnot(None)))
+
+def _coocurrencia(lineas: np.ndarray, claves: np.ndarray):
+    """X^T X para las líneas dadas, con columnas según `claves` (ordenadas)."""
+    ordenes, fila = np.unique(lineas[:, 0], return_inverse=True)
+    columna = np.searchsorted(claves, lineas[:, 1])
+    x = sparse.csr_matrix((np.ones(fila.size, dtype=np.int64), (fila, columna)),
+                          shape=(ordenes.size, claves.size))
+    return (x.T @ x).tocsr(), ordenes.size
+
+def _reindexar(pares, claves_viejas: np.ndarray, claves_nuevas: np.ndarray):
+    """Lleva la matriz de co-ocurrencia al nuevo conjunto (mayor) de SKUs."""
+    coo = pares.tocoo()
+    mapa = np.searchsorted(claves_nuevas, claves_viejas)
+    return sparse.csr_matrix((coo.data, (mapa[coo.row], mapa[coo.col])),
+                             shape=(claves_nuevas.size, claves_nuevas.size))
+
+def _actualizar(completa: bool):
+    db = SessionLocal()
+    try:
+        with _lock:
+            desde = 0 if completa else _estado["ultima_orden_id"]
+        ultima = db.query(func.max(models.OrdenVenta.id)).scalar() or 0
+        lineas = _lineas(db, desde)
+        lineas = lineas[lineas[:, 0] <= ultima]
+    finally:
+        db.close()
+
+    with _lock:
+        claves_viejas = np.empty(0, dtype=np.int64) if completa else _estado["claves"]
+        claves = np.union1d(claves_viejas, lineas[:, 1]) if lineas.size else claves_viejas
+        nuevos, ordenes = _coocurrencia(lineas, claves) if lineas.size else (None, 0)
+
+        if completa:
+            pares = nuevos if nuevos is not None else sparse.csr_matrix((claves.size, claves.size), dtype=np.int64)
+            _estado.update(ordenes=ordenes, reconstruido_en=datetime.now())
+        else:
+            pares = _reindexar(_estado["pares"], claves_viejas, claves)
+            if nuevos is not None:
+                pares = pares + nuevos
+            _estado["ordenes"] += ordenes
+
+        _estado.update(claves=claves, pares=pares, ultima_orden_id=max(ultima, desde), generado_en=datetime.now())
+
+def actualizar():
+    """Suma las órdenes nuevas (o reconstruye si toca). Tarea periódica."""
+    reconstruido = _estado["reconstruido_en"]
+    completa = reconstruido is None or (datetime.now() - reconstruido).total_seconds() >= INTERVALO_RECONSTRUCCION
+    cache.una_sola_vez(_CLAVE_REFRESCO, lambda: _actualizar(completa))
+
+def reglas(min_soporte: float = 0.0, min_confianza: float = 0.1, min_lift: float = 1.0, limite: Optional[int] = 20) -> List[dict]:
+    """Reglas A -> B ordenadas por lift y confianza."""
+    if _estado["generado_en"] is None:
+        actualizar()
+
+    with _lock:
+        claves, pares, total = _estado["claves"], _estado["pares"], _estado["ordenes"]
+    if not total or not claves.size:
+        return []
+
+    soporte_sku = pares.diagonal().astype(np.float64)
+    arriba = sparse.triu(pares, k=1).tocoo()
+    minimo = max(MIN_ORDENES_PAR, int(np.ceil(min_soporte * total)))
+    validos = arriba.data >= minimo
+    a, b, conjunto = arriba.row[validos], arriba.col[validos], arriba.data[validos].astype(np.float64)
+
+    # Cada par genera las dos direcciones A -> B y B -> A
+    antecedente = np.concatenate([a, b])
+    consecuente = np.concatenate([b, a])
+    conjunto = np.concatenate([conjunto, conjunto])
+    confianza = conjunto / soporte_sku[antecedente]
+    lift = confianza / (soporte_sku[consecuente] / total)
+
+    filtro = (confianza >= min_confianza) & (lift >= min_lift)
+    orden = np.lexsort((-confianza[filtro], -lift[filtro]))
+    if limite:
+        orden = orden[:limite]
+
+    antecedente, consecuente = antecedente[filtro][orden], consecuente[filtro][orden]
+    conjunto, confianza, lift = conjunto[filtro][orden], confianza[filtro][orden], lift[filtro][orden]
+    return [
+        {
+            "antecedente": sku(int(claves[antecedente[i]])),
+            "consecuente": sku(int(claves[consecuente[i]])),
+            "ordenes": int(conjunto[i]),
+            "soporte": round(float(conjunto[i] / total), 4),
+            "confianza": round(float(confianza[i]), 4),
+            "lift": round(float(lift[i]), 3)
+        }
+        for i in range(len(orden))
+    ]
+
+def resumen() -> dict:
+    return {"generado_en": _estado["generado_en"], "ordenes_analizadas": _estado["ordenes"]}
+
+def nombres_sku(db: Session, skus) -> dict:
+    """Nombre legible para cada 'var-N' / 'rev-N' (dos consultas)."""
+    var_ids = {int(s[4:]) for s in skus if s.startswith("var-")}
+    rev_ids = {int(s[4:]) for s in skus if s.startswith("rev-")}
+    nombres = {}
+    if var_ids:
+        v = models.VarianteProducto
+        pf = models.ProductoFabricado
+        for id_, nombre in db.execute(select(v.id, func.concat(pf.nombre, " - ", v.talla, " ", v.color))
+                                      .join(pf, pf.id == v.producto_fabricado_id).where(v.id.in_(var_ids))):
+            nombres[f"var-{id_}"] = nombre
+    if rev_ids:
+        r = models.ProductoReventa
+        for id_, nombre in db.execute(select(r.id, r.nombre).where(r.id.in_(rev_ids))):
+            nombres[f"rev-{id_}"] = nombre
+    return nombres
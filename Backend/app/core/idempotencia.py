@@ -0,0 +1,143 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import select, delete, update, func, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import cache
+from app.core.database import SessionLocal
+
+# Claves de idempotencia (header Idempotency-Key) para los POST que crean órdenes.
+# La clave se inserta en la misma transacción que la orden y su respuesta se guarda antes
+# del único COMMIT: o quedan confirmadas las dos o ninguna (una caída a mitad no deja
+# claves pendientes ni permite crear la orden dos veces). Los reintentos reciben la
+# respuesta guardada tal cual (header Idempotent-Replayed: true).
+#  - Duplicados concurrentes en el mismo proceso esperan vía cache.una_sola_vez.
+#  - Duplicados en otros procesos esperan en el índice único de la clave hasta que la
+#    primera transacción confirme (y reciben su respuesta) o se deshaga (y la ejecutan).
+
+HEADER_REPETIDA = "Idempotent-Replayed"
+VIGENCIA = 24 * 3600 # Segundos que se conserva una respuesta
+ESPERA_MAXIMA = 30 # Segundos esperando a una solicitud en curso con la misma clave
+MAX_CACHE = 5000
+LOCK_NO_DISPONIBLE = "55P03" # SQLSTATE lock_not_available (lock_timeout)
+INTERVALO_PURGA = 3600
+
+_lock = threading.Lock()
+_recientes: "OrderedDict[str, tuple]" = OrderedDict() # clave -> (expira, huella, cuerpo)
+
+# --- Caché en memoria (evita la consulta en reintentos recientes) ---
+def _de_cache(clave: str):
+    with _lock:
+        entrada = _recientes.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] < time.monotonic():
+            del _recientes[clave]
+            return None
+        _recientes.move_to_end(clave)
+        return entrada[1], entrada[2]
+
+def _a_cache(clave: str, huella: str, cuerpo: Any):
+    with _lock:
+        _recientes[clave] = (time.monotonic() + VIGENCIA, huella, cuerpo)
+        _recientes.move_to_end(clave)
+        while len(_recientes) > MAX_CACHE:
+            _recientes.popitem(last=False)
+
+# --- Tabla ---
+def _reservar(db: Session, clave: str, huella: str):
+    """
+    Inserta la clave en la transacción de `db`. Devuelve None si es nuestra, o la fila
+    (huella, respuesta) confirmada por otra solicitud.
+    """
+    t = models.ClaveIdempotencia
+    # Una transacción en curso con la misma clave bloquea el INSERT; se espera como máximo
+    # ESPERA_MAXIMA (solo para esta sentencia, luego se restaura el lock_timeout previo)
+    previo = db.execute(select(
+        func.current_setting("lock_timeout"),
+        func.set_config("lock_timeout", f"{ESPERA_MAXIMA}s", True),
+    )).scalar()
+    try:
+        reservada = db.execute(
+            insert(t).values(clave=clave, huella=huella)
+            .on_conflict_do_nothing(index_elements=[t.clave])
+            .returning(t.id)
+        ).first()
+    except OperationalError as e:
+        if getattr(e.orig, "pgcode", None) != LOCK_NO_DISPONIBLE:
+            raise
+        db.rollback()
+        raise HTTPException(409, "Hay una solicitud en curso con la misma Idempotency-Key")
+    db.execute(select(func.set_config("lock_timeout", previo, True)))
+    if reservada:
+        return None
+    fila = db.execute(select(t.huella, t.respuesta).where(t.clave == clave)).first()
+    db.rollback()
+    return fila
+
+def purgar():
+    """Borra las respuestas vencidas (tarea periódica)."""
+    t = models.ClaveIdempotencia
+    with SessionLocal() as db:
+        db.execute(delete(t).where(or_(
+            t.creada < func.now() - timedelta(seconds=VIGENCIA),
+            t.respuesta.is_(None) # Claves de versiones anteriores que quedaron pendientes
+        )))
+        db.commit()
+
+# --- Punto de entrada para los routers ---
+def ejecutar(response: Response, db: Session, clave: Optional[str], ruta: str,
+             solicitud: BaseModel, esquema, calcular: Callable[[], Any]) -> Any:
+    """
+    Ejecuta `calcular` una sola vez por (ruta, clave) y devuelve su resultado serializado
+    con `esquema`. `calcular` trabaja en la sesión `db` sin confirmar: el COMMIT lo hace
+    esta función, junto con la respuesta guardada. Sin clave se comporta como una llamada normal.
+    """
+    if not clave:
+        cuerpo = esquema.model_validate(calcular()).model_dump(mode="json")
+        db.commit()
+        return cuerpo
+
+    clave = f"{ruta}:{clave}"
+    huella = hashlib.sha256(solicitud.model_dump_json().encode()).hexdigest()
+
+    previa = _de_cache(clave)
+    if previa is None:
+        ejecutada = []
+
+        def primera():
+            t = models.ClaveIdempotencia
+            try:
+                guardada = _reservar(db, clave, huella)
+                if guardada is None:
+                    cuerpo = esquema.model_validate(calcular()).model_dump(mode="json")
+                    db.execute(update(t).where(t.clave == clave).values(respuesta=json.dumps(cuerpo)))
+                    db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+            if guardada is None:
+                ejecutada.append(True)
+                return huella, cuerpo
+            if guardada.respuesta is None:
+                raise HTTPException(409, "Hay una solicitud en curso con la misma Idempotency-Key")
+            return guardada.huella, json.loads(guardada.respuesta)
+
+        previa = cache.una_sola_vez("idempotencia:" + clave, primera)
+        _a_cache(clave, *previa)
+        if ejecutada:
+            return previa[1]
+
+    if previa[0] != huella:
+        raise HTTPException(422, "La Idempotency-Key ya se usó con una solicitud distinta")
+    response.headers[HEADER_REPETIDA] = "true"
+    return previa[1]
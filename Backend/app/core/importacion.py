@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+import pandas as pd
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import masivo, inventario, rollup_ventas
+
+# Importación masiva de ventas (histórico o marketplaces).
+# Cada línea del archivo es un detalle; las líneas con el mismo `orden` forman una orden:
+#   orden, fecha, canal, estado, sku, cantidad, precio
+#  - sku: 'var-N', 'rev-N' o el meli_id de la publicación.
+#  - canal: id o nombre del canal de venta.
+#  - fecha, estado y precio son opcionales (ahora, 'Pagada' y precio de lista).
+#  - canal, fecha y estado son de la orden: deben coincidir en todas sus líneas.
+# Una orden con cualquier línea inválida se descarta completa y se reporta;
+# el resto se inserta con COPY usando ids reservados de la secuencia.
+
+COLUMNAS = ["orden", "fecha", "canal", "estado", "sku", "cantidad", "precio"]
+ESTADO_DEFECTO = "Pagada"
+ESTADO_DEVOLUCION = "Devolución"
+MAX_ERRORES = 1000
+LOTE_ROLLUP = 10000
+
+# --- Lectura ---
+def leer(archivo, formato: str) -> Iterator[Tuple[int, dict]]:
+    """Itera (número de línea, registro) sin cargar el archivo completo en memoria."""
+    # Los bytes que no son UTF-8 se reemplazan (U+FFFD) y _linea rechaza esa fila sola
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", errors="replace", newline="")
+    if formato == "ndjson":
+        for n, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                registro = None
+            yield n, registro if isinstance(registro, dict) else None
+    else:
+        lector = csv.DictReader(texto)
+        for registro in lector:
+            yield lector.line_num, registro
+
+# --- Catálogos en memoria ---
+def _catalogo_skus(db: Session) -> dict:
+    """{clave: (variante_id, reventa_id, precio de lista)} con claves 'var-N', 'rev-N' y meli_id."""
+    v = models.VarianteProducto
+    pf = models.ProductoFabricado
+    r = models.ProductoReventa
+    catalogo = {}
+    for id_, meli_id, precio in db.execute(select(v.id, v.meli_id, pf.precioVenta).join(pf, pf.id == v.producto_fabricado_id)):
+        catalogo[f"var-{id_}"] = (id_, None, precio)
+        if meli_id: catalogo[meli_id] = (id_, None, precio)
+    for id_, meli_id, precio in db.execute(select(r.id, r.meli_id, r.precioVenta)):
+        catalogo[f"rev-{id_}"] = (None, id_, precio)
+        if meli_id: catalogo[meli_id] = (None, id_, precio)
+    return catalogo
+
+def _catalogo_canales(db: Session) -> dict:
+    canales = {}
+    for id_, nombre in db.execute(select(models.CanalVenta.id, models.CanalVenta.nombre)):
+        canales[str(id_)] = id_
+        canales[nombre.strip().lower()] = id_
+    return canales
+
+# --- Validación ---
+def _texto(registro: dict, campo: str) -> str:
+    valor = registro.get(campo)
+    return "" if valor is None else str(valor).strip()
+
+def _linea(registro: dict, skus: dict, canales: dict):
+    """Valida un registro y devuelve (canal, fecha, estado, variante, reventa, cantidad, precio)."""
+    if any("\ufffd" in str(valor) for valor in registro.values() if valor is not None):
+        raise ValueError("Codificación inválida (se esperaba UTF-8)")
+    canal = canales.get(_texto(registro, "canal").lower())
+    if canal is None:
+        raise ValueError(f"Canal desconocido: '{_texto(registro, 'canal')}'")
+
+    sku = skus.get(_texto(registro, "sku"))
+    if sku is None:
+        raise ValueError(f"SKU desconocido: '{_texto(registro, 'sku')}'")
+
+    try:
+        cantidad = int(_texto(registro, "cantidad"))
+    except ValueError:
+        raise ValueError("Cantidad inválida")
+    if cantidad <= 0:
+        raise ValueError("La cantidad debe ser mayor a 0")
+
+    precio = sku[2]
+    if _texto(registro, "precio"):
+        try:
+            precio = float(_texto(registro, "precio"))
+        except ValueError:
+            raise ValueError("Precio inválido")
+        if precio < 0:
+            raise ValueError("El precio no puede ser negativo")
+
+    fecha = None
+    if _texto(registro, "fecha"):
+        try:
+            fecha = datetime.fromisoformat(_texto(registro, "fecha"))
+        except ValueError:
+            raise ValueError("Fecha inválida (ISO 8601)")
+        if fecha.tzinfo is not None:
+            # Con offset (ej. date_created de MeLi, -04:00): se pasa a la hora local del servidor
+            fecha = fecha.astimezone().replace(tzinfo=None)
+
+    estado = _texto(registro, "estado") or ESTADO_DEFECTO
+    if len(estado) > 50:
+        raise ValueError("Estado demasiado largo")
+
+    return canal, fecha, estado, sku[0], sku[1], cantidad, precio
+
+# --- Importación ---
+def _reservar_ids(db: Session, tabla: str, cantidad: int) -> list:
+    """Reserva `cantidad` ids de la secuencia serial de la tabla en una sola consulta."""
+    return list(db.execute(
+        text(f"SELECT nextval(pg_get_serial_sequence('{tabla}', 'id')) FROM generate_series(1, :n)"),
+        {"n": cantidad}
+    ).scalars())
+
+def importar(db: Session, registros: Iterable[Tuple[int, Optional[dict]]],
+             usuario_id: Optional[int] = None, descontar_stock: bool = True) -> dict:
+    """
+    Valida e inserta las órdenes dentro de la transacción actual (el llamador hace commit).
+    Devuelve el resumen con los errores por línea.
+    """
+    skus = _catalogo_skus(db)
+    canales = _catalogo_canales(db)
+    errores = []
+    total_errores = 0
+
+    def error(linea, orden, mensaje):
+        nonlocal total_errores
+        total_errores += 1
+        if len(errores) < MAX_ERRORES:
+            errores.append({"linea": linea, "orden": orden, "error": mensaje})
+
+    # 1. Validar y agrupar por orden (en el orden del archivo)
+    ordenes = {}
+    invalidas = set()
+    lineas_leidas = 0
+    for n, registro in registros:
+        lineas_leidas += 1
+        if registro is None:
+            error(n, None, "Línea mal formada")
+            continue
+        clave = _texto(registro, "orden") or f"#{n}"
+        try:
+            canal, fecha, estado, variante, reventa, cantidad, precio = _linea(registro, skus, canales)
+        except ValueError as e:
+            error(n, clave, str(e))
+            invalidas.add(clave)
+            continue
+        orden = ordenes.setdefault(clave, {"linea": n, "canal": canal, "fecha": fecha, "estado": estado, "detalles": []})
+        distintos = [campo for campo, valor in (("canal", canal), ("fecha", fecha), ("estado", estado)) if orden[campo] != valor]
+        if distintos:
+            error(n, clave, f"{', '.join(distintos).capitalize()} distinto{'s' if len(distintos) > 1 else ''} de la línea {orden['linea']} de la misma orden")
+            invalidas.add(clave)
+            continue
+        orden["detalles"].append((variante, reventa, cantidad, precio))
+
+    for clave in invalidas:
+        ordenes.pop(clave, None)
+
+    # 2. Validar stock contra las filas bloqueadas, orden por orden
+    if descontar_stock:
+        stock = {
+            modelo: {i: f.stockActual for i, f in inventario.bloquear_stock(db, modelo, ids).items()}
+            for modelo, ids in (
+                (models.VarianteProducto, {d[0] for o in ordenes.values() for d in o["detalles"] if d[0]}),
+                (models.ProductoReventa, {d[1] for o in ordenes.values() for d in o["detalles"] if d[1]}),
+            )
+        }
+        for clave in list(ordenes):
+            orden = ordenes[clave]
+            if orden["estado"] == ESTADO_DEVOLUCION:
+                continue
+            requerido = {}
+            for variante, reventa, cantidad, _ in orden["detalles"]:
+                llave = (models.VarianteProducto, variante) if variante else (models.ProductoReventa, reventa)
+                requerido[llave] = requerido.get(llave, 0) + cantidad
+            faltantes = [
+                f"{'var' if modelo is models.VarianteProducto else 'rev'}-{id_}"
+                for (modelo, id_), cantidad in requerido.items() if stock[modelo].get(id_, 0) < cantidad
+            ]
+            if faltantes:
+                error(orden["linea"], clave, f"Stock insuficiente: {', '.join(faltantes)}")
+                del ordenes[clave]
+                continue
+            for (modelo, id_), cantidad in requerido.items():
+                stock[modelo][id_] -= cantidad
+
+    if not ordenes:
+        return {"lineas_leidas": lineas_leidas, "ordenes_importadas": 0, "detalles_importados": 0,
+                "total_errores": total_errores, "errores": errores, "ids": {}}
+
+    # 3. Insertar con COPY usando ids reservados
+    ahora = db.execute(select(func.localtimestamp())).scalar()
+    ids = _reservar_ids(db, models.OrdenVenta.__tablename__, len(ordenes))
+    filas_orden = []
+    filas_detalle = []
+    for id_, orden in zip(ids, ordenes.values()):
+        filas_orden.append((id_, orden["fecha"] or ahora, orden["estado"], orden["canal"], usuario_id))
+        for variante, reventa, cantidad, precio in orden["detalles"]:
+            filas_detalle.append((id_, cantidad, precio, variante, reventa))
+
+    masivo.copiar(db, models.OrdenVenta.__table__, pd.DataFrame(
+        filas_orden, columns=["id", "fecha", "estado", "canal_venta_id", "usuario_id"]
+    ).astype({"usuario_id": "Int64"}))
+    masivo.copiar(db, models.DetalleOrdenVenta.__table__, pd.DataFrame(
+        filas_detalle, columns=["orden_venta_id", "cantidad", "preciounitario", "variante_producto_id", "producto_reventa_id"]
+    ).astype({"variante_producto_id": "Int64", "producto_reventa_id": "Int64"}))
+
+    # 4. Un UPDATE agregado por tabla de stock; el kardex recibe un movimiento por orden y SKU (COPY)
+    if descontar_stock:
+        movimientos = {}
+        for id_, orden in zip(ids, ordenes.values()):
+            if orden["estado"] == ESTADO_DEVOLUCION:
+                continue
+            for variante, reventa, cantidad, _ in orden["detalles"]:
+                clave = (id_, f"var-{variante}" if variante else f"rev-{reventa}")
+                movimientos[clave] = movimientos.get(clave, 0) - cantidad
+
+        for modelo, prefijo in ((models.VarianteProducto, "var-"), (models.ProductoReventa, "rev-")):
+            inventario.ajustar_stock(db, modelo, inventario.acumular(
+                (int(sku[4:]), delta) for (_, sku), delta in movimientos.items() if sku.startswith(prefijo)
+            ), "Venta", movimientos=False)
+
+        masivo.copiar(db, models.MovimientoInventario.__table__, pd.DataFrame(
+            [(sku, delta, "Venta", id_) for (id_, sku), delta in movimientos.items()],
+            columns=["sku", "cantidad", "documento", "documento_id"]
+        ))
+
+    # 5. Rollup diario
+    devueltas = [i for i, o in zip(ids, ordenes.values()) if o["estado"] == ESTADO_DEVOLUCION]
+    for inicio in range(0, len(ids), LOTE_ROLLUP):
+        rollup_ventas.registrar(db, ids[inicio:inicio + LOTE_ROLLUP], ventas=1)
+    for inicio in range(0, len(devueltas), LOTE_ROLLUP):
+        rollup_ventas.registrar(db, devueltas[inicio:inicio + LOTE_ROLLUP], devoluciones=1)
+
+    return {"lineas_leidas": lineas_leidas, "ordenes_importadas": len(ids), "detalles_importados": len(filas_detalle),
+            "total_errores": total_errores, "errores": errores,
+            "ids": dict(zip(ordenes, ids))} # {orden del archivo: id de OrdenVenta}
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Instrumentación de consultas SQL por request (eventos del Engine + ContextVar).
+# Cada request acumula: número de sentencias, tiempo en BD y sentencias repetidas
+# con la misma forma (síntoma típico de N+1 por carga perezosa).
+# Se expone en el header Server-Timing y en una línea de log JSON.
+#  - INVENTIA_PRESUPUESTO_CONSULTAS: presupuesto global de sentencias por request (0 = sin límite).
+#  - INVENTIA_MODO_PRUEBA=1: exceder el presupuesto responde 500 en lugar de solo avisar.
+# Los endpoints pueden fijar su propio presupuesto con Depends(presupuesto(n)).
+
+PRESUPUESTO_GLOBAL = int(os.getenv("INVENTIA_PRESUPUESTO_CONSULTAS", "0"))
+MODO_PRUEBA = os.getenv("INVENTIA_MODO_PRUEBA", "0") == "1"
+UMBRAL_REPETIDAS = 10 # Misma forma de sentencia más veces que esto => posible N+1
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_PARAMETROS_IN = re.compile(r"\((?:%\(\w+\)s|\?)(?:, (?:%\(\w+\)s|\?))*\)")
+
+class Medicion:
+    __slots__ = ("consultas", "tiempo_db", "formas", "presupuesto")
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.formas = Counter()
+        self.presupuesto = PRESUPUESTO_GLOBAL
+
+_medicion: ContextVar[Optional[Medicion]] = ContextVar("medicion_sql", default=None)
+
+def actual() -> Optional[Medicion]:
+    return _medicion.get()
+
+# --- Eventos del Engine (todas las instancias, incluidas las de tareas y scripts) ---
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _medicion.get() is not None:
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicion.get()
+    if medicion is None:
+        return
+    inicios = conn.info.get("inicio_consulta")
+    if inicios:
+        medicion.tiempo_db += time.perf_counter() - inicios.pop()
+    medicion.consultas += 1
+    # La forma ignora el largo de las listas IN (...) expandidas
+    medicion.formas[_PARAMETROS_IN.sub("(?)", statement)] += 1
+
+# --- Presupuesto por endpoint ---
+def presupuesto(maximo: int):
+    """Dependencia: fija el presupuesto de sentencias del endpoint."""
+    def _fijar():
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.presupuesto = maximo
+    return _fijar
+
+# --- Middleware ---
+async def medir_solicitud(request: Request, call_next):
+    medicion = Medicion()
+    token = _medicion.set(medicion)
+    inicio = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _medicion.reset(token)
+    total_ms = (time.perf_counter() - inicio) * 1000
+    db_ms = medicion.tiempo_db * 1000
+
+    forma, repeticiones = medicion.formas.most_common(1)[0] if medicion.formas else ("", 0)
+    ruta = request.scope.get("route")
+    registro = {
+        "metodo": request.method,
+        "ruta": ruta.path if ruta else request.url.path,
+        "estado": response.status_code,
+        "consultas": medicion.consultas,
+        "db_ms": round(db_ms, 1),
+        "total_ms": round(total_ms, 1),
+        "max_repetidas": repeticiones,
+    }
+    excedido = 0 < medicion.presupuesto < medicion.consultas
+    if repeticiones > UMBRAL_REPETIDAS:
+        registro["posible_n_mas_1"] = " ".join(forma.split())[:300]
+    if excedido:
+        registro["presupuesto"] = medicion.presupuesto
+    logger.log(logging.WARNING if excedido or repeticiones > UMBRAL_REPETIDAS else logging.INFO,
+               json.dumps(registro, ensure_ascii=False))
+
+    if excedido and MODO_PRUEBA:
+        response = JSONResponse(status_code=500, content={
+            "detail": f"Presupuesto de consultas excedido: {medicion.consultas} > {medicion.presupuesto}",
+            "consultas": registro
+        })
+    response.headers["Server-Timing"] = (
+        f'db;dur={db_ms:.1f};desc="{medicion.consultas} consultas", app;dur={total_ms:.1f}'
+    )
+    return response
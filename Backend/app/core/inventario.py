@@ -0,0 +1,124 @@
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import select, update, values, column, Integer
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import models
+from app.core import kardex, bandeja_salida
+
+# Ajustes de stock concurrentes.
+# Las filas se bloquean con un solo SELECT ... FOR UPDATE ordenado por id
+# (orden determinista: dos transacciones nunca se esperan en ciclo) y se
+# actualizan con un solo UPDATE ... FROM (VALUES ...) por tabla.
+# Convención: un delta negativo descuenta stock, uno positivo lo reingresa.
+# Cada ajuste deja sus movimientos en el kardex con el documento de origen y,
+# para productos publicados, un cambio en la bandeja de salida (core/bandeja_salida.py).
+
+# Orden global de bloqueo entre tablas (un flujo que toca varias las ajusta en este orden)
+ORDEN_BLOQUEO = (models.VarianteProducto, models.ProductoReventa, models.MateriaPrima)
+
+def _etiqueta(modelo, fila) -> str:
+    if modelo is models.VarianteProducto:
+        return f"{fila.talla} {fila.color}"
+    return fila.nombre
+
+def _columnas_etiqueta(modelo):
+    if modelo is models.VarianteProducto:
+        return [modelo.talla, modelo.color]
+    return [modelo.nombre]
+
+def acumular(pares: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    """Suma los deltas por id (una orden puede repetir el mismo SKU en varias líneas)."""
+    deltas: Dict[int, int] = {}
+    for id_, delta in pares:
+        if id_ is not None:
+            deltas[id_] = deltas.get(id_, 0) + delta
+    return deltas
+
+def bloquear_stock(db: Session, modelo, ids: Iterable[int]) -> dict:
+    """Bloquea las filas en orden de id y devuelve {id: fila(id, stock, etiqueta...)}."""
+    ids = sorted(set(ids))
+    if not ids:
+        return {}
+    filas = db.execute(
+        select(modelo.id, modelo.stockActual, *_columnas_etiqueta(modelo))
+        .where(modelo.id.in_(ids))
+        .order_by(modelo.id)
+        .with_for_update()
+    ).all()
+    return {f.id: f for f in filas}
+
+def ajustar_stock(db: Session, modelo, deltas: Dict[int, int], documento: str,
+                  documento_id: Optional[int] = None, validar: bool = True, movimientos: bool = True) -> Dict[int, int]:
+    """
+    Aplica los deltas de stock de una tabla (VarianteProducto, ProductoReventa, MateriaPrima)
+    y los registra en el kardex (movimientos=False si el llamador los inserta por su cuenta).
+    Con validar=True rechaza (400) cualquier ajuste que deje stock negativo.
+    Devuelve {id: stock resultante}.
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return {}
+
+    filas = bloquear_stock(db, modelo, deltas)
+    faltantes = set(deltas) - set(filas)
+    if faltantes:
+        raise HTTPException(404, f"Producto no encontrado (id {', '.join(map(str, sorted(faltantes)))})")
+
+    if validar:
+        insuficientes = [
+            _etiqueta(modelo, filas[i]) for i in sorted(deltas)
+            if filas[i].stockActual + deltas[i] < 0
+        ]
+        if insuficientes:
+            raise HTTPException(400, f"Stock insuficiente: {', '.join(insuficientes)}")
+
+    tabla = modelo.__table__
+    v = values(column("id", Integer), column("delta", Integer), name="v").data(
+        sorted(deltas.items())
+    )
+    resultado = db.execute(
+        update(tabla)
+        .where(tabla.c.id == v.c.id)
+        .values(stockactual=tabla.c.stockactual + v.c.delta)
+        .returning(tabla.c.id, tabla.c.stockactual)
+    ).all()
+    nuevos = {r.id: r.stockactual for r in resultado}
+    if movimientos:
+        kardex.registrar(db, modelo, deltas, documento, documento_id)
+    # Productos publicados: el nuevo stock se envía a Mercado Libre desde la bandeja de salida
+    bandeja_salida.registrar(db, modelo, nuevos, bandeja_salida.CAMPO_STOCK)
+
+    # Sincroniza los objetos ya cargados en la sesión sin marcarlos como modificados
+    for id_, stock in nuevos.items():
+        obj = db.identity_map.get(db.identity_key(modelo, id_))
+        if obj is not None:
+            set_committed_value(obj, "stockActual", stock)
+    return nuevos
+
+def ajustar(db: Session, ajustes: Dict[object, Dict[int, int]], documento: str,
+            documento_id: Optional[int] = None, validar: bool = True):
+    """Ajusta varias tablas respetando ORDEN_BLOQUEO. `ajustes` es {modelo: {id: delta}}."""
+    for modelo in ORDEN_BLOQUEO:
+        if ajustes.get(modelo):
+            ajustar_stock(db, modelo, ajustes[modelo], documento, documento_id, validar)
+
+def ajustar_productos(db: Session, detalles, signo: int, documento: str,
+                      documento_id: Optional[int] = None, validar: bool = True):
+    """Aplica signo * cantidad de cada detalle (variante o reventa) sobre su stock."""
+    detalles = list(detalles)
+    ajustar(db, {
+        models.VarianteProducto: acumular((d.variante_producto_id, signo * d.cantidad) for d in detalles),
+        models.ProductoReventa: acumular((d.producto_reventa_id, signo * d.cantidad) for d in detalles),
+    }, documento, documento_id, validar)
+
+def fijar_stock(db: Session, modelo, id_: int, stock: int, documento: str = "Ajuste"):
+    """Ajuste manual a un valor absoluto (edición / sincronización): registra la diferencia."""
+    fila = bloquear_stock(db, modelo, [id_]).get(id_)
+    if fila is None:
+        raise HTTPException(404, "Producto no encontrado")
+    ajustar_stock(db, modelo, {id_: stock - fila.stockActual}, documento, id_, validar=False)
+
+def registrar_alta(db: Session, obj):
+    """Movimiento inicial de un producto/material recién creado (después de db.flush())."""
+    kardex.registrar(db, type(obj), {obj.id: obj.stockActual or 0}, "Alta", obj.id)
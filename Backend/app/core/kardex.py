@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import select, insert, delete, func, literal, union_all, cast, Date, text
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core.database import SessionLocal
+
+# Kardex: movimientos de inventario de solo inserción + snapshots periódicos.
+# Todo cambio de stock (ver core/inventario.py) deja un movimiento con su documento
+# de origen. Una tarea compacta los movimientos en snapshots (stock por SKU a una
+# fecha de corte), así el stock a cualquier fecha es snapshot + una cola corta de
+# movimientos, sin recorrer órdenes. stockActual sigue siendo el valor vigente.
+
+INTERVALO_SNAPSHOT = 60 * 60 # s
+MARGEN_CORTE = timedelta(minutes=5) # Colchón; el corte además nunca pasa del inicio de una transacción abierta
+RETENCION_DETALLADA = timedelta(days=30) # Después solo se conserva el último snapshot de cada día
+
+PREFIJOS = {
+    models.VarianteProducto: "var",
+    models.ProductoReventa: "rev",
+    models.MateriaPrima: "mat",
+}
+
+def sku(modelo, id_: int) -> str:
+    return f"{PREFIJOS[modelo]}-{id_}"
+
+# --- Movimientos ---
+def registrar(db: Session, modelo, deltas: Dict[int, int], documento: str, documento_id: Optional[int] = None):
+    """Inserta un movimiento por id con delta distinto de cero (un solo INSERT multi-fila)."""
+    registrar_por_documento(db, modelo, ((id_, delta, documento_id) for id_, delta in sorted(deltas.items())), documento)
+
+def registrar_por_documento(db: Session, modelo, movimientos: Iterable[Tuple[int, int, Optional[int]]], documento: str):
+    """Movimientos (id, delta, documento_id) de varios documentos en un solo INSERT multi-fila."""
+    filas = [
+        {"sku": sku(modelo, id_), "cantidad": delta, "documento": documento, "documento_id": documento_id}
+        for id_, delta, documento_id in movimientos if delta
+    ]
+    if filas:
+        db.execute(insert(models.MovimientoInventario), filas)
+
+def _stock_vigente():
+    """(sku, stock) de las tres tablas de inventario."""
+    return union_all(*[
+        select(func.concat(prefijo + "-", modelo.id).label("sku"), modelo.stockActual.label("stock"))
+        for modelo, prefijo in PREFIJOS.items()
+    ])
+
+def _movimientos(desde: Optional[datetime], hasta: Optional[datetime], signo: int = 1):
+    m = models.MovimientoInventario
+    consulta = select(m.sku, (m.cantidad * signo).label("stock"))
+    if desde is not None: consulta = consulta.where(m.fecha > desde)
+    if hasta is not None: consulta = consulta.where(m.fecha <= hasta)
+    return consulta
+
+def _snapshot(fecha: datetime):
+    s = models.SnapshotInventario
+    return select(s.sku, s.stock).where(s.fecha == fecha)
+
+def _sumar(*partes):
+    u = union_all(*partes).subquery()
+    return select(u.c.sku, func.sum(u.c.stock).label("stock")).group_by(u.c.sku)
+
+# --- Compactación ---
+# Un movimiento lleva fecha = now(), el inicio de su transacción, pero solo es visible
+# al confirmarse. Si el corte pasara del inicio de una transacción todavía abierta, sus
+# movimientos quedarían fechados antes de un snapshot ya tomado sin estar incluidos en
+# él (y _movimientos(ultimo, ...) ya no los volvería a sumar). Por eso el corte queda
+# justo antes de la transacción abierta más antigua de la base, dure lo que dure.
+CORTE = text("""
+    SELECT least(
+        localtimestamp - :margen,
+        min(xact_start AT TIME ZONE current_setting('TimeZone')) - interval '1 microsecond'
+    )
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid()
+""")
+
+def compactar(db: Session) -> Optional[datetime]:
+    """Crea un snapshot al corte (ahora - margen, o antes de la transacción abierta más antigua) si hubo movimientos desde el anterior."""
+    s = models.SnapshotInventario
+    m = models.MovimientoInventario
+    corte = db.execute(CORTE, {"margen": MARGEN_CORTE}).scalar()
+    ultimo = db.query(func.max(s.fecha)).scalar()
+
+    if ultimo is None:
+        # Primer snapshot: stock vigente menos lo movido después del corte
+        contenido = _sumar(_stock_vigente(), _movimientos(corte, None, -1))
+    else:
+        if corte <= ultimo or not db.query(
+            select(m.id).where(m.fecha > ultimo, m.fecha <= corte).exists()
+        ).scalar():
+            return None
+        contenido = _sumar(_snapshot(ultimo), _movimientos(ultimo, corte))
+
+    contenido = contenido.subquery()
+    db.execute(insert(s).from_select(
+        ["fecha", "sku", "stock"],
+        select(literal(corte), contenido.c.sku, contenido.c.stock)
+    ))
+
+    # Más allá de la retención detallada solo queda el último snapshot de cada día
+    ultimo_del_dia = select(func.max(s.fecha)).group_by(cast(s.fecha, Date))
+    db.execute(delete(s).where(s.fecha < corte - RETENCION_DETALLADA, s.fecha.notin_(ultimo_del_dia)))
+    db.commit()
+    return corte
+
+def compactar_periodico():
+    db = SessionLocal()
+    try:
+        compactar(db)
+    finally:
+        db.close()
+
+# --- Consultas históricas ---
+def stock_en(db: Session, fecha: datetime, skus: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Stock por SKU a `fecha`: snapshot más cercano +/- los movimientos intermedios."""
+    s = models.SnapshotInventario
+    anterior = db.query(func.max(s.fecha)).filter(s.fecha <= fecha).scalar()
+    if anterior is not None:
+        consulta = _sumar(_snapshot(anterior), _movimientos(anterior, fecha))
+    else:
+        # Antes del primer snapshot: se retrocede desde el siguiente (o desde el stock vigente)
+        siguiente = db.query(func.min(s.fecha)).filter(s.fecha > fecha).scalar()
+        base = _snapshot(siguiente) if siguiente is not None else _stock_vigente()
+        consulta = _sumar(base, _movimientos(fecha, siguiente, -1))
+
+    consulta = consulta.subquery()
+    final = select(consulta.c.sku, consulta.c.stock).order_by(consulta.c.sku)
+    if skus is not None:
+        final = final.where(consulta.c.sku.in_(list(skus)))
+    return {f.sku: int(f.stock) for f in db.execute(final)}
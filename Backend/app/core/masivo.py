@@ -0,0 +1,41 @@
+import io
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+# Lectura y escritura masiva con COPY para los motores de análisis e importación.
+# COPY + el parser CSV de pandas evita crear un objeto Row (o un dict de
+# parámetros) por fila, que es lo que domina el tiempo con millones de filas.
+
+def matriz(db: Session, stmt, dtype=np.int64) -> np.ndarray:
+    """Ejecuta `stmt` (select con columnas numéricas) y lo devuelve como matriz 2D."""
+    compilado = stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    columnas = len(stmt.selected_columns)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        sql = cursor.mogrify(str(compilado), compilado.params).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV", buffer)
+    finally:
+        cursor.close()
+
+    if buffer.tell() == 0:
+        return np.empty((0, columnas), dtype=dtype)
+    buffer.seek(0)
+    return pd.read_csv(buffer, header=None, dtype=dtype).to_numpy()
+
+def copiar(db: Session, tabla, datos: pd.DataFrame):
+    """Inserta un DataFrame en `tabla` con COPY FROM STDIN (NA -> NULL), dentro de la transacción actual."""
+    if datos.empty:
+        return
+    buffer = io.StringIO()
+    datos.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        columnas = ", ".join(datos.columns)
+        cursor.copy_expert(f"COPY {tabla.name} ({columnas}) FROM STDIN WITH CSV", buffer)
+    finally:
+        cursor.close()
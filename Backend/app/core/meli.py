@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import httpx
+
+# Cliente asíncrono de la API de Mercado Libre.
+# Un solo httpx.AsyncClient (pool de conexiones) vive en el event loop de la app;
+# cada llamada pasa por un semáforo (concurrencia máxima) y un token bucket
+# (solicitudes por segundo), y se reintenta con backoff exponencial ante 429,
+# errores 5xx o de red. Los POST (crean publicaciones) solo se reintentan cuando
+# consta que no se procesaron: 429 o error al conectar; un timeout o un 5xx pueden
+# llegar después de crear la publicación y reintentarlos la duplicaría. Los routers síncronos llaman a ejecutar() (bloquea solo
+# su hilo del threadpool) y los envíos masivos corren como trabajos en segundo
+# plano (lanzar()), así nunca se bloquea el event loop ni los workers.
+#  - MELI_API_URL: base de la API (apuntarla a un servidor local para pruebas).
+#  - MELI_ACCESS_TOKEN: sin token el cliente trabaja en modo simulado (no hace HTTP).
+#  - MELI_CONCURRENCIA, MELI_TASA (solicitudes/s), MELI_REINTENTOS, MELI_TIMEOUT (s).
+
+API_URL = os.getenv("MELI_API_URL", "https://api.mercadolibre.com")
+ACCESS_TOKEN = os.getenv("MELI_ACCESS_TOKEN", "")
+CONCURRENCIA = int(os.getenv("MELI_CONCURRENCIA", "16"))
+TASA = float(os.getenv("MELI_TASA", "20"))
+REINTENTOS = int(os.getenv("MELI_REINTENTOS", "4"))
+TIMEOUT = float(os.getenv("MELI_TIMEOUT", "15"))
+BACKOFF_BASE = 0.5 # s
+BACKOFF_MAXIMO = 30.0 # s
+PAGINA_BUSQUEDA = 100 # ids por página del scan de publicaciones
+MULTIGET = 20 # ids por GET /items?ids= (máximo de la API)
+MAX_TRABAJOS = 100 # Trabajos terminados que se conservan para consulta
+
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+METODOS_IDEMPOTENTES = {"GET", "PUT", "DELETE", "HEAD"}
+NO_ENVIADA = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) # La solicitud no salió
+
+logger = logging.getLogger(__name__)
+
+class ErrorMeLi(Exception):
+    def __init__(self, mensaje: str, status: Optional[int] = None):
+        super().__init__(mensaje)
+        self.status = status
+
+# --- Limitador de tasa ---
+class TokenBucket:
+    """`tasa` fichas por segundo, ráfagas de hasta `capacidad`."""
+
+    def __init__(self, tasa: float, capacidad: Optional[float] = None):
+        self.tasa = tasa
+        self.capacidad = capacidad or max(1.0, tasa)
+        self._fichas = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                await asyncio.sleep((1 - self._fichas) / self.tasa)
+
+# --- Cliente ---
+class ClienteMeLi:
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None, concurrencia: int = CONCURRENCIA,
+                 tasa: float = TASA, reintentos: int = REINTENTOS, timeout: float = TIMEOUT):
+        # URL y token se leen al crear el cliente (las pruebas los apuntan al servidor falso)
+        base_url = API_URL if base_url is None else base_url
+        token = ACCESS_TOKEN if token is None else token
+        self.simulado = not token
+        self.reintentos = reintentos
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self._bucket = TokenBucket(tasa)
+        self._http = None if self.simulado else httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia),
+        )
+
+    async def cerrar(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def solicitar(self, metodo: str, ruta: str, json: Any = None) -> Any:
+        if self.simulado:
+            return _respuesta_simulada(metodo, ruta, json)
+        idempotente = metodo in METODOS_IDEMPOTENTES
+        for intento in range(self.reintentos + 1):
+            espera = None
+            async with self._semaforo:
+                await self._bucket.adquirir()
+                try:
+                    respuesta = await self._http.request(metodo, ruta, json=json)
+                except httpx.TransportError as e:
+                    if intento == self.reintentos or not (idempotente or isinstance(e, NO_ENVIADA)):
+                        raise ErrorMeLi(f"Error de conexión con Mercado Libre: {e}") from e
+                else:
+                    if respuesta.status_code < 400:
+                        return respuesta.json() if respuesta.content else None
+                    if (respuesta.status_code not in ESTADOS_REINTENTABLES or intento == self.reintentos
+                            or not (idempotente or respuesta.status_code == 429)):
+                        raise ErrorMeLi(f"Mercado Libre respondió {respuesta.status_code}: {respuesta.text[:300]}",
+                                        respuesta.status_code)
+                    espera = _retry_after(respuesta)
+            # El backoff se espera fuera del semáforo para no retener un lugar de concurrencia
+            if espera is None:
+                espera = min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** intento) * (0.5 + random.random() / 2)
+            await asyncio.sleep(espera)
+
+    # --- Operaciones ---
+    async def obtener(self, ruta: str) -> dict:
+        return await self.solicitar("GET", ruta)
+
+    async def publicar(self, item: dict) -> dict:
+        return await self.solicitar("POST", "/items", item)
+
+    async def editar(self, meli_id: str, cambios: dict) -> dict:
+        return await self.solicitar("PUT", f"/items/{meli_id}", cambios)
+
+    async def cerrar_publicacion(self, meli_id: str) -> dict:
+        return await self.solicitar("PUT", f"/items/{meli_id}", {"status": "closed"})
+
+    async def publicaciones(self, atributos: str = "id,available_quantity,price,status") -> Dict[str, dict]:
+        """
+        Todas las publicaciones del vendedor: {meli_id: item con `atributos`}.
+        Recorre el scan por páginas y pide los detalles en multiget concurrente
+        mientras llegan las páginas siguientes.
+        """
+        usuario = (await self.solicitar("GET", "/users/me"))["id"]
+
+        async def detalles(ids):
+            respuesta = await self.solicitar("GET", f"/items?ids={','.join(ids)}&attributes={atributos}")
+            return [r["body"] for r in respuesta or [] if r.get("code") == 200]
+
+        tareas = []
+        scroll_id = None
+        try:
+            while True:
+                ruta = f"/users/{usuario}/items/search?search_type=scan&limit={PAGINA_BUSQUEDA}"
+                pagina = await self.solicitar("GET", ruta + (f"&scroll_id={scroll_id}" if scroll_id else ""))
+                ids = pagina.get("results") or []
+                tareas += [asyncio.create_task(detalles(ids[i:i + MULTIGET])) for i in range(0, len(ids), MULTIGET)]
+                scroll_id = pagina.get("scroll_id")
+                if not ids or not scroll_id:
+                    break
+            return {item["id"]: item for lote in await asyncio.gather(*tareas) for item in lote}
+        except BaseException:
+            for tarea in tareas:
+                tarea.cancel()
+            raise
+
+    async def en_lote(self, operaciones: Iterable[Tuple[str, dict]], trabajo: Optional[dict] = None) -> dict:
+        """
+        Aplica cambios a muchas publicaciones: operaciones es [(meli_id, cambios)].
+        La concurrencia y la tasa las limita el cliente; un error no detiene al resto.
+        """
+        operaciones = list(operaciones)
+        resultado = trabajo if trabajo is not None else _nuevo_resultado(len(operaciones))
+
+        async def una(meli_id: str, cambios: dict):
+            try:
+                await self.editar(meli_id, cambios)
+                resultado["exitos"] += 1
+            except Exception as e: # También respuestas ilegibles (ValueError de .json()), no solo ErrorMeLi
+                resultado["errores"].append({"meli_id": meli_id, "error": str(e) or type(e).__name__})
+            finally:
+                resultado["completados"] += 1
+
+        await asyncio.gather(*(una(meli_id, cambios) for meli_id, cambios in operaciones))
+        return resultado
+
+def _retry_after(respuesta: httpx.Response) -> Optional[float]:
+    valor = respuesta.headers.get("Retry-After")
+    try:
+        return min(BACKOFF_MAXIMO, float(valor)) if valor else None
+    except ValueError:
+        return None
+
+def _respuesta_simulada(metodo: str, ruta: str, json: Any) -> dict:
+    if metodo == "POST" and ruta == "/items":
+        return {**(json or {}), "id": f"MLM-{uuid.uuid4().hex[:8].upper()}", "status": "active"}
+    return {**(json or {}), "id": ruta.rsplit("/", 1)[-1]}
+
+# --- Ciclo de vida (event loop de la app) ---
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_cliente: Optional[ClienteMeLi] = None
+
+def iniciar():
+    """Se llama en el startup de la app: el cliente vive en su event loop."""
+    global _loop, _cliente
+    _loop = asyncio.get_running_loop()
+    _cliente = ClienteMeLi()
+
+async def detener():
+    global _loop, _cliente
+    if _cliente is not None:
+        await _cliente.cerrar()
+    _loop, _cliente = None, None
+
+def ejecutar(operacion: Callable[[ClienteMeLi], Awaitable[Any]]) -> Any:
+    """
+    Ejecuta operacion(cliente) desde código síncrono (endpoints en el threadpool).
+    Sin la app iniciada (scripts) usa un cliente temporal.
+    """
+    if _loop is None or _cliente is None:
+        async def temporal():
+            cliente = ClienteMeLi()
+            try:
+                return await operacion(cliente)
+            finally:
+                await cliente.cerrar()
+        return asyncio.run(temporal())
+    return asyncio.run_coroutine_threadsafe(operacion(_cliente), _loop).result()
+
+# --- Trabajos en segundo plano (envíos masivos, conciliación) ---
+_lock = threading.Lock()
+_trabajos: "OrderedDict[str, dict]" = OrderedDict()
+
+def _nuevo_resultado(total: int) -> dict:
+    return {"total": total, "completados": 0, "exitos": 0, "errores": []}
+
+def _registrar_trabajo(operacion: str, total: int) -> dict:
+    trabajo = {
+        "id": uuid.uuid4().hex,
+        "operacion": operacion,
+        "estado": "En curso",
+        "inicio": datetime.now(),
+        "fin": None,
+        **_nuevo_resultado(total),
+    }
+    with _lock:
+        _trabajos[trabajo["id"]] = trabajo
+        terminados = [k for k, t in _trabajos.items() if t["estado"] != "En curso"]
+        for clave in terminados[:max(0, len(terminados) - MAX_TRABAJOS)]:
+            del _trabajos[clave]
+    return trabajo
+
+def lanzar(operacion: str, cambios: Dict[str, dict]) -> dict:
+    """Programa en el event loop la edición de {meli_id: cambios} y devuelve el trabajo (sin esperar)."""
+    if _loop is None or _cliente is None:
+        raise RuntimeError("El cliente de Mercado Libre no está iniciado")
+    trabajo = _registrar_trabajo(operacion, len(cambios))
+
+    async def correr():
+        try:
+            await _cliente.en_lote(cambios.items(), trabajo)
+            trabajo["estado"] = "Terminado"
+        except Exception:
+            logger.exception("Error en el trabajo de Mercado Libre '%s'", operacion)
+            trabajo["estado"] = "Error"
+        finally:
+            trabajo["fin"] = datetime.now()
+
+    asyncio.run_coroutine_threadsafe(correr(), _loop)
+    return trabajo
+
+def lanzar_en_hilo(operacion: str, funcion: Callable[[dict], None]) -> dict:
+    """
+    Ejecuta funcion(trabajo) en un hilo aparte y devuelve el trabajo (sin esperar). Para
+    trabajos síncronos que usan la BD y llaman a la API con ejecutar() (ej. la conciliación).
+    """
+    trabajo = _registrar_trabajo(operacion, 0)
+
+    def correr():
+        try:
+            funcion(trabajo)
+            trabajo["estado"] = "Terminado"
+        except Exception:
+            logger.exception("Error en el trabajo de Mercado Libre '%s'", operacion)
+            trabajo["estado"] = "Error"
+        finally:
+            trabajo["fin"] = datetime.now()
+
+    threading.Thread(target=correr, name=f"meli-{operacion}", daemon=True).start()
+    return trabajo
+
+def obtener_trabajo(id_: str) -> Optional[dict]:
+    with _lock:
+        return _trabajos.get(id_)
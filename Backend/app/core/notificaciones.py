@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, update, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import importacion, meli, cache
+from app.core.database import SessionLocal
+
+# Ingesta de notificaciones de órdenes del marketplace (webhook).
+# El endpoint solo inserta la notificación (ON CONFLICT DO NOTHING sobre su _id, así
+# las reentregas no duplican) y responde; un pool de trabajadores asyncio vacía la cola
+# en micro-lotes: obtiene cada orden (embebida en el payload o GET al `resource`),
+# resuelve los meli_id con importacion.importar y crea las OrdenVenta de todo el lote
+# en una transacción. Las filas se reservan (FOR UPDATE SKIP LOCKED y `disponible`
+# ARRENDAMIENTO s en el futuro) y se confirma antes de consultar la API: los GET no
+# retienen una transacción, bloqueos ni una conexión del pool; si el proceso cae, las
+# reservadas vuelven a la cola al vencer el arrendamiento. Cada orden externa se
+# serializa con un advisory lock, así varios trabajadores (o procesos) nunca
+# registran dos veces la misma venta aunque lleguen varias notificaciones de ella.
+#  - WEBHOOK_TRABAJADORES: trabajadores por proceso.
+
+TRABAJADORES = int(os.getenv("WEBHOOK_TRABAJADORES", "4"))
+LOTE = 200 # Notificaciones por transacción
+ESPERA_MAXIMA = 1.0 # s sin aviso antes de revisar la cola de nuevo
+MAX_INTENTOS = 8 # Errores transitorios (API caída); después queda en 'Error'
+BACKOFF_BASE = 2 # s, se duplica por intento
+ARRENDAMIENTO = 600 # s que una notificación tomada queda reservada para quien la tomó
+INTERVALO_PURGA = 3600
+RETENCION = 30 * 86400 # Procesadas/descartadas que se conservan (deduplicación por orden)
+
+CANAL = "Mercado Libre"
+ESTADOS_PAGADOS = {"paid"}
+PENDIENTE, PROCESADA, DESCARTADA, ERROR = "Pendiente", "Procesada", "Descartada", "Error"
+
+logger = logging.getLogger(__name__)
+
+# --- Encolado (en la solicitud del webhook) ---
+def _orden_externa(payload: dict) -> Optional[str]:
+    orden = payload.get("order")
+    if isinstance(orden, dict) and orden.get("id") is not None:
+        return str(orden["id"])
+    recurso = str(payload.get("resource") or "")
+    if recurso.startswith("/orders/"):
+        return recurso.rsplit("/", 1)[-1] or None
+    return None
+
+def _fila(payload: dict) -> dict:
+    cuerpo = json.dumps(payload, sort_keys=True, default=str)
+    notificacion_id = payload.get("_id") or payload.get("id") or hashlib.sha256(cuerpo.encode()).hexdigest()
+    return {
+        "notificacion_id": str(notificacion_id)[:100],
+        "topic": str(payload.get("topic") or ("orders" if "order" in payload else ""))[:50] or None,
+        "recurso": str(payload.get("resource") or "")[:255] or None,
+        "orden_externa": (_orden_externa(payload) or "")[:50] or None,
+        "payload": cuerpo,
+    }
+
+def encolar(db: Session, payloads: List[dict]) -> int:
+    """Inserta las notificaciones nuevas (las repetidas se ignoran) y despierta a los trabajadores."""
+    filas = list({f["notificacion_id"]: f for f in map(_fila, payloads)}.values())
+    if not filas:
+        return 0
+    n = models.NotificacionMarketplace
+    nuevas = db.execute(
+        insert(n).values(filas).on_conflict_do_nothing(index_elements=[n.notificacion_id]).returning(n.id)
+    ).all()
+    db.commit()
+    if nuevas:
+        avisar()
+    return len(nuevas)
+
+# --- Procesamiento (micro-lotes) ---
+def _obtener_ordenes(recursos: Dict[str, str]) -> Dict[str, Any]:
+    """GET concurrente de {orden_externa: recurso}; devuelve la orden o la ErrorMeLi."""
+    async def todas(cliente: meli.ClienteMeLi):
+        resultados = await asyncio.gather(
+            *(cliente.obtener(recurso) for recurso in recursos.values()), return_exceptions=True
+        )
+        return dict(zip(recursos, resultados))
+    return meli.ejecutar(todas)
+
+def _registrados(db: Session, externas) -> Dict[str, int]:
+    """{orden_externa: orden_venta_id} de las órdenes ya registradas por una notificación previa."""
+    n = models.NotificacionMarketplace
+    return dict(db.execute(
+        select(n.orden_externa, func.min(n.orden_venta_id))
+        .where(n.orden_externa.in_(list(externas)), n.orden_venta_id.isnot(None))
+        .group_by(n.orden_externa)
+    ).all())
+
+def _registros(externa: str, orden: dict) -> List[dict]:
+    """Líneas de la orden para importacion.importar. ValueError si no tiene la forma esperada."""
+    items = orden.get("order_items")
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Orden sin artículos válidos (order_items)")
+    return [{
+        "orden": externa,
+        "fecha": orden.get("date_created"),
+        "canal": CANAL,
+        "sku": item["item"].get("id") if isinstance(item.get("item"), dict) else None,
+        "cantidad": item.get("quantity"),
+        "precio": item.get("unit_price"),
+    } for item in items]
+
+def _tomar(db: Session):
+    """Reserva hasta LOTE notificaciones pendientes (disponible = ahora + ARRENDAMIENTO)."""
+    n = models.NotificacionMarketplace
+    libres = (
+        select(n.id)
+        .where(n.estado == PENDIENTE, n.disponible <= func.localtimestamp())
+        .order_by(n.id).limit(LOTE)
+        .with_for_update(skip_locked=True)
+    )
+    filas = db.execute(
+        update(n).where(n.id.in_(libres.scalar_subquery()))
+        .values(disponible=func.localtimestamp() + timedelta(seconds=ARRENDAMIENTO))
+        .returning(n.id, n.topic, n.recurso, n.orden_externa, n.payload, n.intentos)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return sorted(filas, key=lambda f: f.id)
+
+def procesar_lote(db: Session) -> int:
+    """Procesa un lote de la cola. Devuelve cuántas notificaciones se tomaron."""
+    n = models.NotificacionMarketplace
+    filas = _tomar(db)
+    if not filas:
+        db.commit()
+        return 0
+
+    resultado: Dict[int, dict] = {} # id -> cambios de la notificación
+    def marcar(fila, estado, error=None, orden_venta_id=None):
+        resultado[fila.id] = {"estado": estado, "error": error, "orden_venta_id": orden_venta_id}
+
+    # 1. Agrupar por orden externa (varias notificaciones de la misma orden cuentan una vez)
+    por_orden: Dict[str, list] = {}
+    for f in filas:
+        if not f.orden_externa or not (f.topic or "").startswith("orders"):
+            marcar(f, DESCARTADA, "Notificación sin orden")
+        else:
+            por_orden.setdefault(f.orden_externa, []).append(f)
+
+    def ya_registradas(registradas: Dict[str, int]):
+        for externa, orden_venta_id in registradas.items():
+            for f in por_orden.pop(externa, []):
+                marcar(f, DESCARTADA, "Orden ya registrada", orden_venta_id)
+
+    ya_registradas(_registrados(db, por_orden))
+    db.commit() # Las filas quedan reservadas; los GET van sin transacción abierta
+
+    # 2. Obtener las órdenes: embebidas en el payload o consultando el recurso (concurrente)
+    ordenes: Dict[str, Any] = {}
+    recursos = {}
+    for externa, grupo in por_orden.items():
+        embebida = next((o for o in (json.loads(f.payload).get("order") for f in grupo) if isinstance(o, dict)), None)
+        if embebida is not None:
+            ordenes[externa] = embebida
+        else:
+            recursos[externa] = grupo[0].recurso
+    if recursos:
+        ordenes.update(_obtener_ordenes(recursos))
+
+    reintentar = []
+    for externa in list(por_orden):
+        orden = ordenes.get(externa)
+        if isinstance(orden, meli.ErrorMeLi):
+            for f in por_orden.pop(externa):
+                # Solo se reintentan los errores transitorios (red, 429, 5xx)
+                if orden.status not in (None, *meli.ESTADOS_REINTENTABLES) or f.intentos + 1 >= MAX_INTENTOS:
+                    marcar(f, ERROR, str(orden))
+                else:
+                    reintentar.append(f)
+        elif isinstance(orden, Exception) or not isinstance(orden, dict):
+            # Respuesta ilegible o vacía: queda en 'Error' sin frenar al resto del lote
+            for f in por_orden.pop(externa):
+                marcar(f, ERROR, f"Orden inválida: {orden!r}"[:500])
+        elif str(orden.get("status")) not in ESTADOS_PAGADOS:
+            # Se registrará con la notificación del pago
+            for f in por_orden.pop(externa):
+                marcar(f, DESCARTADA, f"Orden en estado '{orden.get('status')}'")
+
+    registros: Dict[str, List[dict]] = {}
+    for externa in list(por_orden):
+        try:
+            registros[externa] = _registros(externa, ordenes[externa])
+        except ValueError as e:
+            for f in por_orden.pop(externa):
+                marcar(f, ERROR, str(e))
+
+    # 3. Segunda transacción: serializar por orden externa (orden fijo: sin deadlocks) y
+    # volver a revisar duplicados (otro trabajador pudo registrarla mientras tanto)
+    for externa in sorted(por_orden):
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:clave))"), {"clave": f"orden-mp:{externa}"})
+    ya_registradas(_registrados(db, por_orden))
+
+    # 4. Crear las ventas del lote (COPY, un UPDATE de stock por tabla)
+    importadas = 0
+    if por_orden:
+        resumen = importacion.importar(db, (
+            (grupo[0].id, registro) # "línea" = id de la notificación
+            for externa, grupo in por_orden.items()
+            for registro in registros[externa]
+        ), usuario_id=None, descontar_stock=True)
+        importadas = resumen["ordenes_importadas"]
+        errores: Dict[str, list] = {}
+        for e in resumen["errores"]:
+            errores.setdefault(e["orden"], []).append(e["error"])
+        for externa, grupo in por_orden.items():
+            orden_venta_id = resumen["ids"].get(externa)
+            for i, f in enumerate(grupo):
+                if orden_venta_id:
+                    marcar(f, PROCESADA if i == 0 else DESCARTADA, None if i == 0 else "Orden ya registrada", orden_venta_id)
+                else:
+                    marcar(f, ERROR, "; ".join(errores.get(externa, [])) or "Orden no importada")
+
+    # 5. Guardar el resultado de cada notificación (un executemany por primary key)
+    if resultado:
+        ahora = db.execute(select(func.localtimestamp())).scalar()
+        db.execute(update(n), [{"id": id_, **cambios, "procesada": ahora} for id_, cambios in resultado.items()])
+    for f in reintentar:
+        db.execute(update(n).where(n.id == f.id).values(
+            intentos=n.intentos + 1,
+            disponible=func.localtimestamp() + timedelta(seconds=BACKOFF_BASE * 2 ** f.intentos),
+        ))
+    db.commit()
+    if importadas:
+        cache.invalidar(cache.CLAVE_DASHBOARD)
+    return len(filas)
+
+def procesar() -> int:
+    with SessionLocal() as db:
+        return procesar_lote(db)
+
+def purgar():
+    """Borra las notificaciones terminadas más antiguas que RETENCION (tarea periódica)."""
+    n = models.NotificacionMarketplace
+    with SessionLocal() as db:
+        db.execute(delete(n).where(
+            n.estado.in_([PROCESADA, DESCARTADA]),
+            n.recibida < func.now() - timedelta(seconds=RETENCION)
+        ))
+        db.commit()
+
+# --- Pool de trabajadores (event loop de la app) ---
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_evento: Optional[asyncio.Event] = None
+_trabajadores: List[asyncio.Task] = []
+
+def avisar():
+    """Despierta a los trabajadores (se puede llamar desde cualquier hilo)."""
+    if _loop is not None and _evento is not None:
+        _loop.call_soon_threadsafe(_evento.set)
+
+async def _trabajador():
+    while True:
+        try:
+            tomadas = await asyncio.to_thread(procesar)
+        except Exception:
+            logger.exception("Error procesando notificaciones del marketplace")
+            tomadas = 0
+        # Lotes completos indican que hay más pendientes; si no, esperar aviso o ESPERA_MAXIMA
+        if tomadas < LOTE:
+            try:
+                await asyncio.wait_for(_evento.wait(), ESPERA_MAXIMA)
+            except asyncio.TimeoutError:
+                pass
+            _evento.clear()
+
+def iniciar():
+    """Se llama en el startup de la app (después de meli.iniciar())."""
+    global _loop, _evento
+    _loop = asyncio.get_running_loop()
+    _evento = asyncio.Event()
+    for i in range(TRABAJADORES):
+        _trabajadores.append(asyncio.create_task(_trabajador(), name=f"notificaciones-{i}"))
+
+async def detener():
+    global _loop, _evento
+    for tarea in _trabajadores:
+        tarea.cancel()
+    await asyncio.gather(*_trabajadores, return_exceptions=True)
+    _trabajadores.clear()
+    _loop, _evento = None, None
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import date, datetime, time
+from typing import Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+# Paginación por cursor (keyset) para los listados.
+# El cursor de la siguiente página viaja en el header X-Next-Cursor,
+# así el cuerpo sigue siendo la lista que ya consume el frontend.
+LIMITE_DEFECTO = 100
+LIMITE_MAXIMO = 500
+HEADER_CURSOR = "X-Next-Cursor"
+
+def _codificar(valores) -> str:
+    crudo = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in valores])
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+def _decodificar(cursor: str, columnas) -> list:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if len(valores) != len(columnas):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if col.type.python_type is datetime else col.type.python_type(v)
+            for v, col in zip(valores, columnas)
+        ]
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def rango_fechas(query, columna, desde: Optional[date], hasta: Optional[date]):
+    if desde: query = query.filter(columna >= datetime.combine(desde, time.min))
+    if hasta: query = query.filter(columna <= datetime.combine(hasta, time.max))
+    return query
+
+def paginar(query, response: Response, cursor: Optional[str], limite: int, *columnas, descendente: bool = True):
+    """
+    Aplica orden y keyset sobre `columnas` (ej. fecha, id) y devuelve una página.
+    Si hay más resultados, deja el cursor siguiente en el header X-Next-Cursor.
+    """
+    clave = tuple_(*columnas) if len(columnas) > 1 else columnas[0]
+    if cursor:
+        valores = _decodificar(cursor, columnas)
+        limite_cursor = tuple_(*valores) if len(valores) > 1 else valores[0]
+        query = query.filter(clave < limite_cursor if descendente else clave > limite_cursor)
+
+    orden = [c.desc() if descendente else c.asc() for c in columnas]
+    filas = query.order_by(*orden).limit(limite + 1).all()
+
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultimo = filas[-1]
+        response.headers[HEADER_CURSOR] = _codificar([getattr(ultimo, c.key) for c in columnas])
+    return filas
@@ -0,0 +1,157 @@
+from datetime import date, datetime, timedelta
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, func, literal
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import masivo
+
+# Pronóstico de demanda por SKU para todo el catálogo a la vez.
+# Serie diaria (rollup de ventas) -> matriz SKU x día, y cada método se
+# ejecuta vectorizado sobre todas las filas (el único bucle es sobre el tiempo).
+#  - Demanda regular: Holt-Winters aditivo (tendencia amortiguada + estacionalidad semanal),
+#    eligiendo alfa por SKU con el menor error a un paso.
+#  - Demanda intermitente: Croston con corrección SBA.
+
+DIAS_HISTORIA = 182
+HORIZONTE_SEMANAS = 8
+ESTACION = 7 # Estacionalidad por día de la semana
+UMBRAL_ADI = 1.32 # Intervalo medio entre ventas a partir del cual la demanda es intermitente
+
+ALFAS = np.array([0.05, 0.1, 0.2, 0.4], dtype=np.float32)
+BETA = 0.05
+GAMMA = 0.1
+PHI = 0.9
+ALFA_CROSTON = 0.1
+
+EJECUCIONES_CONSERVADAS = 3
+
+METODO_HW = "Holt-Winters"
+METODO_SBA = "Croston-SBA"
+
+def _series(db: Session, hoy: date) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Matriz (SKU x día) de unidades netas hasta ayer, con los ids de cada fila."""
+    vd = models.VentaDiaria
+    inicio = hoy - timedelta(days=DIAS_HISTORIA)
+    datos = masivo.matriz(db, select(
+        func.coalesce(vd.variante_producto_id, -1),
+        func.coalesce(vd.producto_reventa_id, -1),
+        vd.fecha - literal(inicio),
+        func.sum(vd.unidades - vd.unidadesDevueltas)
+    ).where(vd.fecha >= inicio, vd.fecha < hoy)
+     .group_by(vd.variante_producto_id, vd.producto_reventa_id, vd.fecha))
+
+    if not datos.size:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.zeros((0, DIAS_HISTORIA), np.float32)
+
+    # Clave única por SKU: variantes pares, reventa impares
+    clave = np.where(datos[:, 0] >= 0, datos[:, 0] * 2, datos[:, 1] * 2 + 1)
+    claves, fila = np.unique(clave, return_inverse=True)
+    y = np.bincount(fila * DIAS_HISTORIA + datos[:, 2], weights=datos[:, 3],
+                    minlength=claves.size * DIAS_HISTORIA)
+    y = np.maximum(y, 0).astype(np.float32).reshape(claves.size, DIAS_HISTORIA)
+
+    es_variante = claves % 2 == 0
+    variante_ids = np.where(es_variante, claves // 2, -1)
+    reventa_ids = np.where(es_variante, -1, claves // 2)
+    return variante_ids, reventa_ids, y
+
+def _holt_winters(y: np.ndarray, horizonte: int) -> np.ndarray:
+    """Holt-Winters aditivo vectorizado; prueba varios alfa y usa el mejor por fila."""
+    n, t = y.shape
+    k = ALFAS.size
+    alfa = ALFAS[:, None] # (k, 1) contra (k, n)
+
+    nivel = np.broadcast_to(y[:, :ESTACION].mean(axis=1), (k, n)).copy()
+    tendencia = np.broadcast_to((y[:, ESTACION:2 * ESTACION].mean(axis=1) - y[:, :ESTACION].mean(axis=1)) / ESTACION, (k, n)).copy()
+    estacion = np.broadcast_to((y[:, :ESTACION] - y[:, :ESTACION].mean(axis=1, keepdims=True)).T[:, None, :], (ESTACION, k, n)).copy()
+    error = np.zeros((k, n), dtype=np.float32)
+
+    for i in range(t):
+        obs = y[:, i]
+        s = estacion[i % ESTACION]
+        prediccion = nivel + PHI * tendencia + s
+        if i >= ESTACION:
+            error += (obs - prediccion) ** 2
+        nivel_nuevo = alfa * (obs - s) + (1 - alfa) * (nivel + PHI * tendencia)
+        tendencia = BETA * (nivel_nuevo - nivel) + (1 - BETA) * PHI * tendencia
+        estacion[i % ESTACION] = GAMMA * (obs - nivel_nuevo) + (1 - GAMMA) * s
+        nivel = nivel_nuevo
+
+    mejor = error.argmin(axis=0)
+    columnas = np.arange(n)
+    nivel, tendencia = nivel[mejor, columnas], tendencia[mejor, columnas]
+    estacion = estacion[:, mejor, columnas] # (ESTACION, n)
+
+    pasos = np.arange(1, horizonte + 1)
+    amortiguado = np.cumsum(PHI ** pasos) # suma de phi^1..phi^h
+    indices = (t + pasos - 1) % ESTACION
+    pronostico = nivel[:, None] + amortiguado[None, :] * tendencia[:, None] + estacion[indices].T
+    return np.maximum(pronostico, 0)
+
+def _croston_sba(y: np.ndarray, horizonte: int) -> np.ndarray:
+    """Croston con corrección SBA vectorizado; pronóstico plano por fila."""
+    n, t = y.shape
+    hay_venta = y > 0
+    ventas = np.maximum(hay_venta.sum(axis=1), 1)
+    tamano = np.where(hay_venta, y, 0).sum(axis=1) / ventas
+    intervalo = np.full(n, t, dtype=np.float32) / ventas
+    desde_ultima = np.ones(n, dtype=np.float32)
+
+    for i in range(t):
+        vende = hay_venta[:, i]
+        tamano = np.where(vende, tamano + ALFA_CROSTON * (y[:, i] - tamano), tamano)
+        intervalo = np.where(vende, intervalo + ALFA_CROSTON * (desde_ultima - intervalo), intervalo)
+        desde_ultima = np.where(vende, 1, desde_ultima + 1)
+
+    diario = (1 - ALFA_CROSTON / 2) * tamano / np.maximum(intervalo, 1)
+    return np.repeat(diario[:, None], horizonte, axis=1)
+
+def pronosticar(y: np.ndarray, semanas: int = HORIZONTE_SEMANAS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Devuelve (pronóstico semanal [n x semanas], es_intermitente [n]).
+    """
+    n = y.shape[0]
+    dias = semanas * 7
+    dias_con_venta = (y > 0).sum(axis=1)
+    adi = np.where(dias_con_venta > 0, y.shape[1] / np.maximum(dias_con_venta, 1), np.inf)
+    intermitente = adi > UMBRAL_ADI
+
+    diario = np.zeros((n, dias), dtype=np.float32)
+    if (~intermitente).any():
+        diario[~intermitente] = _holt_winters(y[~intermitente], dias)
+    if intermitente.any():
+        diario[intermitente] = _croston_sba(y[intermitente], dias)
+    return diario.reshape(n, semanas, 7).sum(axis=2), intermitente
+
+def ejecutar(db: Session) -> Tuple[datetime, int]:
+    """Calcula y guarda el pronóstico de todo el catálogo. Devuelve (fecha_ejecucion, SKUs)."""
+    fecha_ejecucion = datetime.now()
+    variante_ids, reventa_ids, y = _series(db, date.today())
+
+    if y.shape[0]:
+        semanal, intermitente = pronosticar(y)
+        n, semanas = semanal.shape
+        datos = pd.DataFrame({
+            "fecha_ejecucion": fecha_ejecucion,
+            "variante_producto_id": pd.array(np.repeat(variante_ids, semanas), dtype="Int64"),
+            "producto_reventa_id": pd.array(np.repeat(reventa_ids, semanas), dtype="Int64"),
+            "semana": np.tile(np.arange(1, semanas + 1), n),
+            "cantidad": np.round(semanal.ravel(), 2),
+            "metodo": np.repeat(np.where(intermitente, METODO_SBA, METODO_HW), semanas)
+        })
+        # Los ids -1 significan "no aplica"
+        datos.loc[datos["variante_producto_id"] < 0, "variante_producto_id"] = pd.NA
+        datos.loc[datos["producto_reventa_id"] < 0, "producto_reventa_id"] = pd.NA
+        masivo.copiar(db, models.PronosticoDemanda.__table__, datos)
+
+    # Conservar solo las últimas ejecuciones
+    pd_ = models.PronosticoDemanda
+    recientes = select(pd_.fecha_ejecucion).distinct().order_by(pd_.fecha_ejecucion.desc()).limit(EJECUCIONES_CONSERVADAS)
+    db.execute(delete(pd_).where(pd_.fecha_ejecucion.not_in(recientes)))
+    db.commit()
+    return fecha_ejecucion, y.shape[0]
+
+def ultima_ejecucion(db: Session):
+    return db.query(func.max(models.PronosticoDemanda.fecha_ejecucion)).scalar()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, func, cast, Integer, Text, union_all
+from sqlalchemy.dialects.postgresql import BIT, aggregate_order_by
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import kardex, meli, notificaciones
+from app.core.database import SessionLocal
+
+# Publicaciones de Mercado Libre: resolución meli_id <-> SKU y conciliación.
+# meli_id es único entre VarianteProducto y ProductoReventa: models.PublicacionMeLi es
+# el mapeo publicación -> SKU ("var-N" / "rev-N"), mantenido por triggers.
+# La conciliación trae todas las publicaciones remotas y compara contra las locales
+# por cubetas: cada meli_id cae en una de CUBETAS según su md5 y cada cubeta se
+# resume con el md5 de sus líneas "meli_id:stock:precio" (calculado en SQL del lado
+# local). Solo las cubetas con hash distinto se cargan y comparan publicación por
+# publicación, y solo las publicaciones que difieren se reportan. Corregir (enviar el
+# valor local, igual que la bandeja de salida) solo se hace a pedido: la conciliación
+# periódica solo reporta. El stock no se corrige mientras haya órdenes del webhook
+# pendientes de registrar: el local todavía no las descontó y se sobrevendería.
+
+CUBETAS = 1024
+INTERVALO_CONCILIACION = 6 * 3600
+ESTADOS_INACTIVOS = {"closed"}
+
+PUBLICABLES = {prefijo: modelo for modelo, prefijo in kardex.PREFIJOS.items()
+               if modelo in (models.VarianteProducto, models.ProductoReventa)}
+
+logger = logging.getLogger(__name__)
+
+# --- Resolución ---
+def desde_sku(sku: str) -> Optional[Tuple[object, int]]:
+    """'var-1' / 'rev-2' -> (modelo, id); None si no es un SKU publicable."""
+    prefijo, _, id_ = sku.partition("-")
+    if prefijo not in PUBLICABLES or not id_.isdigit():
+        return None
+    return PUBLICABLES[prefijo], int(id_)
+
+def _vinculadas():
+    """Subconsulta (sku, meli_id, stock, precio) de los productos publicados."""
+    v, pf, r = models.VarianteProducto, models.ProductoFabricado, models.ProductoReventa
+    variantes = (select(func.concat("var-", v.id).label("sku"), v.meli_id, v.stockActual.label("stock"),
+                        pf.precioVenta.label("precio"))
+                 .join(pf, pf.id == v.producto_fabricado_id).where(v.meli_id.isnot(None)))
+    reventa = select(func.concat("rev-", r.id), r.meli_id, r.stockActual, r.precioVenta).where(r.meli_id.isnot(None))
+    return union_all(variantes, reventa).subquery()
+
+def resolver(db: Session, meli_ids: Iterable[str]) -> Dict[str, Tuple[object, int]]:
+    """{meli_id: (modelo, id)} de las publicaciones vinculadas (las desconocidas se omiten)."""
+    p = models.PublicacionMeLi
+    return {meli_id: desde_sku(sku) for meli_id, sku in db.execute(select(p.meli_id, p.sku).where(p.meli_id.in_(list(meli_ids))))}
+
+def _con_ordenes_pendientes(db: Session) -> Optional[set]:
+    """
+    meli_id incluidos en órdenes del webhook aún 'Pendiente' (vendidos en Mercado Libre
+    pero sin descontar del stock local). None si alguna no trae la orden embebida: no
+    se sabe qué publicaciones incluye.
+    """
+    n = models.NotificacionMarketplace
+    meli_ids = set()
+    for payload in db.execute(
+        select(n.payload).where(n.estado == notificaciones.PENDIENTE, n.topic.startswith("orders"))
+    ).scalars():
+        try:
+            orden = json.loads(payload).get("order")
+        except (ValueError, AttributeError):
+            orden = None
+        if not isinstance(orden, dict):
+            return None
+        for item in orden.get("order_items") or []:
+            if isinstance(item, dict) and isinstance(item.get("item"), dict):
+                meli_ids.add(item["item"].get("id"))
+    return meli_ids
+
+# --- Conciliación ---
+def _cubeta(meli_id: str) -> int:
+    return int(hashlib.md5(meli_id.encode()).hexdigest()[:7], 16) % CUBETAS
+
+def _linea(meli_id: str, stock: int, precio) -> str:
+    return f"{meli_id}:{max(0, int(stock))}:{float(precio):.2f}"
+
+def _hash(lineas: List[str]) -> str:
+    return hashlib.md5(",".join(lineas).encode()).hexdigest()
+
+def _columnas_sql(u):
+    """Cubeta y línea de cada publicación local, con el mismo formato que _cubeta/_linea."""
+    cubeta = cast(cast(func.concat("x", func.substr(func.md5(u.c.meli_id), 1, 7)), BIT(28)), Integer) % CUBETAS
+    linea = func.concat(u.c.meli_id, ":", func.greatest(u.c.stock, 0), ":", cast(u.c.precio, Text))
+    return cubeta, linea
+
+def conciliar(db: Session, corregir: bool = False) -> dict:
+    """
+    Compara stock y precio remotos contra los locales y devuelve las diferencias.
+    Con `corregir` envía el valor local de las publicaciones que difieren; el stock de
+    las que tienen órdenes pendientes de registrar se difiere (ver `diferidas`).
+    """
+    remotas = {
+        meli_id: item for meli_id, item in meli.ejecutar(lambda cliente: cliente.publicaciones()).items()
+        if item.get("status") not in ESTADOS_INACTIVOS
+    }
+
+    # 1. Hash por cubeta: remoto en memoria, local en una consulta agregada
+    por_cubeta: Dict[int, List[str]] = {}
+    for meli_id in sorted(remotas):
+        item = remotas[meli_id]
+        por_cubeta.setdefault(_cubeta(meli_id), []).append(
+            _linea(meli_id, item.get("available_quantity") or 0, item.get("price") or 0)
+        )
+    hashes_remotos = {cubeta: _hash(lineas) for cubeta, lineas in por_cubeta.items()}
+
+    u = _vinculadas()
+    cubeta, linea = _columnas_sql(u)
+    locales = db.execute(
+        select(cubeta.label("cubeta"), func.count(), func.md5(func.string_agg(linea, aggregate_order_by(",", u.c.meli_id.collate("C")))))
+        .group_by(cubeta)
+    ).all()
+    hashes_locales = {c: h for c, _, h in locales}
+    distintas = sorted(c for c in set(hashes_remotos) | set(hashes_locales) if hashes_remotos.get(c) != hashes_locales.get(c))
+
+    # 2. Detalle solo de las cubetas distintas
+    diferencias, sin_publicacion = [], []
+    vistas = set()
+    if distintas:
+        for sku, meli_id, stock, precio in db.execute(select(u.c.sku, u.c.meli_id, u.c.stock, u.c.precio).where(cubeta.in_(distintas))):
+            vistas.add(meli_id)
+            item = remotas.get(meli_id)
+            if item is None:
+                sin_publicacion.append({"sku": sku, "meli_id": meli_id})
+                continue
+            stock_local, precio_local = max(0, stock), float(precio)
+            stock_remoto, precio_remoto = item.get("available_quantity") or 0, float(item.get("price") or 0)
+            if stock_local != stock_remoto or f"{precio_local:.2f}" != f"{precio_remoto:.2f}":
+                diferencias.append({
+                    "sku": sku, "meli_id": meli_id,
+                    "stock_local": stock_local, "stock_remoto": stock_remoto,
+                    "precio_local": precio_local, "precio_remoto": precio_remoto,
+                })
+    sin_vincular = sorted(m for m in remotas if _cubeta(m) in set(distintas) and m not in vistas)
+
+    # 3. Corregir: solo los campos que difieren
+    corregidas, errores, diferidas = 0, [], []
+    if corregir and diferencias:
+        pendientes = _con_ordenes_pendientes(db)
+        cambios = {}
+        for d in diferencias:
+            cambio = {}
+            if d["stock_local"] != d["stock_remoto"]:
+                if pendientes is None or d["meli_id"] in pendientes:
+                    diferidas.append(d["meli_id"])
+                else:
+                    cambio["available_quantity"] = d["stock_local"]
+            if f"{d['precio_local']:.2f}" != f"{d['precio_remoto']:.2f}": cambio["price"] = d["precio_local"]
+            if cambio: cambios[d["meli_id"]] = cambio
+        if cambios:
+            resultado = meli.ejecutar(lambda cliente: cliente.en_lote(cambios.items()))
+            corregidas, errores = resultado["exitos"], resultado["errores"]
+        if diferidas:
+            logger.info("Conciliación Mercado Libre: stock de %d publicaciones diferido por órdenes pendientes", len(diferidas))
+
+    return {
+        "publicaciones_remotas": len(remotas),
+        "publicaciones_locales": sum(n for _, n, _ in locales),
+        "cubetas": CUBETAS,
+        "cubetas_distintas": len(distintas),
+        "diferencias": diferencias,
+        "sin_vincular": sin_vincular,
+        "sin_publicacion": sin_publicacion,
+        "corregidas": corregidas,
+        "errores": errores,
+        "diferidas": diferidas,
+    }
+
+def lanzar_conciliacion(corregir: bool = False) -> dict:
+    """La conciliación como trabajo de meli (hilo y sesión propios); el resultado queda en trabajo["conciliacion"]."""
+    def correr(trabajo):
+        with SessionLocal() as db:
+            trabajo["conciliacion"] = conciliar(db, corregir)
+    return meli.lanzar_en_hilo("conciliacion+corregir" if corregir else "conciliacion", correr)
+
+def conciliar_periodico():
+    if not meli.ACCESS_TOKEN:
+        return # Modo simulado: no hay publicaciones remotas que comparar
+    with SessionLocal() as db:
+        resumen = conciliar(db) # Solo reporta: corregir es POST /sincronizacion/mercadolibre/conciliar?corregir=true
+    if resumen["cubetas_distintas"]:
+        logger.info(
+            "Conciliación Mercado Libre: %d diferencias, %d sin vincular, %d sin publicación",
+            len(resumen["diferencias"]), len(resumen["sin_vincular"]), len(resumen["sin_publicacion"])
+        )
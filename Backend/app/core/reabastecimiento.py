@@ -0,0 +1,178 @@
+import math
+from datetime import date, timedelta
+from statistics import NormalDist
+from typing import List
+import numpy as np
+from sqlalchemy import select, insert, func, cast, literal, Date
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import masivo
+
+# Punto de reorden, stock de seguridad y lote económico (EOQ) para
+# materia prima y productos de reventa, a partir del consumo histórico:
+#  - Materia prima: consumo por BOM de las órdenes de producción terminadas.
+#  - Reventa: ventas netas del rollup diario.
+
+DIAS_HISTORIA = 90
+DIAS_ENTREGA = 7
+NIVEL_SERVICIO = 0.95
+COSTO_PEDIDO = 250.0 # Costo fijo por orden de compra (MXN)
+TASA_MANTENIMIENTO = 0.25 # Costo anual de mantener inventario, fracción del costo unitario
+
+ESTADO_BORRADOR = "Borrador"
+ESTADOS_EN_CAMINO = ("Borrador", "Solicitada", "Parcial")
+
+TIPO_MATERIA = "Materia Prima"
+TIPO_REVENTA = "Reventa"
+
+def _consumo_materia(db: Session, inicio: date) -> np.ndarray:
+    """[materia_id, día, cantidad] consumida por las órdenes terminadas."""
+    op = models.OrdenProduccion
+    v = models.VarianteProducto
+    lm = models.ListaMateriales
+    dia = cast(op.fechaFinalizacion, Date)
+    return masivo.matriz(db, select(
+        lm.materia_prima_id,
+        dia - literal(inicio),
+        func.sum(op.cantidadProducida * lm.cantidadRequerida)
+    ).join(v, v.id == op.variante_producto_id)
+     .join(lm, lm.producto_fabricado_id == v.producto_fabricado_id)
+     .where(op.estado == "Terminado", dia >= inicio)
+     .group_by(lm.materia_prima_id, dia), dtype=np.float64)
+
+def _consumo_reventa(db: Session, inicio: date) -> np.ndarray:
+    """[reventa_id, día, unidades netas vendidas]."""
+    vd = models.VentaDiaria
+    return masivo.matriz(db, select(
+        vd.producto_reventa_id,
+        vd.fecha - literal(inicio),
+        func.sum(vd.unidades - vd.unidadesDevueltas)
+    ).where(vd.producto_reventa_id.isnot(None), vd.fecha >= inicio)
+     .group_by(vd.producto_reventa_id, vd.fecha), dtype=np.float64)
+
+def en_camino(db: Session) -> dict:
+    """Cantidades pendientes de recibir en órdenes de compra abiertas por (tipo, id)."""
+    d = models.DetalleOrdenCompra
+    oc = models.OrdenCompra
+    filas = db.query(d.materia_prima_id, d.producto_reventa_id, func.sum(d.cantidad - d.cantidadRecibida)) \
+        .join(oc, oc.id == d.orden_compra_id) \
+        .filter(oc.estado.in_(ESTADOS_EN_CAMINO)) \
+        .group_by(d.materia_prima_id, d.producto_reventa_id).all()
+    resultado = {}
+    for materia_id, reventa_id, cantidad in filas:
+        if materia_id: resultado[(TIPO_MATERIA, materia_id)] = int(cantidad)
+        elif reventa_id: resultado[(TIPO_REVENTA, reventa_id)] = int(cantidad)
+    return resultado
+
+def _estadisticas(ids: np.ndarray, consumo: np.ndarray, dias: int):
+    """Media y desviación diaria por item (los días sin consumo cuentan como 0)."""
+    n = ids.size
+    if not n or not consumo.size:
+        return np.zeros(n), np.zeros(n)
+    posicion = {int(id_): i for i, id_ in enumerate(ids)}
+    fila = np.array([posicion.get(int(id_), -1) for id_ in consumo[:, 0]])
+    conocidos = fila >= 0
+    serie = np.bincount(fila[conocidos] * dias + consumo[conocidos, 1].astype(np.int64),
+                        weights=consumo[conocidos, 2], minlength=n * dias).reshape(n, dias)
+    return serie.mean(axis=1), serie.std(axis=1)
+
+def calcular(
+    db: Session,
+    dias_entrega: int = DIAS_ENTREGA,
+    nivel_servicio: float = NIVEL_SERVICIO,
+    costo_pedido: float = COSTO_PEDIDO
+) -> List[dict]:
+    inicio = date.today() - timedelta(days=DIAS_HISTORIA - 1)
+    z = NormalDist().inv_cdf(nivel_servicio)
+    pendientes = en_camino(db)
+
+    catalogos = [
+        (TIPO_MATERIA, db.query(models.MateriaPrima.id, models.MateriaPrima.nombre, models.MateriaPrima.stockActual,
+                                models.MateriaPrima.costo, models.MateriaPrima.proveedor_id).order_by(models.MateriaPrima.id).all(),
+         _consumo_materia(db, inicio)),
+        (TIPO_REVENTA, db.query(models.ProductoReventa.id, models.ProductoReventa.nombre, models.ProductoReventa.stockActual,
+                                models.ProductoReventa.costoCompra, models.ProductoReventa.proveedor_id).order_by(models.ProductoReventa.id).all(),
+         _consumo_reventa(db, inicio)),
+    ]
+
+    resultado = []
+    for tipo, items, consumo in catalogos:
+        if not items:
+            continue
+        ids = np.array([i.id for i in items], dtype=np.int64)
+        stock = np.array([i.stockActual for i in items], dtype=np.float64)
+        costo = np.array([float(i[3]) for i in items])
+        camino = np.array([pendientes.get((tipo, int(id_)), 0) for id_ in ids], dtype=np.float64)
+
+        media, desviacion = _estadisticas(ids, consumo, DIAS_HISTORIA)
+        seguridad = z * desviacion * math.sqrt(dias_entrega)
+        reorden = media * dias_entrega + seguridad
+        demanda_anual = media * 365
+        mantener = costo * TASA_MANTENIMIENTO
+        with np.errstate(divide="ignore", invalid="ignore"):
+            eoq = np.where((demanda_anual > 0) & (mantener > 0), np.sqrt(2 * demanda_anual * costo_pedido / mantener), 0)
+
+        posicion = stock + camino
+        reordenar = (media > 0) & (posicion <= reorden)
+        sugerida = np.where(reordenar, np.ceil(np.maximum(eoq, reorden - posicion)), 0)
+
+        for i, item in enumerate(items):
+            resultado.append({
+                "tipo": tipo,
+                "id": item.id,
+                "nombre": item.nombre,
+                "proveedor_id": item.proveedor_id,
+                "costo_unitario": float(costo[i]),
+                "stock_actual": int(stock[i]),
+                "en_camino": int(camino[i]),
+                "consumo_diario": round(float(media[i]), 3),
+                "desviacion_diaria": round(float(desviacion[i]), 3),
+                "stock_seguridad": round(float(seguridad[i]), 2),
+                "punto_reorden": round(float(reorden[i]), 2),
+                "cantidad_economica": round(float(eoq[i]), 2),
+                "cantidad_sugerida": int(sugerida[i]),
+                "reordenar": bool(reordenar[i])
+            })
+
+    resultado.sort(key=lambda r: (not r["reordenar"], r["tipo"], r["nombre"]))
+    return resultado
+
+def generar_borradores(db: Session, sugerencias: List[dict]) -> dict:
+    """
+    Crea órdenes de compra en estado 'Borrador', una por proveedor, con
+    un INSERT multi-fila para las cabeceras y otro para los detalles.
+    """
+    por_proveedor = {}
+    sin_proveedor = []
+    for s in sugerencias:
+        if not s["reordenar"] or s["cantidad_sugerida"] <= 0:
+            continue
+        if not s["proveedor_id"]:
+            sin_proveedor.append(s["nombre"])
+            continue
+        por_proveedor.setdefault(s["proveedor_id"], []).append(s)
+
+    if not por_proveedor:
+        return {"ordenes_creadas": [], "items": 0, "sin_proveedor": sin_proveedor}
+
+    oc = models.OrdenCompra
+    ordenes = db.execute(
+        insert(oc).returning(oc.id, oc.proveedor_id),
+        [{"proveedor_id": proveedor_id, "estado": ESTADO_BORRADOR} for proveedor_id in por_proveedor]
+    ).all()
+
+    detalles = [
+        {
+            "orden_compra_id": orden.id,
+            "cantidad": s["cantidad_sugerida"],
+            "costoUnitario": s["costo_unitario"],
+            "materia_prima_id": s["id"] if s["tipo"] == TIPO_MATERIA else None,
+            "producto_reventa_id": s["id"] if s["tipo"] == TIPO_REVENTA else None
+        }
+        for orden in ordenes
+        for s in por_proveedor[orden.proveedor_id]
+    ]
+    db.execute(insert(models.DetalleOrdenCompra), detalles)
+    db.commit()
+
+    return {"ordenes_creadas": sorted(o.id for o in ordenes), "items": len(detalles), "sin_proveedor": sin_proveedor}
@@ -0,0 +1,151 @@
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, update, values, column, Integer
+from sqlalchemy.orm import Session
+from app.models import models
+from app.core import inventario, kardex
+
+# Recepción y reversión de órdenes de compra en bloque.
+# Las cantidades se suman por SKU y se aplican con un UPDATE ... FROM (VALUES ...)
+# por tabla de inventario (ver core/inventario.py); las líneas y los estados de las
+# órdenes se actualizan con un UPDATE por grupo: el número de sentencias no depende
+# de cuántas órdenes o líneas se reciban.
+# Cada línea lleva cantidadRecibida; una orden con parte recibida queda 'Parcial'.
+
+ESTADO_RECIBIDA = "Recibida"
+ESTADO_PARCIAL = "Parcial"
+ESTADO_SOLICITADA = "Solicitada"
+ESTADOS_RECIBIBLES = ("Borrador", ESTADO_SOLICITADA, ESTADO_PARCIAL)
+ESTADOS_CON_RECEPCION = (ESTADO_PARCIAL, ESTADO_RECIBIDA)
+
+def _lista(ids: Iterable[int]) -> str:
+    return ", ".join(map(str, sorted(ids)))
+
+def _bloquear_ordenes(db: Session, ids: Iterable[int]) -> Dict[int, str]:
+    """Bloquea las órdenes en orden de id y devuelve {id: estado}. 404 si falta alguna."""
+    ids = sorted(set(ids))
+    oc = models.OrdenCompra
+    filas = db.execute(select(oc.id, oc.estado).where(oc.id.in_(ids)).order_by(oc.id).with_for_update()).all()
+    estados = {f.id: f.estado for f in filas}
+    faltantes = set(ids) - set(estados)
+    if faltantes:
+        raise HTTPException(404, f"Orden no encontrada (id {_lista(faltantes)})")
+    return estados
+
+def _detalles(db: Session, orden_ids: Iterable[int]):
+    d = models.DetalleOrdenCompra
+    return db.execute(
+        select(d.id, d.orden_compra_id, d.cantidad, d.cantidadRecibida, d.materia_prima_id, d.producto_reventa_id)
+        .where(d.orden_compra_id.in_(list(orden_ids)))
+        .order_by(d.id)
+    ).all()
+
+def _aplicar(db: Session, detalles, recibido: Dict[int, int], validar: bool):
+    """Aplica recibido {detalle_id: delta} al stock y al kardex (movimientos con el id de cada orden)."""
+    lineas = [d for d in detalles if recibido.get(d.id)]
+    por_tabla = {
+        models.MateriaPrima: [(d.materia_prima_id, recibido[d.id], d.orden_compra_id) for d in lineas if d.materia_prima_id],
+        models.ProductoReventa: [(d.producto_reventa_id, recibido[d.id], d.orden_compra_id) for d in lineas if d.producto_reventa_id],
+    }
+    for modelo in inventario.ORDEN_BLOQUEO:
+        movimientos = por_tabla.get(modelo)
+        if movimientos:
+            inventario.ajustar_stock(db, modelo, inventario.acumular((id_, delta) for id_, delta, _ in movimientos),
+                                     "Compra", validar=validar, movimientos=False)
+            kardex.registrar_por_documento(db, modelo, movimientos, "Compra")
+
+def _marcar_recibido(db: Session, completas: Iterable[int], parciales: Dict[int, int], revertir: bool = False):
+    """cantidadRecibida: órdenes completas (o revertidas) por orden, líneas parciales con VALUES."""
+    tabla = models.DetalleOrdenCompra.__table__
+    completas = list(completas)
+    if completas:
+        db.execute(
+            update(tabla)
+            .where(tabla.c.orden_compra_id.in_(completas))
+            .values(cantidadrecibida=0 if revertir else tabla.c.cantidad)
+        )
+    if parciales:
+        v = values(column("id", Integer), column("delta", Integer), name="v").data(sorted(parciales.items()))
+        db.execute(
+            update(tabla)
+            .where(tabla.c.id == v.c.id)
+            .values(cantidadrecibida=tabla.c.cantidadrecibida + v.c.delta)
+        )
+
+def _fijar_estados(db: Session, estados: Dict[int, str]):
+    """Un UPDATE por estado destino."""
+    oc = models.OrdenCompra
+    por_estado: Dict[str, List[int]] = {}
+    for id_, estado in estados.items():
+        por_estado.setdefault(estado, []).append(id_)
+    for estado, ids in por_estado.items():
+        db.execute(update(oc).where(oc.id.in_(ids)).values(estado=estado).execution_options(synchronize_session=False))
+
+def recibir(db: Session, ordenes: Iterable[int] = (), lineas: Optional[Dict[int, int]] = None) -> List[int]:
+    """
+    Recibe todo lo pendiente de `ordenes` más las cantidades parciales de `lineas`
+    ({detalle_id: cantidad}). Devuelve los ids de las órdenes afectadas.
+    """
+    completas = set(ordenes)
+    lineas = lineas or {}
+    d = models.DetalleOrdenCompra
+
+    parciales = set()
+    if lineas:
+        encontradas = dict(db.execute(select(d.id, d.orden_compra_id).where(d.id.in_(list(lineas)))).all())
+        faltantes = set(lineas) - set(encontradas)
+        if faltantes:
+            raise HTTPException(404, f"Detalle no encontrado (id {_lista(faltantes)})")
+        parciales = set(encontradas.values())
+        if parciales & completas:
+            raise HTTPException(400, f"Órdenes indicadas completas y por línea a la vez: {_lista(parciales & completas)}")
+    if not completas and not parciales:
+        return []
+
+    estados = _bloquear_ordenes(db, completas | parciales)
+    cerradas = [id_ for id_, estado in estados.items() if estado not in ESTADOS_RECIBIBLES]
+    if cerradas:
+        raise HTTPException(400, f"Órdenes que no admiten recepción: {_lista(cerradas)}")
+
+    detalles = _detalles(db, estados)
+    recibido: Dict[int, int] = {}
+    for det in detalles:
+        pendiente = det.cantidad - det.cantidadRecibida
+        cantidad = pendiente if det.orden_compra_id in completas else lineas.get(det.id, 0)
+        if cantidad < 0 or cantidad > pendiente:
+            raise HTTPException(400, f"Cantidad inválida para el detalle {det.id} (pendiente: {pendiente})")
+        recibido[det.id] = cantidad
+
+    _aplicar(db, detalles, recibido, validar=False)
+    _marcar_recibido(db, completas, {i: q for i, q in lineas.items() if q})
+
+    # Estado: todo recibido -> Recibida; algo recibido -> Parcial
+    completa = dict.fromkeys(estados, True)
+    con_recepcion = dict.fromkeys(estados, False)
+    for det in detalles:
+        total = det.cantidadRecibida + recibido[det.id]
+        completa[det.orden_compra_id] &= total >= det.cantidad
+        con_recepcion[det.orden_compra_id] |= total > 0
+    _fijar_estados(db, {
+        id_: ESTADO_RECIBIDA if completa[id_] else ESTADO_PARCIAL
+        for id_ in estados if completa[id_] or con_recepcion[id_]
+    })
+    return sorted(estados)
+
+def revertir(db: Session, ordenes: Iterable[int], validar: bool = True) -> List[int]:
+    """Devuelve al proveedor todo lo recibido de `ordenes` y las deja en 'Solicitada'."""
+    estados = _bloquear_ordenes(db, ordenes)
+    sin_recepcion = [id_ for id_, estado in estados.items() if estado not in ESTADOS_CON_RECEPCION]
+    if sin_recepcion:
+        raise HTTPException(400, f"Órdenes sin recepciones que revertir: {_lista(sin_recepcion)}")
+
+    # Una orden 'Recibida' tiene todas sus líneas recibidas: se revierte `cantidad` (las
+    # recibidas antes de existir cantidadRecibida lo tienen en 0)
+    detalles = _detalles(db, estados)
+    _aplicar(db, detalles, {
+        det.id: -(det.cantidad if estados[det.orden_compra_id] == ESTADO_RECIBIDA else det.cantidadRecibida)
+        for det in detalles
+    }, validar=validar)
+    _marcar_recibido(db, estados, {}, revertir=True)
+    _fijar_estados(db, {id_: ESTADO_SOLICITADA for id_ in estados})
+    return sorted(estados)
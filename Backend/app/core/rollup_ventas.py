@@ -0,0 +1,97 @@
+from typing import Iterable
+from sqlalchemy import select, delete, func, case, cast, literal, Date
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models import models
+
+# Rollup diario (día x canal x SKU) de ventas.
+# Cada operación de ventas suma o resta su aporte con un único
+# INSERT ... SELECT ... ON CONFLICT DO UPDATE, dentro de la transacción del router.
+# Las filas que quedan en cero (se borraron o revirtieron todas sus ventas) se
+# eliminan: no deben impedir borrar el canal o el producto.
+
+_COLUMNAS = [
+    "fecha", "canal_venta_id", "sku", "variante_producto_id", "producto_reventa_id",
+    "unidades", "ingresos", "unidadesdevueltas", "ingresosdevueltos"
+]
+
+def _aporte(condicion, factor_ventas, factor_devoluciones):
+    ov = models.OrdenVenta
+    d = models.DetalleOrdenVenta
+
+    sku = case(
+        (d.variante_producto_id.isnot(None), func.concat("var-", d.variante_producto_id)),
+        else_=func.concat("rev-", d.producto_reventa_id)
+    )
+    importe = d.cantidad * d.precioUnitario
+
+    return (
+        select(
+            cast(ov.fecha, Date),
+            ov.canal_venta_id,
+            sku,
+            d.variante_producto_id,
+            d.producto_reventa_id,
+            func.sum(d.cantidad * factor_ventas),
+            func.sum(importe * factor_ventas),
+            func.sum(d.cantidad * factor_devoluciones),
+            func.sum(importe * factor_devoluciones)
+        )
+        .select_from(d)
+        .join(ov, ov.id == d.orden_venta_id)
+        .where(condicion)
+        .where((d.variante_producto_id.isnot(None)) | (d.producto_reventa_id.isnot(None)))
+        .group_by(cast(ov.fecha, Date), ov.canal_venta_id, sku, d.variante_producto_id, d.producto_reventa_id)
+    )
+
+def _upsert(db: Session, consulta):
+    vd = models.VentaDiaria
+    stmt = insert(vd).from_select(_COLUMNAS, consulta)
+    stmt = stmt.on_conflict_do_update(
+        constraint="_venta_diaria_uc",
+        set_={
+            "unidades": vd.unidades + stmt.excluded.unidades,
+            "ingresos": vd.ingresos + stmt.excluded.ingresos,
+            "unidadesdevueltas": vd.unidadesDevueltas + stmt.excluded.unidadesdevueltas,
+            "ingresosdevueltos": vd.ingresosDevueltos + stmt.excluded.ingresosdevueltos,
+        }
+    )
+    vacias = [
+        id_ for id_, *contadores in db.execute(
+            stmt.returning(vd.id, vd.unidades, vd.ingresos, vd.unidadesDevueltas, vd.ingresosDevueltos)
+        )
+        if not any(contadores)
+    ]
+    if vacias:
+        db.execute(delete(vd).where(vd.id.in_(vacias)))
+
+def registrar(db: Session, orden_ids: Iterable[int], ventas: int = 0, devoluciones: int = 0):
+    """
+    Suma (1) o resta (-1) el aporte de las órdenes al rollup.
+    `ventas` afecta unidades/ingresos y `devoluciones` unidades/ingresos devueltos.
+    Los detalles deben estar ya en la BD (hacer db.flush() antes).
+    """
+    orden_ids = list(orden_ids)
+    if not orden_ids or (ventas == 0 and devoluciones == 0):
+        return
+    condicion = models.OrdenVenta.id.in_(orden_ids)
+    _upsert(db, _aporte(condicion, literal(ventas), literal(devoluciones)))
+
+def reconstruir(db: Session):
+    """Recalcula el rollup completo a partir del histórico de ventas."""
+    es_devolucion = case((models.OrdenVenta.estado == "Devolución", 1), else_=0)
+    db.execute(delete(models.VentaDiaria))
+    _upsert(db, _aporte(literal(True), literal(1), es_devolucion))
+    db.commit()
+
+if __name__ == "__main__":
+    # Backfill: python -m app.core.rollup_ventas
+    from app.core.database import SessionLocal, engine, Base
+    Base.metadata.create_all(bind=engine, tables=[models.VentaDiaria.__table__])
+    db = SessionLocal()
+    try:
+        reconstruir(db)
+        total = db.query(func.count(models.VentaDiaria.id)).scalar()
+        print(f"Rollup de ventas reconstruido: {total} filas")
+    finally:
+        db.close()
@@ -0,0 +1,32 @@
+import asyncio
+import logging
+from typing import Callable, List, Tuple
+
+# Tareas periódicas en segundo plano (se inician con la app, ver main.py).
+# Cada función es síncrona (usa la BD) y se ejecuta en un hilo para no
+# bloquear el event loop de la API.
+logger = logging.getLogger(__name__)
+
+_registradas: List[Tuple[str, float, Callable[[], None]]] = []
+_activas: List[asyncio.Task] = []
+
+def registrar(nombre: str, intervalo: float, funcion: Callable[[], None]):
+    _registradas.append((nombre, intervalo, funcion))
+
+async def _bucle(nombre: str, intervalo: float, funcion: Callable[[], None]):
+    while True:
+        try:
+            await asyncio.to_thread(funcion)
+        except Exception:
+            logger.exception("Error en la tarea periódica '%s'", nombre)
+        await asyncio.sleep(intervalo)
+
+def iniciar():
+    for nombre, intervalo, funcion in _registradas:
+        _activas.append(asyncio.create_task(_bucle(nombre, intervalo, funcion), name=nombre))
+
+async def detener():
+    for tarea in _activas:
+        tarea.cancel()
+    await asyncio.gather(*_activas, return_exceptions=True)
+    _activas.clear()
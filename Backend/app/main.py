@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.database import engine, Base
+from app.core import tareas, ai_service, canasta, idempotencia, kardex, instrumentacion, meli, bandeja_salida, notificaciones, publicaciones
 from app.routers import auth, dashboard, productos, materia_prima, compras, produccion, ventas, reportes, usuarios, ia, sincronizacion
 
 # Crear las tablas en la base de datos (si no existen)
@@ -20,8 +21,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "Server-Timing", "ETag"],  # Cursor de paginación, reintentos idempotentes, métricas SQL y versión del catálogo
 )
 
+# Conteo de consultas SQL por request (Server-Timing + log, ver core/instrumentacion.py)
+app.middleware("http")(instrumentacion.medir_solicitud)
+
 # Incluir routers
 app.include_router(auth.router)
 app.include_router(dashboard.router)
@@ -35,6 +40,27 @@ app.include_router(usuarios.router)
 app.include_router(ia.router)
 app.include_router(sincronizacion.router)
 
+# Tareas en segundo plano
+tareas.registrar("analisis_ia", ai_service.INTERVALO_REVISION, ai_service.revisar_snapshot)
+tareas.registrar("canasta", canasta.INTERVALO_ACTUALIZACION, canasta.actualizar)
+tareas.registrar("idempotencia", idempotencia.INTERVALO_PURGA, idempotencia.purgar)
+tareas.registrar("kardex", kardex.INTERVALO_SNAPSHOT, kardex.compactar_periodico)
+tareas.registrar("bandeja_salida", bandeja_salida.INTERVALO_DESPACHO, bandeja_salida.despachar_periodico)
+tareas.registrar("notificaciones", notificaciones.INTERVALO_PURGA, notificaciones.purgar)
+tareas.registrar("conciliacion_meli", publicaciones.INTERVALO_CONCILIACION, publicaciones.conciliar_periodico)
+
+@app.on_event("startup")
+async def iniciar_tareas():
+    meli.iniciar() # Antes de las tareas: la bandeja de salida y las notificaciones usan el cliente
+    tareas.iniciar()
+    notificaciones.iniciar() # Trabajadores del webhook de órdenes
+
+@app.on_event("shutdown")
+async def detener_tareas():
+    await notificaciones.detener()
+    await tareas.detener()
+    await meli.detener()
+
 @app.get("/")
 def read_root():
     return {"message": "Bienvenido a la API de InventIA"}
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DECIMAL, Text, TIMESTAMP, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DECIMAL, Text, TIMESTAMP, Boolean, Date, UniqueConstraint, Index, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -40,7 +40,7 @@ class VarianteProducto(Base):
     producto_fabricado_id = Column("producto_fabricado_id", Integer, ForeignKey("productofabricado.id"), nullable=False)
     
     # NUEVO: ID de publicación en Mercado Libre (Si es NULL, no está publicado)
-    meli_id = Column(String(50), nullable=True) 
+    meli_id = Column(String(50), nullable=True, unique=True, index=True) 
 
     producto_fabricado = relationship("ProductoFabricado", back_populates="variantes")
 
@@ -54,7 +54,7 @@ class ProductoReventa(Base):
     stockActual = Column("stockactual", Integer, nullable=False, default=0)
     proveedor_id = Column(Integer, ForeignKey("proveedor.id"))
     # NUEVO: ID de publicación en Mercado Libre
-    meli_id = Column(String(50), nullable=True)
+    meli_id = Column(String(50), nullable=True, unique=True, index=True)
     proveedor = relationship("Proveedor")
 
 # --- Materia Prima ---
@@ -77,12 +77,14 @@ class OrdenCompra(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     fecha = Column(TIMESTAMP, server_default=func.now(), nullable=False)
-    estado = Column(String(50), nullable=False, default='Solicitada') # 'Solicitada', 'Recibida'
+    estado = Column(String(50), nullable=False, default='Solicitada') # 'Borrador', 'Solicitada', 'Parcial', 'Recibida'
     proveedor_id = Column(Integer, ForeignKey("proveedor.id"))
 
     proveedor = relationship("Proveedor")
     detalles = relationship("DetalleOrdenCompra", back_populates="orden_compra")
 
+    __table_args__ = (Index('ix_ordencompra_fecha_id', 'fecha', 'id'),)
+
 # --- Detalle Orden de Compra ---
 class DetalleOrdenCompra(Base):
     __tablename__ = "detalleordencompra"
@@ -90,6 +92,7 @@ class DetalleOrdenCompra(Base):
     id = Column(Integer, primary_key=True, index=True)
     cantidad = Column(Integer, nullable=False)
     costoUnitario = Column("costounitario", DECIMAL(10, 2), nullable=False)
+    cantidadRecibida = Column("cantidadrecibida", Integer, nullable=False, default=0, server_default="0") # Recepciones parciales
     orden_compra_id = Column("orden_compra_id", Integer, ForeignKey("ordencompra.id"))
     
     # Polimorfismo: puede ser materia prima O producto de reventa
@@ -125,6 +128,8 @@ class OrdenProduccion(Base):
 
     variante = relationship("VarianteProducto")
 
+    __table_args__ = (Index('ix_ordenproduccion_fecha_id', 'fechacreacion', 'id'),)
+
 # --- Canales de Venta ---
 class CanalVenta(Base):
     __tablename__ = "canalventa"
@@ -144,6 +149,8 @@ class OrdenVenta(Base):
     usuario = relationship("Usuario")
     detalles = relationship("DetalleOrdenVenta", back_populates="orden_venta", cascade="all, delete")
 
+    __table_args__ = (Index('ix_ordenventa_fecha_id', 'fecha', 'id'),)
+
 # --- Detalle Orden de Venta ---
 class DetalleOrdenVenta(Base):
     __tablename__ = "detalleordenventa"
@@ -158,4 +165,213 @@ class DetalleOrdenVenta(Base):
 
     orden_venta = relationship("OrdenVenta", back_populates="detalles")
     variante = relationship("VarianteProducto")
-    producto_reventa = relationship("ProductoReventa")
\ No newline at end of file
+    producto_reventa = relationship("ProductoReventa")
+
+# --- Resumen Diario de Ventas (Rollup día x canal x SKU) ---
+# Se mantiene en la misma transacción que las ventas (ver core/rollup_ventas.py)
+class VentaDiaria(Base):
+    __tablename__ = "ventadiaria"
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(Date, nullable=False)
+    canal_venta_id = Column("canal_venta_id", Integer, ForeignKey("canalventa.id"), nullable=False)
+    sku = Column(String(20), nullable=False) # "var-1" o "rev-2"
+    variante_producto_id = Column("variante_producto_id", Integer, ForeignKey("varianteproducto.id"), nullable=True)
+    producto_reventa_id = Column("producto_reventa_id", Integer, ForeignKey("productoreventa.id"), nullable=True)
+    unidades = Column(Integer, nullable=False, default=0)
+    ingresos = Column(DECIMAL(12, 2), nullable=False, default=0)
+    unidadesDevueltas = Column("unidadesdevueltas", Integer, nullable=False, default=0)
+    ingresosDevueltos = Column("ingresosdevueltos", DECIMAL(12, 2), nullable=False, default=0)
+
+    canal = relationship("CanalVenta")
+
+    __table_args__ = (UniqueConstraint('fecha', 'canal_venta_id', 'sku', name='_venta_diaria_uc'),)
+
+# --- Pronóstico de Demanda (Resultado persistido por ejecución) ---
+class PronosticoDemanda(Base):
+    __tablename__ = "pronosticodemanda"
+    id = Column(Integer, primary_key=True, index=True)
+    fecha_ejecucion = Column(TIMESTAMP, nullable=False, index=True)
+    variante_producto_id = Column("variante_producto_id", Integer, ForeignKey("varianteproducto.id", ondelete="CASCADE"), nullable=True)
+    producto_reventa_id = Column("producto_reventa_id", Integer, ForeignKey("productoreventa.id", ondelete="CASCADE"), nullable=True)
+    semana = Column(Integer, nullable=False) # 1 = próxima semana
+    cantidad = Column(DECIMAL(12, 2), nullable=False)
+    metodo = Column(String(50), nullable=False) # 'Holt-Winters', 'Croston-SBA'
+
+# --- Claves de Idempotencia (POST que crean órdenes) ---
+# Se inserta y completa en la misma transacción que la orden (ver core/idempotencia.py)
+class ClaveIdempotencia(Base):
+    __tablename__ = "claveidempotencia"
+    id = Column(Integer, primary_key=True, index=True)
+    clave = Column(String(300), nullable=False, unique=True) # "POST /ventas/:<Idempotency-Key>"
+    huella = Column(String(64), nullable=False) # SHA-256 del cuerpo de la solicitud
+    respuesta = Column(Text, nullable=True) # JSON de la respuesta original (se escribe antes del COMMIT)
+    creada = Column(TIMESTAMP, server_default=func.now(), nullable=False, index=True)
+
+# --- Kardex: Movimientos de Inventario (solo inserción) ---
+# Todo cambio de stock pasa por core/inventario.py y deja aquí su movimiento
+class MovimientoInventario(Base):
+    __tablename__ = "movimientoinventario"
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    sku = Column(String(20), nullable=False) # "var-1", "rev-2" o "mat-3"
+    cantidad = Column(Integer, nullable=False) # Positivo: entrada, negativo: salida
+    documento = Column(String(30), nullable=False) # 'Venta', 'Compra', 'Producción', 'Ajuste', 'Alta', 'Sincronización'
+    documento_id = Column(Integer, nullable=True) # Id de la orden (o del producto en altas/ajustes)
+
+    __table_args__ = (
+        Index('ix_movimientoinventario_fecha', 'fecha'),
+        Index('ix_movimientoinventario_sku_fecha', 'sku', 'fecha'),
+    )
+
+# --- Snapshots de Inventario (compactación periódica del kardex) ---
+class SnapshotInventario(Base):
+    __tablename__ = "snapshotinventario"
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(TIMESTAMP, nullable=False) # Corte: incluye los movimientos con fecha <= corte
+    sku = Column(String(20), nullable=False)
+    stock = Column(Integer, nullable=False)
+
+    __table_args__ = (UniqueConstraint('fecha', 'sku', name='_snapshot_inventario_uc'),)
+
+# --- Bandeja de Salida (cambios de stock/precio pendientes de enviar a Mercado Libre) ---
+class CambioPublicacion(Base):
+    __tablename__ = "cambiopublicacion"
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    sku = Column(String(20), nullable=False) # "var-1" o "rev-2" (solo productos con meli_id)
+    campo = Column(String(20), nullable=False) # 'stock' o 'precio'
+    intentos = Column(Integer, nullable=False, default=0, server_default="0")
+    tomada = Column(TIMESTAMP, nullable=True) # Despacho en curso (ver ARRENDAMIENTO en core/bandeja_salida.py)
+
+    __table_args__ = (Index('ix_cambiopublicacion_sku', 'sku'),)
+
+# --- Notificaciones de Marketplace (webhook: cola durable de órdenes entrantes) ---
+class NotificacionMarketplace(Base):
+    __tablename__ = "notificacionmarketplace"
+    id = Column(Integer, primary_key=True, index=True)
+    notificacion_id = Column(String(100), unique=True, nullable=False) # _id de la notificación (deduplicación)
+    topic = Column(String(50))
+    recurso = Column(String(255)) # ej. /orders/2000003508419013
+    orden_externa = Column(String(50)) # Id de la orden en el marketplace
+    payload = Column(Text, nullable=False)
+    estado = Column(String(20), nullable=False, default="Pendiente") # 'Pendiente', 'Procesada', 'Descartada', 'Error'
+    intentos = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(Text)
+    orden_venta_id = Column(Integer, ForeignKey("ordenventa.id", ondelete="SET NULL"), nullable=True)
+    recibida = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    disponible = Column(TIMESTAMP, server_default=func.now(), nullable=False) # Próximo intento (backoff)
+    procesada = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index('ix_notificacionmarketplace_estado_id', 'estado', 'id'),
+        Index('ix_notificacionmarketplace_orden_externa', 'orden_externa'),
+    )
+
+# --- Versión del Catálogo (ETag de /sincronizacion/productos) ---
+# Contador repartido en SEGMENTOS filas: al confirmar, cada transacción que cambia una
+# columna visible del catálogo (constraint triggers diferidos) incrementa la fila de su
+# txid, una vez por transacción. La versión es la suma de las filas: solo crece, y un
+# cambio confirmado siempre queda contado en cualquier lectura posterior. Repartirlo
+# evita que todos los COMMIT que tocan stock se serialicen en el bloqueo de una fila.
+class VersionCatalogo(Base):
+    __tablename__ = "versioncatalogo"
+    id = Column(Integer, primary_key=True) # Segmento: mod(txid, SEGMENTOS_VERSION_CATALOGO)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    transaccion = Column(BigInteger, nullable=True) # Última transacción que la incrementó
+
+SEGMENTOS_VERSION_CATALOGO = 64
+
+# Columnas que expone /sincronizacion/productos: cambiar otras no cambia la versión
+COLUMNAS_CATALOGO = {
+    "varianteproducto": ("color", "talla", "stockactual", "meli_id", "producto_fabricado_id"),
+    "productoreventa": ("nombre", "precioventa", "stockactual", "meli_id"),
+    "productofabricado": ("nombre", "precioventa"),
+}
+
+_FUNCION_VERSION_CATALOGO = f"""
+CREATE OR REPLACE FUNCTION incrementar_version_catalogo() RETURNS trigger AS $$
+BEGIN
+    -- Disparo por fila: solo el primero de la transacción escribe
+    IF current_setting('inventia.version_catalogo', true) IS DISTINCT FROM '1' THEN
+        INSERT INTO versioncatalogo (id, version, transaccion)
+        VALUES (mod(txid_current(), {SEGMENTOS_VERSION_CATALOGO}), 1, txid_current())
+        ON CONFLICT (id) DO UPDATE SET version = versioncatalogo.version + 1, transaccion = EXCLUDED.transaccion
+        WHERE versioncatalogo.transaccion IS DISTINCT FROM EXCLUDED.transaccion;
+        PERFORM set_config('inventia.version_catalogo', '1', true);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql
+"""
+
+def _trigger_version_catalogo(tabla: str, columnas) -> str:
+    antes = ", ".join(f"OLD.{c}" for c in columnas)
+    despues = ", ".join(f"NEW.{c}" for c in columnas)
+    return f"""
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'tr_version_catalogo_alta_{tabla}') THEN
+        CREATE CONSTRAINT TRIGGER tr_version_catalogo_alta_{tabla}
+        AFTER INSERT OR DELETE ON {tabla}
+        DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION incrementar_version_catalogo();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'tr_version_catalogo_cambio_{tabla}') THEN
+        CREATE CONSTRAINT TRIGGER tr_version_catalogo_cambio_{tabla}
+        AFTER UPDATE ON {tabla}
+        DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+        WHEN (({antes}) IS DISTINCT FROM ({despues}))
+        EXECUTE FUNCTION incrementar_version_catalogo();
+    END IF;
+END $$
+"""
+
+# Después de create_all (también sobre una base existente: las sentencias son idempotentes)
+event.listen(Base.metadata, "after_create", DDL(_FUNCION_VERSION_CATALOGO).execute_if(dialect="postgresql"))
+for _tabla, _columnas in COLUMNAS_CATALOGO.items():
+    event.listen(Base.metadata, "after_create", DDL(_trigger_version_catalogo(_tabla, _columnas)).execute_if(dialect="postgresql"))
+
+# --- Publicaciones de Mercado Libre (meli_id -> SKU) ---
+# Mapeo único de cada meli_id al producto que lo tiene ("var-N" / "rev-N"). Lo mantienen
+# triggers de VarianteProducto y ProductoReventa al asignar, cambiar o quitar meli_id:
+# la clave primaria impide que una misma publicación quede vinculada en ambas tablas
+# (el índice único de cada tabla solo la protege dentro de esa tabla).
+class PublicacionMeLi(Base):
+    __tablename__ = "publicacionmeli"
+    meli_id = Column(String(50), primary_key=True)
+    sku = Column(String(20), nullable=False, unique=True)
+
+TABLAS_PUBLICABLES = {"varianteproducto": "var-", "productoreventa": "rev-"}
+
+_FUNCION_PUBLICACION_MELI = """
+CREATE OR REPLACE FUNCTION mapear_publicacion_meli() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.meli_id IS NOT DISTINCT FROM NEW.meli_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.meli_id IS NOT NULL THEN
+        DELETE FROM publicacionmeli WHERE meli_id = OLD.meli_id AND sku = TG_ARGV[0] || OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.meli_id IS NOT NULL THEN
+        -- Si otro producto ya tiene la publicación falla con unique_violation
+        INSERT INTO publicacionmeli (meli_id, sku) VALUES (NEW.meli_id, TG_ARGV[0] || NEW.id);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql
+"""
+
+def _trigger_publicacion_meli(tabla: str, prefijo: str) -> str:
+    return f"""
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'tr_publicacion_meli_{tabla}') THEN
+        CREATE TRIGGER tr_publicacion_meli_{tabla}
+        AFTER INSERT OR UPDATE OF meli_id OR DELETE ON {tabla}
+        FOR EACH ROW EXECUTE FUNCTION mapear_publicacion_meli('{prefijo}');
+        -- Base existente: vincula los meli_id asignados antes del trigger
+        INSERT INTO publicacionmeli (meli_id, sku)
+        SELECT meli_id, '{prefijo}' || id FROM {tabla} WHERE meli_id IS NOT NULL ORDER BY id
+        ON CONFLICT DO NOTHING;
+    END IF;
+END $$
+"""
+
+event.listen(Base.metadata, "after_create", DDL(_FUNCION_PUBLICACION_MELI).execute_if(dialect="postgresql"))
+for _tabla, _prefijo in TABLAS_PUBLICABLES.items():
+    event.listen(Base.metadata, "after_create", DDL(_trigger_publicacion_meli(_tabla, _prefijo)).execute_if(dialect="postgresql"))
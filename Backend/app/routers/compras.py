@@ -1,23 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional
+from datetime import date
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.core import security
+from app.core import security, paginacion, cache, reabastecimiento, idempotencia, inventario, instrumentacion, recepcion
 
 router = APIRouter(
     prefix="/compras",
     tags=["compras"]
 )
 
+# Carga anticipada de todo lo que serializa OrdenCompraResponse (2 consultas sin importar cuántas órdenes)
+CARGA_ORDEN_COMPRA = (
+    joinedload(models.OrdenCompra.proveedor),
+    selectinload(models.OrdenCompra.detalles).options(
+        joinedload(models.DetalleOrdenCompra.materia_prima).joinedload(models.MateriaPrima.proveedor),
+        joinedload(models.DetalleOrdenCompra.producto_reventa).joinedload(models.ProductoReventa.proveedor),
+    ),
+)
+
+def _cargar_orden(db: Session, id: int) -> models.OrdenCompra:
+    return db.query(models.OrdenCompra).options(*CARGA_ORDEN_COMPRA).populate_existing().filter(models.OrdenCompra.id == id).one()
+
 # --- Crear Orden de Compra ---
 @router.post("/", response_model=schemas.OrdenCompraResponse)
 def create_orden_compra(
     orden: schemas.OrdenCompraCreate, 
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(security.get_current_user)
 ):
+    cuerpo = idempotencia.ejecutar(
+        response, db, idempotency_key, "POST /compras/", orden, schemas.OrdenCompraResponse,
+        lambda: _crear_orden_compra(orden, db)
+    )
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return cuerpo
+
+def _crear_orden_compra(orden: schemas.OrdenCompraCreate, db: Session):
     # 1. Crear la cabecera de la orden
     db_orden = models.OrdenCompra(
         proveedor_id=orden.proveedor_id,
@@ -40,14 +63,71 @@ def create_orden_compra(
         )
         db.add(db_detalle)
     
-    db.commit()
-    db.refresh(db_orden)
-    return db_orden
+    db.flush()
+    return _cargar_orden(db, db_orden.id)
 
 # --- Listar Órdenes ---
-@router.get("/", response_model=List[schemas.OrdenCompraResponse])
-def read_ordenes_compra(db: Session = Depends(get_db)):
-    return db.query(models.OrdenCompra).order_by(models.OrdenCompra.fecha.desc()).all()
+@router.get("/", response_model=List[schemas.OrdenCompraResponse], dependencies=[Depends(instrumentacion.presupuesto(2))])
+def read_ordenes_compra(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    estado: Optional[str] = None,
+    proveedor_id: Optional[int] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.OrdenCompra).options(*CARGA_ORDEN_COMPRA)
+    if estado: query = query.filter(models.OrdenCompra.estado == estado)
+    if proveedor_id: query = query.filter(models.OrdenCompra.proveedor_id == proveedor_id)
+    query = paginacion.rango_fechas(query, models.OrdenCompra.fecha, fecha_desde, fecha_hasta)
+    return paginacion.paginar(query, response, cursor, limite, models.OrdenCompra.fecha, models.OrdenCompra.id)
+
+# --- Reabastecimiento: Punto de Reorden y EOQ ---
+@router.get("/reabastecimiento", response_model=List[schemas.ReabastecimientoItem])
+def get_reabastecimiento(
+    dias_entrega: int = Query(reabastecimiento.DIAS_ENTREGA, ge=1, le=180),
+    nivel_servicio: float = Query(reabastecimiento.NIVEL_SERVICIO, gt=0.5, lt=1),
+    costo_pedido: float = Query(reabastecimiento.COSTO_PEDIDO, gt=0),
+    db: Session = Depends(get_db)
+):
+    return reabastecimiento.calcular(db, dias_entrega, nivel_servicio, costo_pedido)
+
+# Genera órdenes en estado 'Borrador' (una por proveedor) con lo que hay que reordenar
+@router.post("/reabastecimiento/generar", response_model=schemas.BorradoresCompraResponse)
+def generar_borradores_compra(
+    dias_entrega: int = Query(reabastecimiento.DIAS_ENTREGA, ge=1, le=180),
+    nivel_servicio: float = Query(reabastecimiento.NIVEL_SERVICIO, gt=0.5, lt=1),
+    costo_pedido: float = Query(reabastecimiento.COSTO_PEDIDO, gt=0),
+    db: Session = Depends(get_db),
+    current_user: models.Usuario = Depends(security.get_current_user)
+):
+    sugerencias = reabastecimiento.calcular(db, dias_entrega, nivel_servicio, costo_pedido)
+    resultado = reabastecimiento.generar_borradores(db, sugerencias)
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return resultado
+
+# --- Recepción en bloque (un camión con varias órdenes, o parcial por línea) ---
+def _cargar_ordenes(db: Session, ids: List[int]) -> List[models.OrdenCompra]:
+    return db.query(models.OrdenCompra).options(*CARGA_ORDEN_COMPRA).populate_existing()\
+        .filter(models.OrdenCompra.id.in_(ids)).order_by(models.OrdenCompra.id).all()
+
+@router.put("/recibir-lote", response_model=List[schemas.OrdenCompraResponse])
+def recibir_lote(lote: schemas.RecepcionLoteRequest, db: Session = Depends(get_db)):
+    ids = recepcion.recibir(db, lote.ordenes, inventario.acumular((l.detalle_id, l.cantidad) for l in lote.lineas))
+    if not ids: raise HTTPException(400, "No se indicaron órdenes ni líneas")
+    db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return _cargar_ordenes(db, ids)
+
+@router.put("/revertir-lote", response_model=List[schemas.OrdenCompraResponse])
+def revertir_lote(lote: schemas.ReversionLoteRequest, db: Session = Depends(get_db)):
+    if not lote.ordenes: raise HTTPException(400, "No se indicaron órdenes")
+    ids = recepcion.revertir(db, lote.ordenes)
+    db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return _cargar_ordenes(db, ids)
 
 # --- Recibir Orden (Actualizar Stock) ---
 @router.put("/{orden_id}/recibir", response_model=schemas.OrdenCompraResponse)
@@ -63,38 +143,29 @@ def update_orden_compra(id: int, update: schemas.OrdenCompraUpdate, db: Session
     estado_ant = orden.estado
     nuevo = update.estado
 
-    # 1. Solicitada -> Recibida (Aumentar Stock)
-    if estado_ant == "Solicitada" and nuevo == "Recibida":
-        for d in orden.detalles:
-            if d.materia_prima: d.materia_prima.stockActual += d.cantidad
-            if d.producto_reventa: d.producto_reventa.stockActual += d.cantidad
+    # 1. Solicitada (Borrador o Parcial) -> Recibida (Aumentar Stock con lo pendiente)
+    if estado_ant in recepcion.ESTADOS_RECIBIBLES and nuevo == "Recibida":
+        recepcion.recibir(db, [orden.id])
     
-    # 2. Recibida -> Solicitada (Disminuir Stock - Corrección de error)
-    elif estado_ant == "Recibida" and nuevo == "Solicitada":
-        for d in orden.detalles:
-            if d.materia_prima:
-                if d.materia_prima.stockActual < d.cantidad: raise HTTPException(400, "No se puede revertir: stock ya utilizado.")
-                d.materia_prima.stockActual -= d.cantidad
-            if d.producto_reventa:
-                if d.producto_reventa.stockActual < d.cantidad: raise HTTPException(400, "No se puede revertir: stock ya vendido.")
-                d.producto_reventa.stockActual -= d.cantidad
+    # 2. Recibida (o Parcial) -> Solicitada (Disminuir Stock - Corrección de error)
+    elif estado_ant in recepcion.ESTADOS_CON_RECEPCION and nuevo == "Solicitada":
+        recepcion.revertir(db, [orden.id])
 
     if nuevo: orden.estado = nuevo
     db.commit()
-    db.refresh(orden)
-    return orden
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return _cargar_orden(db, orden.id)
 
 @router.delete("/{id}")
 def delete_orden_compra(id: int, db: Session = Depends(get_db)):
     orden = db.query(models.OrdenCompra).filter(models.OrdenCompra.id == id).first()
     if not orden: raise HTTPException(404, "Orden no encontrada")
     
-    # Revertir stock si ya fue recibida
-    if orden.estado == "Recibida":
-        for d in orden.detalles:
-            if d.materia_prima: d.materia_prima.stockActual -= d.cantidad
-            if d.producto_reventa: d.producto_reventa.stockActual -= d.cantidad
+    # Revertir stock si ya fue recibida (total o parcialmente)
+    if orden.estado in recepcion.ESTADOS_CON_RECEPCION:
+        recepcion.revertir(db, [orden.id], validar=False)
 
     db.delete(orden)
     db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
     return {"ok": True}
\ No newline at end of file
@@ -1,26 +1,89 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import select, func, case, and_
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+from app.core.database import get_db
 from app.schemas import schemas
 from app.models import models
-from app.core import security
+from app.core import security, cache, bom
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["dashboard"]
 )
 
+# La clave cache.CLAVE_DASHBOARD la invalidan ventas, compras y producción al hacer commit
+TTL_STATS = 10  # segundos
+DIAS_VENTANA = 30
+
+def _formatear_duracion(segundos) -> str:
+    if segundos is None:
+        return "N/A"
+    minutos = float(segundos) / 60
+    if minutos < 60:
+        return f"{round(minutos)} min"
+    if minutos < 60 * 24:
+        return f"{minutos / 60:.1f} h"
+    return f"{minutos / (60 * 24):.1f} días"
+
+def _calcular_stats(db: Session) -> dict:
+    desde = date.today() - timedelta(days=DIAS_VENTANA - 1)
+    vd = models.VentaDiaria
+
+    # 1. Salud por canal (lee el rollup diario: pocas filas por día)
+    por_canal = db.query(
+        models.CanalVenta.nombre,
+        func.coalesce(func.sum(vd.unidades - vd.unidadesDevueltas), 0).label("unidades"),
+        func.coalesce(func.sum(vd.ingresos - vd.ingresosDevueltos), 0).label("ingresos"),
+        func.max(case((vd.unidades > 0, vd.fecha))).label("ultima_venta")
+    ).outerjoin(vd, and_(vd.canal_venta_id == models.CanalVenta.id, vd.fecha >= desde)) \
+     .group_by(models.CanalVenta.id, models.CanalVenta.nombre) \
+     .order_by(models.CanalVenta.nombre).all()
+
+    canales = [{
+        "canal": c.nombre,
+        "unidades": int(c.unidades),
+        "ventas_netas": float(c.ingresos),
+        "ultima_venta": c.ultima_venta,
+        "activo": c.ultima_venta is not None
+    } for c in por_canal]
+
+    # 2. Pendientes (ventas, compras y producción) en una sola consulta
+    def contar(modelo, estado):
+        return select(func.count(modelo.id)).where(modelo.estado == estado).scalar_subquery()
+
+    pendientes = db.execute(select(
+        contar(models.OrdenVenta, "En Proceso")
+        + contar(models.OrdenCompra, "Solicitada")
+        + contar(models.OrdenProduccion, "En Proceso")
+    )).scalar()
+
+    # 3. Tiempo promedio de las órdenes de producción terminadas en la ventana
+    op = models.OrdenProduccion
+    tiempo = db.query(
+        func.avg(func.extract("epoch", op.fechaFinalizacion - op.fechaCreacion))
+    ).filter(op.estado == "Terminado", op.fechaFinalizacion >= desde).scalar()
+
+    # 4. Órdenes de producción abiertas que el stock de materia prima alcanza a cubrir
+    completables = bom.asignar(db)["completables"]
+
+    return {
+        "ventas_netas": round(sum(c["ventas_netas"] for c in canales), 2),
+        "ordenes_pendientes": pendientes or 0,
+        "tiempo_proceso": _formatear_duracion(tiempo),
+        "canales_ok": f"{sum(c['activo'] for c in canales)}/{len(canales)}",
+        "produccion_completable": completables,
+        "canales": canales
+    }
+
 @router.get("/stats", response_model=schemas.DashboardStats)
-async def get_dashboard_stats(current_user: models.Usuario = Depends(security.get_current_user)):
+def get_dashboard_stats(
+    db: Session = Depends(get_db),
+    current_user: models.Usuario = Depends(security.get_current_user)
+):
     """
-    Devuelve estadísticas para el dashboard. 
+    Devuelve estadísticas para el dashboard (últimos 30 días).
     Requiere autenticación (token JWT válido).
+    Se sirve desde caché en proceso (TTL corto, invalidada al escribir).
     """
-    
-    # Aquí conectarías con la DB real para hacer consultas SQL count/sum
-    # Por ahora, devolvemos datos simulados dinámicos
-    
-    return {
-        "ventas_netas": 15430.50,
-        "ordenes_pendientes": 12,
-        "tiempo_proceso": "4 min",
-        "canales_ok": "4/5"
-    }
\ No newline at end of file
+    return cache.obtener(cache.CLAVE_DASHBOARD, TTL_STATS, lambda: _calcular_stats(db))
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
+from typing import Optional
 from app.core.database import get_db
-from app.core import ai_service, security
+from app.core import ai_service, canasta, pronostico, security
+from app.models import models
 from app.schemas import schemas
 
 router = APIRouter(
@@ -9,13 +11,74 @@ router = APIRouter(
     tags=["ia"]
 )
 
+# Devuelve el último snapshot (lo mantiene al día una tarea en segundo plano).
+# forzar=true recalcula en el momento; peticiones simultáneas comparten el cálculo.
 @router.get("/analisis", response_model=schemas.DashboardIAResponse)
 def get_analisis_ia(
+    forzar: bool = False,
+    current_user = Depends(security.get_current_user)
+):
+    snapshot = ai_service.recalcular_snapshot() if forzar else ai_service.obtener_snapshot()
+    return ai_service.respuesta_snapshot(snapshot)
+
+# --- BUNDLES (Reglas de asociación sobre órdenes de venta) ---
+@router.get("/bundles", response_model=schemas.BundlesResponse)
+def get_bundles(
+    min_soporte: float = Query(0.0, ge=0, le=1),
+    min_confianza: float = Query(0.1, ge=0, le=1),
+    min_lift: float = Query(1.0, ge=0),
+    limite: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user = Depends(security.get_current_user)
+):
+    reglas = canasta.reglas(min_soporte, min_confianza, min_lift, limite)
+    nombres = canasta.nombres_sku(db, {r["antecedente"] for r in reglas} | {r["consecuente"] for r in reglas})
+    for r in reglas:
+        r["antecedente_nombre"] = nombres.get(r["antecedente"])
+        r["consecuente_nombre"] = nombres.get(r["consecuente"])
+    return {**canasta.resumen(), "reglas": reglas}
+
+# --- PRONÓSTICO DE DEMANDA ---
+# Se lee la última ejecución guardada; el cálculo se hace en /pronostico/recalcular
+@router.get("/pronostico", response_model=schemas.PronosticoResponse)
+def get_pronostico(
+    semanas: int = Query(pronostico.HORIZONTE_SEMANAS, ge=1, le=pronostico.HORIZONTE_SEMANAS),
+    variante_producto_id: Optional[int] = None,
+    producto_reventa_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(security.get_current_user)
+):
+    fecha_ejecucion = pronostico.ultima_ejecucion(db)
+    if fecha_ejecucion is None:
+        return {"fecha_ejecucion": None, "pronosticos": []}
+
+    p = models.PronosticoDemanda
+    query = db.query(p.variante_producto_id, p.producto_reventa_id, p.metodo, p.cantidad).filter(
+        p.fecha_ejecucion == fecha_ejecucion,
+        p.semana <= semanas
+    )
+    if variante_producto_id: query = query.filter(p.variante_producto_id == variante_producto_id)
+    if producto_reventa_id: query = query.filter(p.producto_reventa_id == producto_reventa_id)
+
+    pronosticos = {}
+    for fila in query.order_by(p.variante_producto_id, p.producto_reventa_id, p.semana):
+        sku = f"var-{fila.variante_producto_id}" if fila.variante_producto_id else f"rev-{fila.producto_reventa_id}"
+        if sku not in pronosticos:
+            pronosticos[sku] = {
+                "sku": sku,
+                "variante_producto_id": fila.variante_producto_id,
+                "producto_reventa_id": fila.producto_reventa_id,
+                "metodo": fila.metodo,
+                "semanas": []
+            }
+        pronosticos[sku]["semanas"].append(float(fila.cantidad))
+
+    return {"fecha_ejecucion": fecha_ejecucion, "pronosticos": list(pronosticos.values())}
+
+@router.post("/pronostico/recalcular")
+def recalcular_pronostico(
     db: Session = Depends(get_db),
     current_user = Depends(security.get_current_user)
 ):
-    analisis, sugerencias = ai_service.analizar_inventario(db)
-    return {
-        "analisis_productos": analisis,
-        "sugerencias": sugerencias
-    }
\ No newline at end of file
+    fecha_ejecucion, total = pronostico.ejecutar(db)
+    return {"status": "success", "fecha_ejecucion": fecha_ejecucion, "skus": total}
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.core import security
+from app.core import security, paginacion, inventario, bom
 
 router = APIRouter(
     prefix="/materia-prima",
@@ -19,13 +19,23 @@ def create_materia_prima(
 ):
     db_mat = models.MateriaPrima(**material.model_dump())
     db.add(db_mat)
+    db.flush()
+    inventario.registrar_alta(db, db_mat)
     db.commit()
     db.refresh(db_mat)
     return db_mat
 
 @router.get("/", response_model=List[schemas.MateriaPrimaResponse])
-def read_materia_prima(db: Session = Depends(get_db)):
-    return db.query(models.MateriaPrima).all()
+def read_materia_prima(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    proveedor_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.MateriaPrima).options(joinedload(models.MateriaPrima.proveedor))
+    if proveedor_id: query = query.filter(models.MateriaPrima.proveedor_id == proveedor_id)
+    return paginacion.paginar(query, response, cursor, limite, models.MateriaPrima.id, descendente=False)
 
 # Endpoint para obtener detalles de un material específico
 @router.get("/{material_id}", response_model=schemas.MateriaPrimaResponse)
@@ -42,10 +52,16 @@ def update_materia_prima(id: int, material: schemas.MateriaPrimaUpdate, db: Sess
     if not db_mat:
         raise HTTPException(status_code=404, detail="Material no encontrado")
     
-    for key, value in material.model_dump(exclude_unset=True).items():
+    datos = material.model_dump(exclude_unset=True)
+    # El stock se ajusta vía kardex (movimiento por la diferencia)
+    if datos.get("stockActual") is not None:
+        inventario.fijar_stock(db, models.MateriaPrima, id, datos.pop("stockActual"))
+    datos.pop("stockActual", None)
+    for key, value in datos.items():
         setattr(db_mat, key, value)
     
     db.commit()
+    bom.invalidar() # Nombre / unidad en caché del BOM
     db.refresh(db_mat)
     return db_mat
 
@@ -1,29 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, Header
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
+from datetime import datetime, date
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.core import security
+from app.core import security, paginacion, cache, idempotencia, inventario, instrumentacion, kardex, reabastecimiento, bom as bom_cache
 
 router = APIRouter(
     prefix="/produccion",
     tags=["produccion"]
 )
 
+# Carga anticipada de lo que serializan las respuestas (una consulta por listado)
+CARGA_VARIANTE = (joinedload(models.VarianteProducto.producto_fabricado),)
+CARGA_BOM = (joinedload(models.ListaMateriales.materia_prima),)
+CARGA_ORDEN_PRODUCCION = (
+    joinedload(models.OrdenProduccion.variante).joinedload(models.VarianteProducto.producto_fabricado),
+)
+
+def _cargar_orden(db: Session, id: int) -> models.OrdenProduccion:
+    return db.query(models.OrdenProduccion).options(*CARGA_ORDEN_PRODUCCION).populate_existing().filter(models.OrdenProduccion.id == id).one()
+
 # --- VARIANTES ---
 @router.post("/variantes", response_model=schemas.VarianteResponse)
 def create_variante(variante: schemas.VarianteCreate, db: Session = Depends(get_db)):
     db_var = models.VarianteProducto(**variante.model_dump())
     db.add(db_var)
+    db.flush()
+    inventario.registrar_alta(db, db_var)
     db.commit()
     db.refresh(db_var)
     return db_var
 
 @router.get("/variantes", response_model=List[schemas.VarianteResponse])
-def read_variantes(db: Session = Depends(get_db)):
-    return db.query(models.VarianteProducto).all()
+def read_variantes(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    producto_fabricado_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.VarianteProducto).options(*CARGA_VARIANTE)
+    if producto_fabricado_id: query = query.filter(models.VarianteProducto.producto_fabricado_id == producto_fabricado_id)
+    return paginacion.paginar(query, response, cursor, limite, models.VarianteProducto.id, descendente=False)
 
 # --- BOM (Recetas) ---
 @router.post("/bom", response_model=schemas.BOMResponse)
@@ -40,17 +60,18 @@ def create_bom_item(bom: schemas.BOMCreate, db: Session = Depends(get_db)):
     db_bom = models.ListaMateriales(**bom.model_dump())
     db.add(db_bom)
     db.commit()
+    bom_cache.invalidar()
     db.refresh(db_bom)
     return db_bom
 
 # NUEVO: Obtener TODO el BOM (para la tabla general)
 @router.get("/bom", response_model=List[schemas.BOMResponse])
 def read_all_bom(db: Session = Depends(get_db)):
-    return db.query(models.ListaMateriales).all()
+    return db.query(models.ListaMateriales).options(*CARGA_BOM).all()
 
 @router.get("/bom/{producto_id}", response_model=List[schemas.BOMResponse])
 def read_bom_by_producto(producto_id: int, db: Session = Depends(get_db)):
-    return db.query(models.ListaMateriales).filter(models.ListaMateriales.producto_fabricado_id == producto_id).all()
+    return db.query(models.ListaMateriales).options(*CARGA_BOM).filter(models.ListaMateriales.producto_fabricado_id == producto_id).all()
 
 # NUEVO: Eliminar item del BOM
 @router.delete("/bom/{id}")
@@ -60,6 +81,7 @@ def delete_bom_item(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Item no encontrado")
     db.delete(item)
     db.commit()
+    bom_cache.invalidar()
     return {"ok": True}
 
 # NUEVO: Editar Cantidad BOM
@@ -70,21 +92,81 @@ def update_bom_item(id: int, bom: schemas.BOMUpdate, db: Session = Depends(get_d
     
     item.cantidadRequerida = bom.cantidadRequerida
     db.commit()
+    bom_cache.invalidar()
     db.refresh(item)
     return item
 
+# --- MRP: Explosión de órdenes abiertas en requerimiento de materia prima ---
+@router.get("/mrp", response_model=schemas.MRPResponse)
+def get_mrp(db: Session = Depends(get_db)):
+    return bom_cache.mrp(db)
+
+# --- CAPACIDAD: Máximo producible por variante con el stock de materia prima ---
+def _en_camino_materia(db: Session) -> dict:
+    return {
+        id_: cantidad for (tipo, id_), cantidad in reabastecimiento.en_camino(db).items()
+        if tipo == reabastecimiento.TIPO_MATERIA
+    }
+
+@router.get("/capacidad", response_model=List[schemas.CapacidadItem])
+def get_capacidad(incluir_en_camino: bool = False, db: Session = Depends(get_db)):
+    return bom_cache.capacidad(db, _en_camino_materia(db) if incluir_en_camino else None)
+
+# Escenario "qué pasaría si": compras hipotéticas sumadas al stock actual
+@router.post("/capacidad/simular", response_model=List[schemas.CapacidadItem])
+def simular_capacidad(simulacion: schemas.SimulacionCapacidad, db: Session = Depends(get_db)):
+    adicional = _en_camino_materia(db) if simulacion.incluir_en_camino else {}
+    for compra in simulacion.compras:
+        adicional[compra.materia_prima_id] = adicional.get(compra.materia_prima_id, 0) + compra.cantidad
+    return bom_cache.capacidad(db, adicional)
+
+# --- ASIGNACIÓN: Qué órdenes abiertas se pueden completar con el stock actual ---
+@router.get("/asignacion", response_model=schemas.AsignacionResponse)
+def get_asignacion(db: Session = Depends(get_db)):
+    return bom_cache.asignar(db)
+
+# Con prioridades / fechas de entrega (las órdenes no indicadas van con prioridad 0)
+@router.post("/asignacion", response_model=schemas.AsignacionResponse)
+def simular_asignacion(solicitud: schemas.AsignacionRequest, db: Session = Depends(get_db)):
+    return bom_cache.asignar(db, {c.orden_id: (c.prioridad, c.fecha_entrega) for c in solicitud.ordenes})
+
 # --- ÓRDENES DE PRODUCCIÓN ---
 @router.post("/ordenes", response_model=schemas.OrdenProduccionResponse)
-def create_orden(orden: schemas.OrdenProduccionCreate, db: Session = Depends(get_db)):
+def create_orden(
+    orden: schemas.OrdenProduccionCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db)
+):
+    cuerpo = idempotencia.ejecutar(
+        response, db, idempotency_key, "POST /produccion/ordenes", orden, schemas.OrdenProduccionResponse,
+        lambda: _crear_orden(orden, db)
+    )
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return cuerpo
+
+def _crear_orden(orden: schemas.OrdenProduccionCreate, db: Session):
     db_orden = models.OrdenProduccion(**orden.model_dump())
     db.add(db_orden)
-    db.commit()
-    db.refresh(db_orden)
-    return db_orden
+    db.flush()
+    return _cargar_orden(db, db_orden.id)
 
-@router.get("/ordenes", response_model=List[schemas.OrdenProduccionResponse])
-def read_ordenes(db: Session = Depends(get_db)):
-    return db.query(models.OrdenProduccion).order_by(models.OrdenProduccion.fechaCreacion.desc()).all()
+@router.get("/ordenes", response_model=List[schemas.OrdenProduccionResponse], dependencies=[Depends(instrumentacion.presupuesto(1))])
+def read_ordenes(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    estado: Optional[str] = None,
+    variante_producto_id: Optional[int] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.OrdenProduccion).options(*CARGA_ORDEN_PRODUCCION)
+    if estado: query = query.filter(models.OrdenProduccion.estado == estado)
+    if variante_producto_id: query = query.filter(models.OrdenProduccion.variante_producto_id == variante_producto_id)
+    query = paginacion.rango_fechas(query, models.OrdenProduccion.fechaCreacion, fecha_desde, fecha_hasta)
+    return paginacion.paginar(query, response, cursor, limite, models.OrdenProduccion.fechaCreacion, models.OrdenProduccion.id)
 
 # Endpoint específico para flujo rápido (Terminar)
 @router.put("/ordenes/{orden_id}/terminar", response_model=schemas.OrdenProduccionResponse)
@@ -92,10 +174,82 @@ def terminar_orden(orden_id: int, db: Session = Depends(get_db)):
     # ... (Lógica original de terminar, reutilizada abajo en update)
     return update_orden_produccion(orden_id, schemas.OrdenProduccionUpdate(estado="Terminado"), db)
 
+# Cierre de turno: termina varias órdenes en una sola transacción (todas o ninguna)
+@router.put("/ordenes/terminar-lote", response_model=List[schemas.OrdenProduccionResponse])
+def terminar_lote(lote: schemas.TerminarLoteRequest, db: Session = Depends(get_db)):
+    ids = sorted(set(lote.ordenes))
+    if not ids: raise HTTPException(400, "No se indicaron órdenes")
+
+    # Bloquea las órdenes (en orden de id) para que dos lotes no terminen la misma orden
+    ordenes = db.query(models.OrdenProduccion).options(*CARGA_ORDEN_PRODUCCION).populate_existing()\
+        .filter(models.OrdenProduccion.id.in_(ids)).order_by(models.OrdenProduccion.id)\
+        .with_for_update(of=models.OrdenProduccion).all()
+    faltantes = set(ids) - {o.id for o in ordenes}
+    if faltantes:
+        raise HTTPException(404, f"Orden no encontrada (id {', '.join(map(str, sorted(faltantes)))})")
+    terminadas = [o.id for o in ordenes if o.estado == "Terminado"]
+    if terminadas:
+        raise HTTPException(400, f"Órdenes ya terminadas: {', '.join(map(str, terminadas))}")
+
+    # Consumo total por materia prima (redondeo por orden, igual que al terminar una sola)
+    requerido = {}
+    nombres = {}
+    consumos = []
+    for orden in ordenes:
+        producto_id = orden.variante.producto_fabricado_id
+        for c in bom_cache.componentes(producto_id):
+            requerido[c.materia_prima_id] = requerido.get(c.materia_prima_id, 0) + c.cantidad * orden.cantidadProducida
+            nombres[c.materia_prima_id] = c.nombre
+        consumos.append((orden, bom_cache.consumo(producto_id, orden.cantidadProducida)))
+
+    # Variante primero (orden global de bloqueo), luego una sola verificación de materia prima
+    inventario.ajustar_stock(db, models.VarianteProducto, inventario.acumular(
+        (o.variante_producto_id, o.cantidadProducida) for o in ordenes
+    ), "Producción", validar=False, movimientos=False)
+    materias = inventario.bloquear_stock(db, models.MateriaPrima, requerido)
+    insuficientes = [nombres[m] for m in sorted(requerido) if materias[m].stockActual < requerido[m]]
+    if insuficientes:
+        raise HTTPException(400, f"Stock insuficiente de {', '.join(insuficientes)}")
+    inventario.ajustar_stock(db, models.MateriaPrima, inventario.acumular(
+        (m, -q) for _, consumo in consumos for m, q in consumo.items()
+    ), "Producción", validar=False, movimientos=False)
+
+    # Kardex con el documento de cada orden (un INSERT por tabla)
+    kardex.registrar_por_documento(db, models.VarianteProducto, (
+        (o.variante_producto_id, o.cantidadProducida, o.id) for o in ordenes
+    ), "Producción")
+    kardex.registrar_por_documento(db, models.MateriaPrima, (
+        (m, -q, orden.id) for orden, consumo in consumos for m, q in consumo.items()
+    ), "Producción")
+
+    db.query(models.OrdenProduccion).filter(models.OrdenProduccion.id.in_(ids)).update(
+        {models.OrdenProduccion.estado: "Terminado", models.OrdenProduccion.fechaFinalizacion: datetime.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return db.query(models.OrdenProduccion).options(*CARGA_ORDEN_PRODUCCION).populate_existing()\
+        .filter(models.OrdenProduccion.id.in_(ids)).order_by(models.OrdenProduccion.id).all()
+
+def _revertir_produccion(db: Session, orden: models.OrdenProduccion) -> bool:
+    """Resta el producto terminado y devuelve la materia prima. False si ya no hay stock para revertir."""
+    variante = orden.variante
+    fila = inventario.bloquear_stock(db, models.VarianteProducto, [variante.id])[variante.id]
+    if fila.stockActual < orden.cantidadProducida:
+        return False
+    inventario.ajustar(db, {
+        models.VarianteProducto: {variante.id: -orden.cantidadProducida},
+        models.MateriaPrima: bom_cache.consumo(variante.producto_fabricado_id, orden.cantidadProducida),
+    }, "Producción", orden.id, validar=False)
+    return True
+
 # NUEVO: Editar Orden (Manejo de Reversión de Stock)
 @router.put("/ordenes/{id}", response_model=schemas.OrdenProduccionResponse)
 def update_orden_produccion(id: int, update: schemas.OrdenProduccionUpdate, db: Session = Depends(get_db)):
-    orden = db.query(models.OrdenProduccion).filter(models.OrdenProduccion.id == id).first()
+    # Bloquea la orden (antes que la variante, como terminar-lote): el estado se lee ya
+    # bloqueado, así dos peticiones concurrentes no terminan ni revierten la misma orden dos veces
+    orden = db.query(models.OrdenProduccion).populate_existing().filter(models.OrdenProduccion.id == id)\
+        .with_for_update(of=models.OrdenProduccion).first()
     if not orden: raise HTTPException(404, "Orden no encontrada")
 
     estado_anterior = orden.estado
@@ -104,54 +258,45 @@ def update_orden_produccion(id: int, update: schemas.OrdenProduccionUpdate, db:
     # 1. Lógica: En Proceso -> Terminado (Consumir Materia, Aumentar Producto)
     if estado_anterior != "Terminado" and nuevo_estado == "Terminado":
         variante = orden.variante
-        bom_list = db.query(models.ListaMateriales).filter(models.ListaMateriales.producto_fabricado_id == variante.producto_fabricado_id).all()
+        componentes = bom_cache.componentes(variante.producto_fabricado_id)
         
-        # Verificar y descontar materia prima
-        for item in bom_list:
-            req = item.cantidadRequerida * orden.cantidadProducida
-            if item.materia_prima.stockActual < req:
-                raise HTTPException(400, f"Stock insuficiente de {item.materia_prima.nombre}")
-            item.materia_prima.stockActual -= int(req)
+        # Variante primero (orden global de bloqueo), luego verificar y descontar materia prima
+        inventario.ajustar_stock(db, models.VarianteProducto, {variante.id: orden.cantidadProducida}, "Producción", orden.id, validar=False)
+        materias = inventario.bloquear_stock(db, models.MateriaPrima, [c.materia_prima_id for c in componentes])
+        for c in componentes:
+            req = c.cantidad * orden.cantidadProducida
+            if materias[c.materia_prima_id].stockActual < req:
+                raise HTTPException(400, f"Stock insuficiente de {c.nombre}")
+        inventario.ajustar_stock(db, models.MateriaPrima, {
+            materia_id: -cantidad for materia_id, cantidad in bom_cache.consumo(variante.producto_fabricado_id, orden.cantidadProducida).items()
+        }, "Producción", orden.id, validar=False)
         
-        variante.stockActual += orden.cantidadProducida
         orden.fechaFinalizacion = datetime.now()
 
     # 2. Lógica: Terminado -> En Proceso (Devolver Materia, Restar Producto)
     elif estado_anterior == "Terminado" and nuevo_estado == "En Proceso":
-        variante = orden.variante
-        if variante.stockActual < orden.cantidadProducida:
+        if not _revertir_produccion(db, orden):
             raise HTTPException(400, "No se puede revertir: El producto fabricado ya fue vendido o movido.")
-        
-        variante.stockActual -= orden.cantidadProducida
-        
-        bom_list = db.query(models.ListaMateriales).filter(models.ListaMateriales.producto_fabricado_id == variante.producto_fabricado_id).all()
-        for item in bom_list:
-            devolver = item.cantidadRequerida * orden.cantidadProducida
-            item.materia_prima.stockActual += int(devolver)
-        
         orden.fechaFinalizacion = None
 
     if nuevo_estado: orden.estado = nuevo_estado
     db.commit()
-    db.refresh(orden)
-    return orden
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return _cargar_orden(db, orden.id)
 
 # NUEVO: Eliminar (Cancelar) Orden Producción
 @router.delete("/ordenes/{id}")
 def delete_orden_produccion(id: int, db: Session = Depends(get_db)):
-    orden = db.query(models.OrdenProduccion).filter(models.OrdenProduccion.id == id).first()
+    orden = db.query(models.OrdenProduccion).populate_existing().filter(models.OrdenProduccion.id == id)\
+        .with_for_update(of=models.OrdenProduccion).first()
     if not orden: raise HTTPException(404, "Orden no encontrada")
     
     # Si está terminada, revertir stock antes de borrar
     if orden.estado == "Terminado":
-        # Reutilizamos la lógica de reversión
-        variante = orden.variante
-        if variante.stockActual >= orden.cantidadProducida:
-            variante.stockActual -= orden.cantidadProducida
-            bom_list = db.query(models.ListaMateriales).filter(models.ListaMateriales.producto_fabricado_id == variante.producto_fabricado_id).all()
-            for item in bom_list:
-                item.materia_prima.stockActual += int(item.cantidadRequerida * orden.cantidadProducida)
+        # Reutilizamos la lógica de reversión (si el producto ya se vendió, solo se borra)
+        _revertir_produccion(db, orden)
     
     db.delete(orden)
     db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
     return {"ok": True}
\ No newline at end of file
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.core import security
+from app.core import security, paginacion, inventario, bandeja_salida
 
 router = APIRouter(
     prefix="/productos",
@@ -38,8 +38,14 @@ def create_producto_fabricado(
     return db_prod
 
 @router.get("/fabricados", response_model=List[schemas.ProductoFabricadoResponse])
-def read_productos_fabricados(db: Session = Depends(get_db)):
-    return db.query(models.ProductoFabricado).all()
+def read_productos_fabricados(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.ProductoFabricado)
+    return paginacion.paginar(query, response, cursor, limite, models.ProductoFabricado.id, descendente=False)
 
 # NUEVO: Editar Fabricado
 @router.put("/fabricados/{id}", response_model=schemas.ProductoFabricadoResponse)
@@ -48,8 +54,12 @@ def update_producto_fabricado(id: int, producto: schemas.ProductoFabricadoUpdate
     if not db_prod:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    for key, value in producto.model_dump(exclude_unset=True).items():
+    datos = producto.model_dump(exclude_unset=True)
+    for key, value in datos.items():
         setattr(db_prod, key, value)
+    # El precio se publica en todas las variantes vinculadas a Mercado Libre
+    if datos.get("precioVenta") is not None:
+        bandeja_salida.registrar_producto_fabricado(db, id)
     
     db.commit()
     db.refresh(db_prod)
@@ -74,13 +84,23 @@ def create_producto_reventa(
 ):
     db_prod = models.ProductoReventa(**producto.model_dump())
     db.add(db_prod)
+    db.flush()
+    inventario.registrar_alta(db, db_prod)
     db.commit()
     db.refresh(db_prod)
     return db_prod
 
 @router.get("/reventa", response_model=List[schemas.ProductoReventaResponse])
-def read_productos_reventa(db: Session = Depends(get_db)):
-    return db.query(models.ProductoReventa).all()
+def read_productos_reventa(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    proveedor_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.ProductoReventa).options(joinedload(models.ProductoReventa.proveedor))
+    if proveedor_id: query = query.filter(models.ProductoReventa.proveedor_id == proveedor_id)
+    return paginacion.paginar(query, response, cursor, limite, models.ProductoReventa.id, descendente=False)
 
 # NUEVO: Editar Reventa
 @router.put("/reventa/{id}", response_model=schemas.ProductoReventaResponse)
@@ -89,8 +109,15 @@ def update_producto_reventa(id: int, producto: schemas.ProductoReventaUpdate, db
     if not db_prod:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    for key, value in producto.model_dump(exclude_unset=True).items():
+    datos = producto.model_dump(exclude_unset=True)
+    # El stock se ajusta vía kardex (movimiento por la diferencia)
+    if datos.get("stockActual") is not None:
+        inventario.fijar_stock(db, models.ProductoReventa, id, datos.pop("stockActual"))
+    datos.pop("stockActual", None)
+    for key, value in datos.items():
         setattr(db_prod, key, value)
+    if datos.get("precioVenta") is not None:
+        bandeja_salida.registrar(db, models.ProductoReventa, [id], bandeja_salida.CAMPO_PRECIO)
     
     db.commit()
     db.refresh(db_prod)
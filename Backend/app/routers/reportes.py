@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List, Any
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, case, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Any, Optional
 from datetime import date, datetime, time
-from app.core.database import get_db
+import csv
+import io
+import json
+from app.core.database import get_db, SessionLocal
 from app.models import models
+from app.schemas import schemas
+from app.core import kardex, paginacion
 
 router = APIRouter(
     prefix="/reportes",
@@ -11,48 +19,148 @@ router = APIRouter(
 )
 
 # --- REPORTE DE VENTAS (Filtrado por fecha) ---
+# Totales y resumen de items se calculan en SQL (una fila por orden) y se
+# envían en streaming, así la memoria no crece con el rango de fechas.
+_LOTE_REPORTE = 1000
+_COLUMNAS_VENTAS = ["id_orden", "fecha", "canal", "items", "total_venta", "estado"]
+
+def _consulta_reporte_ventas(inicio: datetime, fin: datetime):
+    ov = models.OrdenVenta
+    d = models.DetalleOrdenVenta
+    v = models.VarianteProducto
+    pf = models.ProductoFabricado
+    r = models.ProductoReventa
+
+    descripcion = case(
+        (d.variante_producto_id.isnot(None),
+         func.concat(pf.nombre, " (", v.talla, "/", v.color, ") x", d.cantidad)),
+        (d.producto_reventa_id.isnot(None),
+         func.concat(r.nombre, " x", d.cantidad)),
+        else_=None
+    )
+
+    return (
+        select(
+            ov.id.label("id_orden"),
+            ov.fecha,
+            models.CanalVenta.nombre.label("canal"),
+            func.coalesce(func.string_agg(descripcion, aggregate_order_by(literal(", "), d.id)), "").label("items"),
+            func.coalesce(func.sum(d.cantidad * d.precioUnitario), 0).label("total_venta"),
+            ov.estado
+        )
+        .select_from(ov)
+        .join(models.CanalVenta, models.CanalVenta.id == ov.canal_venta_id)
+        .outerjoin(d, d.orden_venta_id == ov.id)
+        .outerjoin(v, v.id == d.variante_producto_id)
+        .outerjoin(pf, pf.id == v.producto_fabricado_id)
+        .outerjoin(r, r.id == d.producto_reventa_id)
+        .where(ov.fecha >= inicio, ov.fecha <= fin)
+        .group_by(ov.id, models.CanalVenta.nombre)
+        .order_by(ov.fecha.desc(), ov.id.desc())
+    )
+
+def _filas_reporte_ventas(inicio: datetime, fin: datetime):
+    # Sesión propia: el generador sigue vivo después de que termina el endpoint
+    db = SessionLocal()
+    try:
+        stmt = _consulta_reporte_ventas(inicio, fin).execution_options(yield_per=_LOTE_REPORTE)
+        for fila in db.execute(stmt):
+            yield {
+                "id_orden": fila.id_orden,
+                "fecha": fila.fecha,
+                "canal": fila.canal,
+                "items": fila.items,
+                "total_venta": float(fila.total_venta),
+                "estado": fila.estado
+            }
+    finally:
+        db.close()
+
+def _serializar_json(filas):
+    yield "["
+    for i, fila in enumerate(filas):
+        yield ("," if i else "") + json.dumps(fila, default=_json_default)
+    yield "]"
+
+def _serializar_ndjson(filas):
+    for fila in filas:
+        yield json.dumps(fila, default=_json_default) + "\n"
+
+def _serializar_csv(filas):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=_COLUMNAS_VENTAS)
+    writer.writeheader()
+    for i, fila in enumerate(filas, start=1):
+        writer.writerow({**fila, "fecha": fila["fecha"].isoformat()})
+        if i % _LOTE_REPORTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def _json_default(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor)}")
+
+_FORMATOS_REPORTE = {
+    "json": (_serializar_json, "application/json"),
+    "ndjson": (_serializar_ndjson, "application/x-ndjson"),
+    "csv": (_serializar_csv, "text/csv"),
+}
+
 @router.get("/ventas")
 def reporte_ventas(
     fecha_inicio: date,
     fecha_fin: date,
-    db: Session = Depends(get_db)
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$")
 ):
     # Convertir date a datetime para cubrir todo el día
     inicio = datetime.combine(fecha_inicio, time.min)
     fin = datetime.combine(fecha_fin, time.max)
 
-    ventas = db.query(models.OrdenVenta).filter(
-        models.OrdenVenta.fecha >= inicio,
-        models.OrdenVenta.fecha <= fin
-    ).order_by(models.OrdenVenta.fecha.desc()).all()
+    serializar, media_type = _FORMATOS_REPORTE[formato]
+    headers = {}
+    if formato == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="ventas_{fecha_inicio}_{fecha_fin}.csv"'
 
-    resultado = []
-    for v in ventas:
-        total_orden = sum([d.cantidad * d.precioUnitario for d in v.detalles])
-        
-        # Generar resumen de items
-        items_desc = []
-        for d in v.detalles:
-            if d.variante:
-                items_desc.append(f"{d.variante.producto_fabricado.nombre} ({d.variante.talla}/{d.variante.color}) x{d.cantidad}")
-            elif d.producto_reventa:
-                items_desc.append(f"{d.producto_reventa.nombre} x{d.cantidad}")
-        
-        resultado.append({
-            "id_orden": v.id,
-            "fecha": v.fecha,
-            "canal": v.canal.nombre,
-            "items": ", ".join(items_desc),
-            "total_venta": float(total_orden),
-            "estado": v.estado
-        })
-    return resultado
+    return StreamingResponse(serializar(_filas_reporte_ventas(inicio, fin)), media_type=media_type, headers=headers)
+
+# --- RESUMEN DIARIO DE VENTAS (Lee el rollup, no detalleordenventa) ---
+@router.get("/ventas-diarias")
+def reporte_ventas_diarias(
+    fecha_inicio: date,
+    fecha_fin: date,
+    db: Session = Depends(get_db)
+):
+    vd = models.VentaDiaria
+    filas = db.query(
+        vd.fecha,
+        models.CanalVenta.nombre.label("canal"),
+        func.sum(vd.unidades).label("unidades"),
+        func.sum(vd.ingresos).label("ingresos"),
+        func.sum(vd.unidadesDevueltas).label("unidades_devueltas"),
+        func.sum(vd.ingresosDevueltos).label("ingresos_devueltos")
+    ).join(models.CanalVenta, models.CanalVenta.id == vd.canal_venta_id).filter(
+        vd.fecha >= fecha_inicio,
+        vd.fecha <= fecha_fin
+    ).group_by(vd.fecha, models.CanalVenta.nombre).order_by(vd.fecha.desc(), models.CanalVenta.nombre).all()
+
+    return [{
+        "fecha": f.fecha,
+        "canal": f.canal,
+        "unidades": int(f.unidades),
+        "ingresos": float(f.ingresos),
+        "unidades_devueltas": int(f.unidades_devueltas),
+        "ingresos_devueltos": float(f.ingresos_devueltos),
+        "ingresos_netos": float(f.ingresos - f.ingresos_devueltos)
+    } for f in filas]
 
 # --- REPORTE INVENTARIO PRODUCTO (Valorizado) ---
 @router.get("/inventario-producto")
 def reporte_inventario_producto(db: Session = Depends(get_db)):
     # 1. Variantes de Productos Fabricados
-    variantes = db.query(models.VarianteProducto).all()
+    variantes = db.query(models.VarianteProducto).options(joinedload(models.VarianteProducto.producto_fabricado)).all()
     # 2. Productos de Reventa
     reventa = db.query(models.ProductoReventa).all()
 
@@ -87,7 +195,7 @@ def reporte_inventario_producto(db: Session = Depends(get_db)):
 # --- REPORTE INVENTARIO MATERIA PRIMA ---
 @router.get("/inventario-materia")
 def reporte_inventario_materia(db: Session = Depends(get_db)):
-    materiales = db.query(models.MateriaPrima).all()
+    materiales = db.query(models.MateriaPrima).options(joinedload(models.MateriaPrima.proveedor)).all()
     resultado = []
     for m in materiales:
         valor_total = float(m.stockActual) * float(m.costo)
@@ -100,4 +208,36 @@ def reporte_inventario_materia(db: Session = Depends(get_db)):
             "costo_unitario": float(m.costo),
             "valor_total_inversion": valor_total
         })
-    return resultado
\ No newline at end of file
+    return resultado
+
+# --- KARDEX: Movimientos y Stock Histórico ---
+@router.get("/movimientos", response_model=List[schemas.MovimientoInventarioResponse])
+def reporte_movimientos(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    sku: Optional[str] = None,
+    documento: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    m = models.MovimientoInventario
+    query = db.query(m)
+    if sku: query = query.filter(m.sku == sku)
+    if documento: query = query.filter(m.documento == documento)
+    query = paginacion.rango_fechas(query, m.fecha, fecha_desde, fecha_hasta)
+    return paginacion.paginar(query, response, cursor, limite, m.fecha, m.id)
+
+# Stock de cada SKU a una fecha (snapshot más cercano + cola de movimientos)
+@router.get("/stock-historico", response_model=List[schemas.StockHistoricoItem])
+def reporte_stock_historico(
+    fecha: datetime,
+    sku: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db)
+):
+    if fecha.tzinfo is not None:
+        # Con offset (ej. ...Z o -04:00): se pasa a la hora local del servidor, como las fechas guardadas
+        fecha = fecha.astimezone().replace(tzinfo=None)
+    stock = kardex.stock_en(db, fecha, sku)
+    return [{"sku": k, "stock": v} for k, v in stock.items()]
@@ -1,101 +1,213 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import select, func, literal, union_all
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-import uuid
+from typing import Any, Dict, List, Optional, Union
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
+from app.core import inventario, meli, notificaciones, paginacion, publicaciones, bandeja_salida
 
 router = APIRouter(prefix="/sincronizacion", tags=["sincronizacion"])
 
 # --- Obtener Lista Unificada de Productos para Sincronizar ---
-@router.get("/productos", response_model=List[schemas.ProductoSincronizacion])
-def get_productos_sincronizacion(db: Session = Depends(get_db)):
-    lista = []
-    
-    # 1. Variantes
-    variantes = db.query(models.VarianteProducto).all()
-    for v in variantes:
-        lista.append({
-            "unique_id": f"var-{v.id}",
-            "tipo": "Variante",
-            "id_db": v.id,
-            "nombre": f"{v.producto_fabricado.nombre} - {v.talla} {v.color}",
-            "precio": v.producto_fabricado.precioVenta,
-            "stock": v.stockActual,
-            "meli_id": v.meli_id
-        })
-        
-    # 2. Reventa
-    reventa = db.query(models.ProductoReventa).all()
-    for r in reventa:
-        lista.append({
-            "unique_id": f"rev-{r.id}",
-            "tipo": "Reventa",
-            "id_db": r.id,
-            "nombre": r.nombre,
-            "precio": r.precioVenta,
-            "stock": r.stockActual,
-            "meli_id": r.meli_id
-        })
-        
-    return lista
-
-# --- Publicar en Mercado Libre (Simulado) ---
+def _version_catalogo(db: Session) -> str:
+    """
+    ETag fuerte: la versión del catálogo (suma de models.VersionCatalogo), que cada
+    transacción que modifica variantes o productos incrementa al confirmar. Se lee antes
+    que los datos: si algo se confirma entre ambas lecturas, el ETag queda viejo y el
+    siguiente GET descarga de nuevo (nunca al revés).
+    """
+    vc = models.VersionCatalogo
+    version = db.execute(select(func.sum(vc.version))).scalar()
+    return f'"catalogo-{version or 0}"'
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    etiquetas = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+    return "*" in etiquetas or etag in etiquetas
+
+@router.get("/productos", response_model=List[schemas.ProductoSincronizacion],
+            responses={304: {"description": "El catálogo no cambió desde el ETag enviado"}})
+def get_productos_sincronizacion(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    etag = _version_catalogo(db)
+    if _coincide(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    # Variantes y reventa en una sola consulta (el nombre y precio de la variante vienen del join)
+    v, pf, r = models.VarianteProducto, models.ProductoFabricado, models.ProductoReventa
+    variantes = select(
+        func.concat("var-", v.id).label("unique_id"), literal("Variante").label("tipo"), v.id.label("id_db"),
+        func.concat(pf.nombre, " - ", v.talla, " ", v.color).label("nombre"),
+        pf.precioVenta.label("precio"), v.stockActual.label("stock"), v.meli_id,
+        literal(0).label("orden"),
+    ).join(pf, pf.id == v.producto_fabricado_id)
+    reventa = select(
+        func.concat("rev-", r.id), literal("Reventa"), r.id, r.nombre, r.precioVenta, r.stockActual, r.meli_id,
+        literal(1),
+    )
+    union = union_all(variantes, reventa).subquery()
+    filas = db.execute(
+        select(union.c.unique_id, union.c.tipo, union.c.id_db, union.c.nombre, union.c.precio, union.c.stock, union.c.meli_id)
+        .order_by(union.c.orden, union.c.id_db)
+    ).mappings().all()
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache" # Siempre revalidar (If-None-Match)
+    return filas
+
+# --- Publicar en Mercado Libre ---
+def _cuerpo_item(data: schemas.MeLiItemBase) -> dict:
+    item = data.model_dump(include=set(schemas.MeLiItemBase.model_fields), exclude={"description", "picture_url"})
+    if data.description: item["description"] = {"plain_text": data.description}
+    if data.picture_url: item["pictures"] = [{"source": data.picture_url}]
+    return item
+
+def _llamar_meli(operacion):
+    try:
+        return meli.ejecutar(operacion)
+    except meli.ErrorMeLi as e:
+        raise HTTPException(502, str(e))
+
 @router.post("/mercadolibre/publicar")
 def publicar_meli(data: schemas.MeLiPublishRequest, db: Session = Depends(get_db)):
-    # Aquí iría la llamada real a: POST https://api.mercadolibre.com/items
-    # body = data.dict() ... requests.post(url, json=body, headers=auth)
-    
-    # Simulamos respuesta exitosa de MeLi
-    fake_meli_id = f"MLM-{uuid.uuid4().hex[:8].upper()}"
-    
-    # Guardar el ID en nuestra BD local
     if data.variante_id:
-        prod = db.query(models.VarianteProducto).filter(models.VarianteProducto.id == data.variante_id).first()
-        if prod: 
-            prod.meli_id = fake_meli_id
-            prod.stockActual = data.available_quantity # Sincronizar stock inicial si se desea
-    
+        modelo, id_db = models.VarianteProducto, data.variante_id
     elif data.reventa_id:
-        prod = db.query(models.ProductoReventa).filter(models.ProductoReventa.id == data.reventa_id).first()
-        if prod: 
-            prod.meli_id = fake_meli_id
-            prod.stockActual = data.available_quantity
+        modelo, id_db = models.ProductoReventa, data.reventa_id
+    else:
+        raise HTTPException(400, "Indique variante_id o reventa_id")
+    # Bloqueado hasta el commit: dos publicaciones simultáneas del mismo producto no crean
+    # dos publicaciones remotas. Se rechaza antes de crear nada en MeLi.
+    prod = db.query(modelo).populate_existing().filter(modelo.id == id_db).with_for_update().first()
+    if not prod: raise HTTPException(404, "Producto no encontrado")
+    if prod.meli_id:
+        raise HTTPException(400, f"El producto ya está publicado en Mercado Libre ({prod.meli_id})")
+
+    # POST https://api.mercadolibre.com/items (simulado si no hay MELI_ACCESS_TOKEN)
+    item = _llamar_meli(lambda cliente: cliente.publicar(_cuerpo_item(data)))
+
+    # Guardar el ID en nuestra BD local (único entre variantes y reventa: models.PublicacionMeLi)
+    prod.meli_id = item["id"]
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(400, f"La publicación {item['id']} ya está vinculada a otro producto")
+    # Sincronizar stock inicial si se desea (queda en el kardex)
+    inventario.fijar_stock(db, modelo, prod.id, data.available_quantity, "Sincronización")
 
     db.commit()
-    return {"status": "success", "meli_id": fake_meli_id, "message": "Publicado correctamente en Mercado Libre"}
+    return {"status": "success", "meli_id": item["id"], "message": "Publicado correctamente en Mercado Libre"}
 
 # --- Editar Publicación en MeLi ---
 @router.put("/mercadolibre/{meli_id}")
 def editar_meli(meli_id: str, data: schemas.MeLiUpdateRequest, db: Session = Depends(get_db)):
-    # Aquí iría PUT https://api.mercadolibre.com/items/{meli_id}
-    # Simulamos éxito
-    
-    # Actualizar localmente si cambiaron precio/stock
-    # Nota: Esto requeriría buscar qué producto tiene ese meli_id.
-    # Por simplicidad en este ejemplo, solo retornamos éxito.
+    destino = publicaciones.resolver(db, [meli_id]).get(meli_id)
+    if not destino: raise HTTPException(404, "Publicación no vinculada a ningún producto")
+    modelo, id_db = destino
+
+    cambios = data.model_dump(exclude_none=True)
+    if cambios:
+        _llamar_meli(lambda cliente: cliente.editar(meli_id, cambios))
+
+    # Reflejar localmente precio/stock (la bandeja de salida replica el precio de una
+    # variante en las demás variantes publicadas del mismo producto fabricado)
+    if data.available_quantity is not None:
+        inventario.fijar_stock(db, modelo, id_db, data.available_quantity, "Sincronización")
+    if data.price is not None:
+        prod = db.get(modelo, id_db)
+        if modelo is models.VarianteProducto:
+            prod.producto_fabricado.precioVenta = data.price
+            bandeja_salida.registrar_producto_fabricado(db, prod.producto_fabricado_id)
+        else:
+            prod.precioVenta = data.price
+            bandeja_salida.registrar(db, modelo, [id_db], bandeja_salida.CAMPO_PRECIO)
+    db.commit()
     return {"status": "success", "message": f"Publicación {meli_id} actualizada"}
 
 # --- Eliminar/Pausar Publicación ---
+# Acepta el SKU ("var-1" / "rev-2") o el meli_id de la publicación
 @router.delete("/mercadolibre/{unique_id}")
 def eliminar_meli(unique_id: str, db: Session = Depends(get_db)):
-    tipo, id_db = unique_id.split("-")
-    id_db = int(id_db)
-    
-    meli_id_borrado = ""
-    
-    if tipo == "var":
-        prod = db.query(models.VarianteProducto).filter(models.VarianteProducto.id == id_db).first()
-        if prod:
-            meli_id_borrado = prod.meli_id
-            prod.meli_id = None # Desvincular
-    elif tipo == "rev":
-        prod = db.query(models.ProductoReventa).filter(models.ProductoReventa.id == id_db).first()
-        if prod:
-            meli_id_borrado = prod.meli_id
-            prod.meli_id = None
+    destino = publicaciones.desde_sku(unique_id) or publicaciones.resolver(db, [unique_id]).get(unique_id)
+    prod = db.get(*destino) if destino else None
+    if not prod: raise HTTPException(404, "Producto no encontrado")
+
+    meli_id_borrado = prod.meli_id
+    prod.meli_id = None # Desvincular
 
+    # Cerrar la publicación en MeLi antes de desvincularla localmente
+    if meli_id_borrado:
+        _llamar_meli(lambda cliente: cliente.cerrar_publicacion(meli_id_borrado))
     db.commit()
-    # Aquí llamada a DELETE/PUT (closed) en API MeLi con meli_id_borrado
-    return {"status": "success", "message": "Publicación eliminada/desvinculada"}
\ No newline at end of file
+    return {"status": "success", "message": "Publicación eliminada/desvinculada"}
+
+# --- Envío masivo (stock / precio) de publicaciones vinculadas ---
+@router.post("/mercadolibre/lote", response_model=schemas.TrabajoMeLi, status_code=202)
+def sincronizar_lote_meli(solicitud: schemas.SincronizacionLoteRequest, db: Session = Depends(get_db)):
+    if not solicitud.stock and not solicitud.precio:
+        raise HTTPException(400, "Indique stock y/o precio")
+    v, pf, r = models.VarianteProducto, models.ProductoFabricado, models.ProductoReventa
+    consultas = [
+        ("var", db.query(v.id, v.meli_id, v.stockActual, pf.precioVenta).join(pf, pf.id == v.producto_fabricado_id).filter(v.meli_id.isnot(None))),
+        ("rev", db.query(r.id, r.meli_id, r.stockActual, r.precioVenta).filter(r.meli_id.isnot(None))),
+    ]
+    skus = set(solicitud.skus) if solicitud.skus is not None else None
+
+    cambios = {}
+    for prefijo, consulta in consultas:
+        for id_, meli_id, stock, precio in consulta:
+            if skus is not None and f"{prefijo}-{id_}" not in skus:
+                continue
+            cambios[meli_id] = {}
+            if solicitud.stock: cambios[meli_id]["available_quantity"] = max(0, stock)
+            if solicitud.precio: cambios[meli_id]["price"] = float(precio)
+
+    operacion = "+".join(campo for campo, activo in (("stock", solicitud.stock), ("precio", solicitud.precio)) if activo)
+    return meli.lanzar(operacion, cambios)
+
+# --- Conciliación (stock / precio remoto vs local) ---
+# Recorre todas las publicaciones remotas: corre en segundo plano, el resultado queda en
+# GET /mercadolibre/trabajos/{id} (campo conciliacion)
+@router.post("/mercadolibre/conciliar", response_model=schemas.TrabajoMeLi, status_code=202)
+def conciliar_meli(corregir: bool = False):
+    if not meli.ACCESS_TOKEN:
+        raise HTTPException(400, "La conciliación requiere MELI_ACCESS_TOKEN")
+    return publicaciones.lanzar_conciliacion(corregir)
+
+@router.get("/mercadolibre/trabajos/{trabajo_id}", response_model=schemas.TrabajoMeLi)
+def get_trabajo_meli(trabajo_id: str):
+    trabajo = meli.obtener_trabajo(trabajo_id)
+    if not trabajo: raise HTTPException(404, "Trabajo no encontrado")
+    return trabajo
+
+# --- Webhook de notificaciones (órdenes del marketplace) ---
+# Solo encola y responde: las ventas las crean los trabajadores de core/notificaciones.py
+@router.post("/mercadolibre/notificaciones")
+def recibir_notificaciones_meli(
+    payload: Union[Dict[str, Any], List[Dict[str, Any]]] = Body(...),
+    db: Session = Depends(get_db)
+):
+    nuevas = notificaciones.encolar(db, payload if isinstance(payload, list) else [payload])
+    return {"ok": True, "encoladas": nuevas}
+
+@router.get("/mercadolibre/notificaciones", response_model=List[schemas.NotificacionMarketplaceResponse])
+def get_notificaciones_meli(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    estado: Optional[str] = None,
+    orden_externa: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    n = models.NotificacionMarketplace
+    query = db.query(n)
+    if estado: query = query.filter(n.estado == estado)
+    if orden_externa: query = query.filter(n.orden_externa == orden_externa)
+    return paginacion.paginar(query, response, cursor, limite, n.id)
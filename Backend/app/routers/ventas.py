@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File, Header
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional
+from datetime import date
 from app.core.database import get_db
 from app.models import models
 from app.schemas import schemas
-from app.core import security
+from app.core import security, rollup_ventas, paginacion, cache, inventario, importacion, idempotencia, instrumentacion
 
 router = APIRouter(prefix="/ventas", tags=["ventas"])
 
+# Carga anticipada de todo lo que serializa OrdenVentaResponse (2 consultas sin importar cuántas órdenes)
+CARGA_ORDEN_VENTA = (
+    joinedload(models.OrdenVenta.canal),
+    selectinload(models.OrdenVenta.detalles).options(
+        joinedload(models.DetalleOrdenVenta.variante).joinedload(models.VarianteProducto.producto_fabricado),
+        joinedload(models.DetalleOrdenVenta.producto_reventa).joinedload(models.ProductoReventa.proveedor),
+    ),
+)
+
+def _cargar_orden(db: Session, id: int) -> models.OrdenVenta:
+    return db.query(models.OrdenVenta).options(*CARGA_ORDEN_VENTA).populate_existing().filter(models.OrdenVenta.id == id).one()
+
 # --- Canales ---
 @router.get("/canales", response_model=List[schemas.CanalVentaResponse])
 def get_canales(db: Session = Depends(get_db)):
@@ -17,9 +30,19 @@ def get_canales(db: Session = Depends(get_db)):
 @router.post("/", response_model=schemas.OrdenVentaResponse)
 def create_venta(
     orden: schemas.OrdenVentaCreate, 
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(security.get_current_user)
 ):
+    cuerpo = idempotencia.ejecutar(
+        response, db, idempotency_key, "POST /ventas/", orden, schemas.OrdenVentaResponse,
+        lambda: _crear_venta(orden, db, current_user)
+    )
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return cuerpo
+
+def _crear_venta(orden: schemas.OrdenVentaCreate, db: Session, current_user: models.Usuario):
     # Estado inicial por defecto: En Proceso
     estado_inicial = "En Proceso"
     
@@ -31,35 +54,63 @@ def create_venta(
     db.add(db_orden)
     db.flush()
 
-    for item in orden.detalles:
-        # Descontar Stock (Lógica normal de venta)
-        if item.variante_producto_id:
-            variante = db.query(models.VarianteProducto).filter(models.VarianteProducto.id == item.variante_producto_id).first()
-            if variante.stockActual < item.cantidad:
-                raise HTTPException(400, f"Stock insuficiente: {variante.talla} {variante.color}")
-            variante.stockActual -= item.cantidad
-        elif item.producto_reventa_id:
-            prod = db.query(models.ProductoReventa).filter(models.ProductoReventa.id == item.producto_reventa_id).first()
-            if prod.stockActual < item.cantidad:
-                raise HTTPException(400, f"Stock insuficiente: {prod.nombre}")
-            prod.stockActual -= item.cantidad
-
-        db_detalle = models.DetalleOrdenVenta(
+    # Descontar Stock: filas bloqueadas en orden de id y un UPDATE por tabla
+    inventario.ajustar_productos(db, orden.detalles, -1, "Venta", db_orden.id)
+
+    db.add_all([
+        models.DetalleOrdenVenta(
             orden_venta_id=db_orden.id,
             cantidad=item.cantidad,
             precioUnitario=item.precioUnitario,
             variante_producto_id=item.variante_producto_id,
             producto_reventa_id=item.producto_reventa_id
         )
-        db.add(db_detalle)
+        for item in orden.detalles
+    ])
 
+    db.flush()
+    rollup_ventas.registrar(db, [db_orden.id], ventas=1)
+    return _cargar_orden(db, db_orden.id)
+
+# --- Importación Masiva (CSV / NDJSON) ---
+@router.post("/import", response_model=schemas.ImportacionVentasResponse)
+def import_ventas(
+    archivo: UploadFile = File(...),
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    descontar_stock: bool = True,
+    db: Session = Depends(get_db),
+    current_user: models.Usuario = Depends(security.get_current_user)
+):
+    # Sin formato explícito se deduce de la extensión del archivo
+    if not formato:
+        nombre = (archivo.filename or "").lower()
+        formato = "ndjson" if nombre.endswith((".ndjson", ".jsonl")) else "csv"
+
+    resumen = importacion.importar(
+        db, importacion.leer(archivo.file, formato),
+        usuario_id=current_user.id, descontar_stock=descontar_stock
+    )
     db.commit()
-    db.refresh(db_orden)
-    return db_orden
-
-@router.get("/", response_model=List[schemas.OrdenVentaResponse])
-def read_ventas(db: Session = Depends(get_db)):
-    return db.query(models.OrdenVenta).order_by(models.OrdenVenta.fecha.desc()).all()
+    if resumen["ordenes_importadas"]:
+        cache.invalidar(cache.CLAVE_DASHBOARD)
+    return resumen
+
+@router.get("/", response_model=List[schemas.OrdenVentaResponse], dependencies=[Depends(instrumentacion.presupuesto(2))])
+def read_ventas(
+    response: Response,
+    cursor: Optional[str] = None,
+    limite: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    estado: Optional[str] = None,
+    canal_venta_id: Optional[int] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.OrdenVenta).options(*CARGA_ORDEN_VENTA)
+    if estado: query = query.filter(models.OrdenVenta.estado == estado)
+    if canal_venta_id: query = query.filter(models.OrdenVenta.canal_venta_id == canal_venta_id)
+    query = paginacion.rango_fechas(query, models.OrdenVenta.fecha, fecha_desde, fecha_hasta)
+    return paginacion.paginar(query, response, cursor, limite, models.OrdenVenta.fecha, models.OrdenVenta.id)
 
 # NUEVO: Editar Venta (Cambio de Estado y Devolución)
 @router.put("/{id}", response_model=schemas.OrdenVentaResponse)
@@ -69,32 +120,36 @@ def update_venta(id: int, venta_update: schemas.OrdenVentaUpdate, db: Session =
 
     estado_anterior = orden.estado
     nuevo_estado = venta_update.estado
+    cambia_canal = bool(venta_update.canal_venta_id) and venta_update.canal_venta_id != orden.canal_venta_id
+    devuelta_antes = estado_anterior == "Devolución"
+    devuelta_despues = (nuevo_estado or estado_anterior) == "Devolución"
+
+    # Rollup: al cambiar de canal se retira el aporte completo y se vuelve a sumar abajo
+    if cambia_canal:
+        rollup_ventas.registrar(db, [orden.id], ventas=-1, devoluciones=-int(devuelta_antes))
 
     # Lógica de Devolución de Stock
     if nuevo_estado == "Devolución" and estado_anterior != "Devolución":
-        # Reingresar stock
-        for d in orden.detalles:
-            if d.variante: d.variante.stockActual += d.cantidad
-            if d.producto_reventa: d.producto_reventa.stockActual += d.cantidad
-            # Visualmente el total será 0 en el frontend, pero mantenemos el registro del detalle
+        # Reingresar stock (visualmente el total será 0 en el frontend, pero mantenemos el registro del detalle)
+        inventario.ajustar_productos(db, orden.detalles, 1, "Venta", orden.id)
     
     # Lógica de Reactivación (Si estaba en devolución y vuelve a venderse)
-    if estado_anterior == "Devolución" and nuevo_estado != "Devolución":
+    if estado_anterior == "Devolución" and nuevo_estado and nuevo_estado != "Devolución":
         # Descontar stock nuevamente
-        for d in orden.detalles:
-            if d.variante: 
-                if d.variante.stockActual < d.cantidad: raise HTTPException(400, "Stock insuficiente para reactivar venta")
-                d.variante.stockActual -= d.cantidad
-            if d.producto_reventa:
-                if d.producto_reventa.stockActual < d.cantidad: raise HTTPException(400, "Stock insuficiente para reactivar venta")
-                d.producto_reventa.stockActual -= d.cantidad
+        inventario.ajustar_productos(db, orden.detalles, -1, "Venta", orden.id)
 
     if venta_update.estado: orden.estado = venta_update.estado
     if venta_update.canal_venta_id: orden.canal_venta_id = venta_update.canal_venta_id
 
+    db.flush()
+    if cambia_canal:
+        rollup_ventas.registrar(db, [orden.id], ventas=1, devoluciones=int(devuelta_despues))
+    elif devuelta_antes != devuelta_despues:
+        rollup_ventas.registrar(db, [orden.id], devoluciones=1 if devuelta_despues else -1)
+
     db.commit()
-    db.refresh(orden)
-    return orden
+    cache.invalidar(cache.CLAVE_DASHBOARD)
+    return _cargar_orden(db, orden.id)
 
 @router.delete("/{id}")
 def delete_venta(id: int, db: Session = Depends(get_db)):
@@ -103,12 +158,13 @@ def delete_venta(id: int, db: Session = Depends(get_db)):
 
     # Si no es devolución, devolver stock al borrar
     if orden.estado != "Devolución":
-        for item in orden.detalles:
-            if item.variante: item.variante.stockActual += item.cantidad
-            if item.producto_reventa: item.producto_reventa.stockActual += item.cantidad
+        inventario.ajustar_productos(db, orden.detalles, 1, "Venta", orden.id)
+
+    rollup_ventas.registrar(db, [orden.id], ventas=-1, devoluciones=-int(orden.estado == "Devolución"))
 
     db.delete(orden)
     db.commit()
+    cache.invalidar(cache.CLAVE_DASHBOARD)
     return {"ok": True}
 
 # --- CRUD CANALES ---
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, date
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 
@@ -80,11 +80,20 @@ class ProductoReventaResponse(ProductoReventaBase):
         from_attributes = True
 
 # --- Esquemas del Dashboard (Coinciden con tu Frontend interface DashboardStats) ---
+class SaludCanal(BaseModel):
+    canal: str
+    unidades: int
+    ventas_netas: float
+    ultima_venta: Optional[date] = None
+    activo: bool # Tuvo ventas en la ventana del dashboard
+
 class DashboardStats(BaseModel):
     ventas_netas: float
     ordenes_pendientes: int
     tiempo_proceso: str
     canales_ok: str
+    produccion_completable: int = 0 # Órdenes abiertas que el stock de materia prima alcanza a cubrir
+    canales: List[SaludCanal] = []
 
 # --- Materia Prima ---
 class MateriaPrimaBase(BaseModel):
@@ -117,6 +126,7 @@ class DetalleCompraCreate(DetalleCompraBase):
 
 class DetalleCompraResponse(DetalleCompraBase):
     id: int
+    cantidadRecibida: int = 0
     materia_prima: Optional['MateriaPrimaResponse'] = None
     producto_reventa: Optional['ProductoReventaResponse'] = None
     
@@ -194,6 +204,9 @@ class OrdenProduccionBase(BaseModel):
 class OrdenProduccionCreate(OrdenProduccionBase):
     pass
 
+class TerminarLoteRequest(BaseModel):
+    ordenes: List[int]
+
 class OrdenProduccionResponse(OrdenProduccionBase):
     id: int
     fechaCreacion: datetime
@@ -285,7 +298,7 @@ class ProductoAnalisis(BaseModel):
     tipo: str
     stock_actual: int
     total_vendido: int
-    estado_stock: str # 'Crítico', 'Bajo', 'Normal', 'Exceso'
+    estado_stock: str # 'Agotado', 'Crítico', 'Bajo', 'Normal', 'Exceso'
     rotacion: str # 'Alta', 'Media', 'Baja', 'Nula'
 
 class SugerenciaIA(BaseModel):
@@ -297,6 +310,37 @@ class SugerenciaIA(BaseModel):
 class DashboardIAResponse(BaseModel):
     analisis_productos: List[ProductoAnalisis]
     sugerencias: List[SugerenciaIA]
+    # Snapshot precalculado en segundo plano
+    generado_en: Optional[datetime] = None
+    antiguedad_segundos: Optional[float] = None
+    ventas_nuevas: int = 0 # Ventas registradas después del snapshot
+    desactualizado: bool = False
+
+class ReglaBundle(BaseModel):
+    antecedente: str # SKU "var-1" / "rev-2"
+    antecedente_nombre: Optional[str] = None
+    consecuente: str
+    consecuente_nombre: Optional[str] = None
+    ordenes: int # Órdenes donde aparecen juntos
+    soporte: float
+    confianza: float
+    lift: float
+
+class BundlesResponse(BaseModel):
+    generado_en: Optional[datetime] = None
+    ordenes_analizadas: int
+    reglas: List[ReglaBundle]
+
+class PronosticoSKU(BaseModel):
+    sku: str # "var-1" o "rev-2"
+    variante_producto_id: Optional[int] = None
+    producto_reventa_id: Optional[int] = None
+    metodo: str # 'Holt-Winters', 'Croston-SBA'
+    semanas: List[float] # Unidades por semana, empezando por la próxima
+
+class PronosticoResponse(BaseModel):
+    fecha_ejecucion: Optional[datetime] = None
+    pronosticos: List[PronosticoSKU]
 
 class OrdenProduccionUpdate(BaseModel):
     estado: Optional[str] = None
@@ -306,6 +350,132 @@ class OrdenCompraUpdate(BaseModel):
     estado: Optional[str] = None
     proveedor_id: Optional[int] = None
 
+class RecepcionLinea(BaseModel):
+    detalle_id: int
+    cantidad: int
+
+class RecepcionLoteRequest(BaseModel):
+    ordenes: List[int] = [] # Se recibe todo lo pendiente
+    lineas: List[RecepcionLinea] = [] # Recepciones parciales por línea
+
+class ReversionLoteRequest(BaseModel):
+    ordenes: List[int]
+
+# --- REABASTECIMIENTO (Punto de reorden / EOQ) ---
+class ReabastecimientoItem(BaseModel):
+    tipo: str # 'Materia Prima', 'Reventa'
+    id: int
+    nombre: str
+    proveedor_id: Optional[int] = None
+    costo_unitario: float
+    stock_actual: int
+    en_camino: int # Pendiente de recibir en órdenes abiertas (Borrador / Solicitada / Parcial)
+    consumo_diario: float
+    desviacion_diaria: float
+    stock_seguridad: float
+    punto_reorden: float
+    cantidad_economica: float # EOQ
+    cantidad_sugerida: int
+    reordenar: bool
+
+class BorradoresCompraResponse(BaseModel):
+    ordenes_creadas: List[int]
+    items: int
+    sin_proveedor: List[str] # Items que requieren compra pero no tienen proveedor
+
+class ErrorImportacion(BaseModel):
+    linea: int
+    orden: Optional[str] = None
+    error: str
+
+class ImportacionVentasResponse(BaseModel):
+    lineas_leidas: int
+    ordenes_importadas: int
+    detalles_importados: int
+    total_errores: int
+    errores: List[ErrorImportacion] # Primeros errores (máx. 1000)
+
+# --- KARDEX ---
+class MovimientoInventarioResponse(BaseModel):
+    id: int
+    fecha: datetime
+    sku: str
+    cantidad: int
+    documento: str
+    documento_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class StockHistoricoItem(BaseModel):
+    sku: str
+    stock: int
+
+# --- MRP ---
+class MRPItem(BaseModel):
+    materia_prima_id: int
+    nombre: str
+    unidad: str
+    proveedor_id: Optional[int] = None
+    requerido: int # Consumo de todas las órdenes abiertas
+    stock_actual: int
+    en_camino: int # Pendiente de recibir en órdenes Borrador / Solicitada / Parcial
+    faltante: int
+    faltante_con_compras: int
+
+class MRPResponse(BaseModel):
+    ordenes_abiertas: int
+    items: List[MRPItem]
+
+class CapacidadItem(BaseModel):
+    variante_producto_id: int
+    producto_fabricado_id: int
+    producto: str
+    talla: Optional[str] = None
+    color: Optional[str] = None
+    stock_actual: int
+    maximo_producible: Optional[int] = None # None = sin BOM (no limitado por materia prima)
+    materia_limitante_id: Optional[int] = None
+    materia_limitante: Optional[str] = None
+
+class CompraHipotetica(BaseModel):
+    materia_prima_id: int
+    cantidad: int
+
+class SimulacionCapacidad(BaseModel):
+    compras: List[CompraHipotetica] = []
+    incluir_en_camino: bool = False # Sumar también las órdenes de compra abiertas
+
+class CriterioAsignacion(BaseModel):
+    orden_id: int
+    prioridad: int = 0 # Mayor = se atiende antes
+    fecha_entrega: Optional[date] = None
+
+class AsignacionRequest(BaseModel):
+    ordenes: List[CriterioAsignacion] = []
+
+class AsignacionOrden(BaseModel):
+    orden_id: int
+    variante_producto_id: int
+    cantidad: int
+    prioridad: int
+    fecha_entrega: Optional[date] = None
+    completable: bool
+    materias_faltantes: List[str] = []
+
+class AsignacionMateria(BaseModel):
+    materia_prima_id: int
+    nombre: str
+    stock_actual: int
+    asignado: int
+    restante: int
+
+class AsignacionResponse(BaseModel):
+    completables: int
+    bloqueadas: int
+    ordenes: List[AsignacionOrden]
+    materias: List[AsignacionMateria]
+
 class OrdenVentaUpdate(BaseModel):
     estado: Optional[str] = None
     canal_venta_id: Optional[int] = None
@@ -336,6 +506,66 @@ class MeLiUpdateRequest(BaseModel):
     available_quantity: Optional[int] = None
     status: Optional[str] = None # 'active', 'paused'
 
+class SincronizacionLoteRequest(BaseModel):
+    skus: Optional[List[str]] = None # "var-1", "rev-2"; None = todas las publicaciones vinculadas
+    stock: bool = True
+    precio: bool = False
+
+class ErrorTrabajoMeLi(BaseModel):
+    meli_id: str
+    error: str
+
+class DiferenciaPublicacion(BaseModel):
+    sku: str
+    meli_id: str
+    stock_local: int
+    stock_remoto: int
+    precio_local: float
+    precio_remoto: float
+
+class PublicacionSinRemoto(BaseModel):
+    sku: str
+    meli_id: str
+
+class ConciliacionMeLi(BaseModel):
+    publicaciones_remotas: int
+    publicaciones_locales: int
+    cubetas: int
+    cubetas_distintas: int
+    diferencias: List[DiferenciaPublicacion] = []
+    sin_vincular: List[str] = [] # meli_id remotos sin producto local
+    sin_publicacion: List[PublicacionSinRemoto] = [] # Vinculados localmente, sin publicación activa
+    corregidas: int = 0
+    errores: List[ErrorTrabajoMeLi] = []
+    diferidas: List[str] = [] # meli_id con stock sin corregir por órdenes pendientes de registrar
+
+class TrabajoMeLi(BaseModel):
+    id: str
+    operacion: str
+    estado: str # 'En curso', 'Terminado', 'Error'
+    total: int
+    completados: int
+    exitos: int
+    errores: List[ErrorTrabajoMeLi] = []
+    inicio: datetime
+    fin: Optional[datetime] = None
+    conciliacion: Optional[ConciliacionMeLi] = None # Resultado de POST /sincronizacion/mercadolibre/conciliar
+
+class NotificacionMarketplaceResponse(BaseModel):
+    id: int
+    notificacion_id: str
+    topic: Optional[str] = None
+    recurso: Optional[str] = None
+    orden_externa: Optional[str] = None
+    estado: str # 'Pendiente', 'Procesada', 'Descartada', 'Error'
+    intentos: int
+    error: Optional[str] = None
+    orden_venta_id: Optional[int] = None
+    recibida: datetime
+    procesada: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
 class ProductoSincronizacion(BaseModel):
     unique_id: str # "var-1" o "rev-2"
     tipo: str
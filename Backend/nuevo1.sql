@@ -49,6 +49,7 @@ CREATE TABLE ProductoReventa (
     meli_id VARCHAR(50), -- NUEVO: ID de publicación en Mercado Libre
     FOREIGN KEY (proveedor_id) REFERENCES Proveedor(id)
 );
+CREATE UNIQUE INDEX ix_productoreventa_meli_id ON ProductoReventa (meli_id); -- Mapeo publicación -> SKU
 
 -- 6. Tabla de Producto Fabricado (Plantilla Base)
 CREATE TABLE ProductoFabricado (
@@ -69,6 +70,7 @@ CREATE TABLE VarianteProducto (
     FOREIGN KEY (producto_fabricado_id) REFERENCES ProductoFabricado(id)
         ON DELETE CASCADE
 );
+CREATE UNIQUE INDEX ix_varianteproducto_meli_id ON VarianteProducto (meli_id); -- Mapeo publicación -> SKU
 
 -- 8. Tabla de Lista de Materiales (BOM)
 CREATE TABLE ListaMateriales (
@@ -106,6 +108,7 @@ CREATE TABLE DetalleOrdenCompra (
     id SERIAL PRIMARY KEY,
     cantidad INT NOT NULL,
     costoUnitario DECIMAL(10, 2) NOT NULL,
+    cantidadRecibida INT NOT NULL DEFAULT 0, -- Recepciones parciales (orden en estado 'Parcial')
     orden_compra_id INT NOT NULL,
     materia_prima_id INT,
     producto_reventa_id INT,
@@ -138,6 +141,183 @@ CREATE TABLE DetalleOrdenVenta (
     FOREIGN KEY (producto_reventa_id) REFERENCES ProductoReventa(id)
 );
 
+-- Índices para la paginación por cursor (fecha + id) de los listados
+CREATE INDEX ix_ordencompra_fecha_id ON OrdenCompra (fecha, id);
+CREATE INDEX ix_ordenproduccion_fecha_id ON OrdenProduccion (fechaCreacion, id);
+CREATE INDEX ix_ordenventa_fecha_id ON OrdenVenta (fecha, id);
+
+-- 14. Resumen Diario de Ventas (Rollup día x canal x SKU)
+CREATE TABLE VentaDiaria (
+    id SERIAL PRIMARY KEY,
+    fecha DATE NOT NULL,
+    canal_venta_id INT NOT NULL,
+    sku VARCHAR(20) NOT NULL, -- "var-1" o "rev-2"
+    variante_producto_id INT,
+    producto_reventa_id INT,
+    unidades INT NOT NULL DEFAULT 0,
+    ingresos DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    unidadesDevueltas INT NOT NULL DEFAULT 0,
+    ingresosDevueltos DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (canal_venta_id) REFERENCES CanalVenta(id),
+    FOREIGN KEY (variante_producto_id) REFERENCES VarianteProducto(id),
+    FOREIGN KEY (producto_reventa_id) REFERENCES ProductoReventa(id),
+    CONSTRAINT _venta_diaria_uc UNIQUE(fecha, canal_venta_id, sku)
+);
+
+-- 15. Pronóstico de Demanda (Resultado por ejecución)
+CREATE TABLE PronosticoDemanda (
+    id SERIAL PRIMARY KEY,
+    fecha_ejecucion TIMESTAMP NOT NULL,
+    variante_producto_id INT,
+    producto_reventa_id INT,
+    semana INT NOT NULL, -- 1 = próxima semana
+    cantidad DECIMAL(12, 2) NOT NULL,
+    metodo VARCHAR(50) NOT NULL, -- 'Holt-Winters', 'Croston-SBA'
+    FOREIGN KEY (variante_producto_id) REFERENCES VarianteProducto(id) ON DELETE CASCADE,
+    FOREIGN KEY (producto_reventa_id) REFERENCES ProductoReventa(id) ON DELETE CASCADE
+);
+CREATE INDEX ix_pronosticodemanda_fecha_ejecucion ON PronosticoDemanda (fecha_ejecucion);
+
+-- 16. Claves de Idempotencia (POST que crean órdenes)
+CREATE TABLE ClaveIdempotencia (
+    id SERIAL PRIMARY KEY,
+    clave VARCHAR(300) NOT NULL UNIQUE, -- "POST /ventas/:<Idempotency-Key>"
+    huella VARCHAR(64) NOT NULL, -- SHA-256 del cuerpo de la solicitud
+    respuesta TEXT, -- Se escribe en la misma transacción que la orden
+    creada TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX ix_claveidempotencia_creada ON ClaveIdempotencia (creada);
+
+-- 17. Kardex: Movimientos de Inventario (solo inserción)
+CREATE TABLE MovimientoInventario (
+    id SERIAL PRIMARY KEY,
+    fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sku VARCHAR(20) NOT NULL, -- "var-1", "rev-2" o "mat-3"
+    cantidad INT NOT NULL, -- Positivo: entrada, negativo: salida
+    documento VARCHAR(30) NOT NULL, -- 'Venta', 'Compra', 'Producción', 'Ajuste', 'Alta', 'Sincronización'
+    documento_id INT
+);
+CREATE INDEX ix_movimientoinventario_fecha ON MovimientoInventario (fecha);
+CREATE INDEX ix_movimientoinventario_sku_fecha ON MovimientoInventario (sku, fecha);
+
+-- 18. Snapshots de Inventario (compactación periódica del kardex)
+CREATE TABLE SnapshotInventario (
+    id SERIAL PRIMARY KEY,
+    fecha TIMESTAMP NOT NULL, -- Corte: incluye los movimientos con fecha <= corte
+    sku VARCHAR(20) NOT NULL,
+    stock INT NOT NULL,
+    CONSTRAINT _snapshot_inventario_uc UNIQUE(fecha, sku)
+);
+
+-- 19. Bandeja de Salida: cambios de stock/precio de productos publicados (se escribe en la misma transacción)
+CREATE TABLE CambioPublicacion (
+    id SERIAL PRIMARY KEY,
+    fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sku VARCHAR(20) NOT NULL, -- "var-1" o "rev-2" (solo productos con meli_id)
+    campo VARCHAR(20) NOT NULL, -- 'stock' o 'precio'
+    intentos INT NOT NULL DEFAULT 0,
+    tomada TIMESTAMP -- Despacho en curso (se libera al terminar o al vencer el arrendamiento)
+);
+CREATE INDEX ix_cambiopublicacion_sku ON CambioPublicacion (sku);
+
+-- 20. Notificaciones de Marketplace (webhook: cola durable de órdenes entrantes)
+CREATE TABLE NotificacionMarketplace (
+    id SERIAL PRIMARY KEY,
+    notificacion_id VARCHAR(100) UNIQUE NOT NULL, -- _id de la notificación (deduplicación)
+    topic VARCHAR(50),
+    recurso VARCHAR(255), -- ej. /orders/2000003508419013
+    orden_externa VARCHAR(50), -- Id de la orden en el marketplace
+    payload TEXT NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'Pendiente', -- 'Pendiente', 'Procesada', 'Descartada', 'Error'
+    intentos INT NOT NULL DEFAULT 0,
+    error TEXT,
+    orden_venta_id INT,
+    recibida TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    disponible TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Próximo intento (backoff)
+    procesada TIMESTAMP,
+    FOREIGN KEY (orden_venta_id) REFERENCES OrdenVenta(id) ON DELETE SET NULL
+);
+CREATE INDEX ix_notificacionmarketplace_estado_id ON NotificacionMarketplace (estado, id);
+CREATE INDEX ix_notificacionmarketplace_orden_externa ON NotificacionMarketplace (orden_externa);
+
+-- 21. Versión del Catálogo (ETag de /sincronizacion/productos)
+-- Suma de 64 segmentos: cada transacción que cambia una columna visible del catálogo
+-- incrementa, al confirmar, el segmento de su txid (una vez por transacción)
+CREATE TABLE VersionCatalogo (
+    id INT PRIMARY KEY, -- Segmento: mod(txid, 64)
+    version BIGINT NOT NULL DEFAULT 0,
+    transaccion BIGINT -- Última transacción que la incrementó
+);
+
+CREATE OR REPLACE FUNCTION incrementar_version_catalogo() RETURNS trigger AS $$
+BEGIN
+    -- Disparo por fila: solo el primero de la transacción escribe
+    IF current_setting('inventia.version_catalogo', true) IS DISTINCT FROM '1' THEN
+        INSERT INTO VersionCatalogo (id, version, transaccion) VALUES (mod(txid_current(), 64), 1, txid_current())
+        ON CONFLICT (id) DO UPDATE SET version = VersionCatalogo.version + 1, transaccion = EXCLUDED.transaccion
+        WHERE VersionCatalogo.transaccion IS DISTINCT FROM EXCLUDED.transaccion;
+        PERFORM set_config('inventia.version_catalogo', '1', true);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_alta_varianteproducto AFTER INSERT OR DELETE ON VarianteProducto
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION incrementar_version_catalogo();
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_cambio_varianteproducto AFTER UPDATE ON VarianteProducto
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+    WHEN ((OLD.color, OLD.talla, OLD.stockactual, OLD.meli_id, OLD.producto_fabricado_id)
+          IS DISTINCT FROM (NEW.color, NEW.talla, NEW.stockactual, NEW.meli_id, NEW.producto_fabricado_id))
+    EXECUTE FUNCTION incrementar_version_catalogo();
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_alta_productoreventa AFTER INSERT OR DELETE ON ProductoReventa
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION incrementar_version_catalogo();
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_cambio_productoreventa AFTER UPDATE ON ProductoReventa
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+    WHEN ((OLD.nombre, OLD.precioventa, OLD.stockactual, OLD.meli_id)
+          IS DISTINCT FROM (NEW.nombre, NEW.precioventa, NEW.stockactual, NEW.meli_id))
+    EXECUTE FUNCTION incrementar_version_catalogo();
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_alta_productofabricado AFTER INSERT OR DELETE ON ProductoFabricado
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION incrementar_version_catalogo();
+CREATE CONSTRAINT TRIGGER tr_version_catalogo_cambio_productofabricado AFTER UPDATE ON ProductoFabricado
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+    WHEN ((OLD.nombre, OLD.precioventa) IS DISTINCT FROM (NEW.nombre, NEW.precioventa))
+    EXECUTE FUNCTION incrementar_version_catalogo();
+
+-- 22. Publicaciones de Mercado Libre (meli_id -> SKU, único entre variantes y reventa)
+-- La mantienen los triggers al asignar, cambiar o quitar meli_id
+CREATE TABLE PublicacionMeLi (
+    meli_id VARCHAR(50) PRIMARY KEY,
+    sku VARCHAR(20) NOT NULL UNIQUE -- "var-1" o "rev-2"
+);
+
+CREATE OR REPLACE FUNCTION mapear_publicacion_meli() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.meli_id IS NOT DISTINCT FROM NEW.meli_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.meli_id IS NOT NULL THEN
+        DELETE FROM PublicacionMeLi WHERE meli_id = OLD.meli_id AND sku = TG_ARGV[0] || OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.meli_id IS NOT NULL THEN
+        -- Si otro producto ya tiene la publicación falla con unique_violation
+        INSERT INTO PublicacionMeLi (meli_id, sku) VALUES (NEW.meli_id, TG_ARGV[0] || NEW.id);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tr_publicacion_meli_varianteproducto AFTER INSERT OR UPDATE OF meli_id OR DELETE ON VarianteProducto
+    FOR EACH ROW EXECUTE FUNCTION mapear_publicacion_meli('var-');
+CREATE TRIGGER tr_publicacion_meli_productoreventa AFTER INSERT OR UPDATE OF meli_id OR DELETE ON ProductoReventa
+    FOR EACH ROW EXECUTE FUNCTION mapear_publicacion_meli('rev-');
+
+-- Bases existentes: vincula las publicaciones asignadas antes de la tabla. Si dos productos
+-- comparten un meli_id queda vinculado el primero (variantes antes que reventa); el otro
+-- no se resuelve hasta corregir su meli_id.
+INSERT INTO PublicacionMeLi (meli_id, sku)
+SELECT meli_id, 'var-' || id FROM VarianteProducto WHERE meli_id IS NOT NULL
+UNION ALL
+SELECT meli_id, 'rev-' || id FROM ProductoReventa WHERE meli_id IS NOT NULL
+ON CONFLICT DO NOTHING;
+
 -- Inserta los canales de venta base
 INSERT INTO CanalVenta (nombre) VALUES
 ('Mercado Libre'),
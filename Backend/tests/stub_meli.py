@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+from typing import List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Servidor falso de la API de Mercado Libre para las pruebas (lo levanta conftest.py).
+# Por defecto responde bien; programar(ruta, ...) encola respuestas de error para las
+# próximas solicitudes a esa ruta. Registra cada solicitud y la concurrencia máxima.
+
+RETARDO = 0.05 # s por solicitud (para que la concurrencia sea observable)
+
+app = FastAPI()
+estado: dict = {}
+
+def reiniciar():
+    estado.clear()
+    estado.update({
+        "guion": {}, # ruta -> [respuesta programada]
+        "solicitudes": [], # (instante, método, ruta)
+        "activas": 0,
+        "max_activas": 0,
+        "ordenes": {}, # id -> orden (GET /orders/{id})
+        "publicaciones": {}, # id -> item (scan de /users/{id}/items/search y multiget /items?ids=)
+    })
+
+reiniciar()
+
+def programar(ruta: str, *respuestas):
+    """Cada respuesta es un status (int) o un dict {"status", "headers", "cuerpo"}."""
+    estado["guion"].setdefault(ruta, []).extend(
+        {"status": r} if isinstance(r, int) else r for r in respuestas
+    )
+
+def solicitudes(ruta: str) -> List[float]:
+    """Instantes (time.monotonic) de las solicitudes recibidas en `ruta`."""
+    return [t for t, _, r in estado["solicitudes"] if r == ruta]
+
+@app.middleware("http")
+async def registrar(request: Request, call_next):
+    ruta = request.url.path
+    estado["solicitudes"].append((time.monotonic(), request.method, ruta))
+    estado["activas"] += 1
+    estado["max_activas"] = max(estado["max_activas"], estado["activas"])
+    try:
+        await asyncio.sleep(RETARDO)
+        guion = estado["guion"].get(ruta)
+        if guion:
+            r = guion.pop(0)
+            cuerpo = r.get("cuerpo", json.dumps({"error": "programado"}))
+            return Response(cuerpo, r["status"], headers=r.get("headers"), media_type="application/json")
+        return await call_next(request)
+    finally:
+        estado["activas"] -= 1
+
+@app.put("/items/{meli_id}")
+async def editar(meli_id: str, request: Request):
+    cambios = await request.json()
+    if meli_id in estado["publicaciones"]:
+        estado["publicaciones"][meli_id].update(cambios)
+    return {"id": meli_id, **cambios}
+
+@app.post("/items")
+async def publicar(request: Request):
+    return {**(await request.json()), "id": f"MLM{len(estado['solicitudes'])}", "status": "active"}
+
+@app.get("/orders/{orden_id}")
+async def orden(orden_id: str):
+    if orden_id not in estado["ordenes"]:
+        return JSONResponse({"error": "not_found"}, 404)
+    return estado["ordenes"][orden_id]
+
+@app.get("/users/me")
+async def usuario():
+    return {"id": 1}
+
+@app.get("/users/{usuario_id}/items/search")
+async def buscar(limit: int = 50, scroll_id: str = None):
+    # Scan: páginas de `limit` ids; el scroll_id es la posición siguiente
+    ids = sorted(estado["publicaciones"])
+    inicio = int(scroll_id or 0)
+    return {"results": ids[inicio:inicio + limit], "scroll_id": str(inicio + limit)}
+
+@app.get("/items")
+async def multiget(ids: str):
+    publicaciones = estado["publicaciones"]
+    return [{"code": 200, "body": publicaciones[i]} if i in publicaciones else {"code": 404} for i in ids.split(",")]
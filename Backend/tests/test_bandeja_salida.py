@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app.models import models
+from app.core import bandeja_salida, meli
+from app.core.database import SessionLocal
+
+# Despacho de la bandeja de salida hacia Mercado Libre (core/bandeja_salida.py).
+
+def publicados(db):
+    """Un producto de reventa y una variante publicados, con un cambio de stock encolado cada uno."""
+    fabricado = models.ProductoFabricado(nombre="Playera", precioVenta=200)
+    db.add_all([fabricado, models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=7, meli_id="MLR1")])
+    db.flush()
+    db.add(models.VarianteProducto(color="Rojo", talla="M", stockActual=-2, producto_fabricado_id=fabricado.id, meli_id="MLV1"))
+    db.flush()
+    bandeja_salida.registrar(db, models.ProductoReventa, [1], bandeja_salida.CAMPO_STOCK)
+    bandeja_salida.registrar(db, models.ProductoReventa, [1], bandeja_salida.CAMPO_PRECIO)
+    bandeja_salida.registrar(db, models.VarianteProducto, [1], bandeja_salida.CAMPO_STOCK)
+    db.commit()
+
+def bandeja(db):
+    cp = models.CambioPublicacion
+    db.expire_all()
+    return db.query(cp.sku, cp.intentos, cp.tomada).order_by(cp.id).all()
+
+def test_despacha_el_valor_vigente(meli_falso, db):
+    publicados(db)
+    assert bandeja_salida.despachar(db) == 3
+    assert bandeja(db) == []
+    assert len(meli_falso.solicitudes("/items/MLR1")) == 1 # Stock y precio en una sola llamada
+    assert len(meli_falso.solicitudes("/items/MLV1")) == 1
+
+def test_no_retiene_la_transaccion_durante_el_envio(meli_falso, db, monkeypatch):
+    publicados(db)
+    ejecutar = meli.ejecutar
+    vistas = []
+
+    def espiar(operacion):
+        # Otra sesión puede bloquear las filas (NOWAIT fallaría si siguieran bloqueadas) y las ve tomadas
+        with SessionLocal() as otra:
+            vistas.extend(otra.execute(text("SELECT tomada FROM cambiopublicacion FOR UPDATE NOWAIT")).scalars())
+            otra.rollback()
+        return ejecutar(operacion)
+
+    monkeypatch.setattr(meli, "ejecutar", espiar)
+    bandeja_salida.despachar(db)
+    assert len(vistas) == 3 and all(vistas)
+    # Mientras tanto, otro despachador no toma las filas reservadas
+    assert bandeja(db) == []
+
+def test_los_fallidos_vuelven_a_la_bandeja(meli_falso, db):
+    publicados(db)
+    meli_falso.programar("/items/MLR1", {"status": 200, "cuerpo": "<html>no es JSON</html>"})
+    meli_falso.programar("/items/MLV1", 404)
+    assert bandeja_salida.despachar(db) == 3
+    assert bandeja(db) == [("rev-1", 1, None), ("rev-1", 1, None), ("var-1", 1, None)]
+
+    # Siguiente ronda: ya responden bien
+    assert bandeja_salida.despachar(db) == 3
+    assert bandeja(db) == []
+
+def test_error_del_cliente_reintenta_todo_el_lote(meli_falso, db, monkeypatch):
+    publicados(db)
+    def caido(operacion):
+        raise RuntimeError("sin conexión")
+    monkeypatch.setattr(meli, "ejecutar", caido)
+    bandeja_salida.despachar(db)
+    assert [f.intentos for f in bandeja(db)] == [1, 1, 1]
+
+def test_arrendamiento_vencido(meli_falso, db):
+    publicados(db)
+    cp = models.CambioPublicacion
+    # Un despachador que cayó a mitad: su reserva reciente se respeta, la vencida se retoma
+    db.query(cp).filter(cp.sku == "rev-1").update({"tomada": datetime.now()})
+    db.query(cp).filter(cp.sku == "var-1").update({"tomada": datetime.now() - timedelta(seconds=bandeja_salida.ARRENDAMIENTO + 1)})
+    db.commit()
+    assert bandeja_salida.despachar(db) == 1
+    assert [f.sku for f in bandeja(db)] == ["rev-1", "rev-1"]
+    assert meli_falso.solicitudes("/items/MLR1") == []
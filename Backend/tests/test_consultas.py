@@ -0,0 +1,73 @@
+import re
+from datetime import datetime
+import pytest
+from app.models import models
+from app.core import bom
+
+# El número de sentencias SQL de los listados y detalles no debe crecer con las filas
+# (N+1 por carga perezosa). Se lee del header Server-Timing (core/instrumentacion.py).
+
+_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+def consultas(respuesta) -> int:
+    assert respuesta.status_code == 200, respuesta.text
+    return int(_CONSULTAS.search(respuesta.headers["Server-Timing"]).group(1))
+
+def poblar(db, n: int):
+    """n filas de cada tipo, con sus relaciones (detalles, variantes, proveedores)."""
+    canal = db.query(models.CanalVenta).first() or models.CanalVenta(nombre="Tienda")
+    proveedor = db.query(models.Proveedor).first() or models.Proveedor(nombre="Proveedor")
+    db.add_all([canal, proveedor])
+    db.flush()
+    for i in range(n):
+        fabricado = models.ProductoFabricado(nombre=f"Producto {i}", precioVenta=100)
+        reventa = models.ProductoReventa(nombre=f"Reventa {i}", costoCompra=5, precioVenta=10, stockActual=10, proveedor_id=proveedor.id)
+        materia = models.MateriaPrima(nombre=f"Materia {i}", costo=1, unidadMedida="m", stockActual=100, proveedor_id=proveedor.id)
+        db.add_all([fabricado, reventa, materia])
+        db.flush()
+        variante = models.VarianteProducto(color="Rojo", talla="M", stockActual=10, producto_fabricado_id=fabricado.id)
+        db.add_all([variante, models.ListaMateriales(cantidadRequerida=1, producto_fabricado_id=fabricado.id, materia_prima_id=materia.id)])
+        db.flush()
+
+        venta = models.OrdenVenta(canal_venta_id=canal.id, estado="Pagada")
+        compra = models.OrdenCompra(proveedor_id=proveedor.id)
+        db.add_all([venta, compra, models.OrdenProduccion(cantidadProducida=1, variante_producto_id=variante.id)])
+        db.flush()
+        db.add_all([
+            models.DetalleOrdenVenta(orden_venta_id=venta.id, cantidad=1, precioUnitario=100, variante_producto_id=variante.id),
+            models.DetalleOrdenVenta(orden_venta_id=venta.id, cantidad=1, precioUnitario=10, producto_reventa_id=reventa.id),
+            models.DetalleOrdenCompra(orden_compra_id=compra.id, cantidad=5, costoUnitario=1, materia_prima_id=materia.id),
+            models.DetalleOrdenCompra(orden_compra_id=compra.id, cantidad=5, costoUnitario=5, producto_reventa_id=reventa.id),
+            models.MovimientoInventario(sku=f"var-{variante.id}", cantidad=10, documento="Alta", documento_id=variante.id),
+        ])
+    db.commit()
+    bom.invalidar() # Escritura directa, sin pasar por los routers que invalidan
+
+ENDPOINTS = [
+    "/ventas/?limite=500",
+    "/compras/?limite=500",
+    "/produccion/ordenes?limite=500",
+    "/produccion/variantes?limite=500",
+    "/produccion/bom",
+    "/produccion/bom/1",
+    "/produccion/mrp",
+    "/produccion/capacidad",
+    "/reportes/inventario-producto",
+    "/reportes/inventario-materia",
+    "/reportes/movimientos?limite=500",
+    f"/reportes/ventas-diarias?fecha_inicio=2000-01-01&fecha_fin={datetime.now().date()}",
+    f"/reportes/stock-historico?fecha={datetime.now().isoformat()}",
+]
+
+@pytest.mark.parametrize("ruta", ENDPOINTS)
+def test_consultas_no_crecen_con_las_filas(cliente, db, ruta):
+    poblar(db, 3)
+    pocas = consultas(cliente.get(ruta))
+    poblar(db, 30)
+    assert consultas(cliente.get(ruta)) == pocas
+
+def test_presupuesto_de_listados(cliente, db):
+    poblar(db, 10)
+    assert consultas(cliente.get("/ventas/")) <= 2
+    assert consultas(cliente.get("/compras/")) <= 2
+    assert consultas(cliente.get("/produccion/ordenes")) <= 1
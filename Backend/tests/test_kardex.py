@@ -0,0 +1,49 @@
+import time
+from datetime import datetime, timedelta, timezone
+from app.core import kardex
+from app.models import models
+
+# Kardex (core/kardex.py): snapshots de compactación y stock a una fecha.
+
+def reventa(db, stock=10):
+    r = models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=stock)
+    db.add(r)
+    db.commit()
+    return r.id
+
+def mover(sesion, id_, delta):
+    r = sesion.get(models.ProductoReventa, id_)
+    r.stockActual += delta
+    kardex.registrar(sesion, models.ProductoReventa, {id_: delta}, "Ajuste", id_)
+
+def test_transaccion_larga_no_queda_antes_del_corte(db, monkeypatch):
+    from app.core.database import SessionLocal
+    monkeypatch.setattr(kardex, "MARGEN_CORTE", timedelta(0))
+    id_ = reventa(db)
+    assert kardex.compactar(db) is not None
+    mover(db, id_, 5)
+    db.commit()
+
+    with SessionLocal() as otra:
+        # Movimiento fechado al inicio de `otra`, invisible hasta el commit
+        mover(otra, id_, -3)
+        otra.flush()
+        time.sleep(0.05)
+        corte = kardex.compactar(db)
+        assert corte is not None
+        otra.commit()
+
+    time.sleep(0.05)
+    assert kardex.compactar(db) > corte
+    assert kardex.stock_en(db, datetime(2100, 1, 1)) == {f"rev-{id_}": 12}
+
+def test_stock_historico_convierte_el_offset(cliente, db):
+    id_ = reventa(db)
+    mover(db, id_, -3)
+    db.commit()
+
+    # Hace una hora, escrita en UTC+14: quitar el offset la llevaría 13 horas al futuro
+    antes = (datetime.now().astimezone() - timedelta(hours=1)).astimezone(timezone(timedelta(hours=14)))
+    r = cliente.get("/reportes/stock-historico", params={"fecha": antes.isoformat(), "sku": f"rev-{id_}"})
+    assert r.status_code == 200, r.text
+    assert r.json() == [{"sku": f"rev-{id_}", "stock": 10}]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+from app.core import meli
+
+# Cliente asíncrono de Mercado Libre (core/meli.py) contra el servidor falso (stub_meli.py):
+# reintentos, Retry-After, límites de concurrencia y tasa, y errores por operación en lote.
+
+def correr(operacion, **opciones):
+    async def con_cliente():
+        cliente = meli.ClienteMeLi(**opciones)
+        try:
+            return await operacion(cliente)
+        finally:
+            await cliente.cerrar()
+    return asyncio.run(con_cliente())
+
+def test_reintenta_errores_transitorios(meli_falso):
+    meli_falso.programar("/items/A", 503, 500)
+    assert correr(lambda c: c.editar("A", {"price": 10})) == {"id": "A", "price": 10}
+    assert len(meli_falso.solicitudes("/items/A")) == 3
+
+def test_agota_los_reintentos(meli_falso):
+    meli_falso.programar("/items/A", *[503] * 5)
+    with pytest.raises(meli.ErrorMeLi) as error:
+        correr(lambda c: c.editar("A", {"price": 10}), reintentos=2)
+    assert error.value.status == 503
+    assert len(meli_falso.solicitudes("/items/A")) == 3
+
+def test_no_reintenta_errores_del_cliente(meli_falso):
+    meli_falso.programar("/items/A", 404)
+    with pytest.raises(meli.ErrorMeLi) as error:
+        correr(lambda c: c.editar("A", {"price": 10}))
+    assert error.value.status == 404
+    assert len(meli_falso.solicitudes("/items/A")) == 1
+
+def test_no_reintenta_post_procesado_quiza(meli_falso):
+    # Un 5xx no garantiza que la publicación no se haya creado
+    meli_falso.programar("/items", 503)
+    with pytest.raises(meli.ErrorMeLi) as error:
+        correr(lambda c: c.publicar({"title": "Gorra"}))
+    assert error.value.status == 503
+    assert len(meli_falso.solicitudes("/items")) == 1
+
+    # Un 429 sí (no se procesó)
+    meli_falso.programar("/items", 429)
+    assert correr(lambda c: c.publicar({"title": "Gorra"}))["status"] == "active"
+    assert len(meli_falso.solicitudes("/items")) == 3
+
+    # Un timeout de lectura no (el servidor pudo haberla creado)
+    with pytest.raises(meli.ErrorMeLi, match="conexión"):
+        correr(lambda c: c.publicar({"title": "Gorra"}), timeout=0.01)
+    time.sleep(0.2) # Un reintento ya habría llegado
+    assert len(meli_falso.solicitudes("/items")) == 4
+
+def test_respeta_retry_after(meli_falso, monkeypatch):
+    monkeypatch.setattr(meli, "BACKOFF_BASE", 10) # Si no se usara Retry-After la prueba tardaría segundos
+    meli_falso.programar("/items/A", {"status": 429, "headers": {"Retry-After": "0.3"}})
+    correr(lambda c: c.editar("A", {"price": 10}))
+    primera, segunda = meli_falso.solicitudes("/items/A")
+    assert 0.3 <= segunda - primera < 1.0
+
+def test_limite_de_concurrencia(meli_falso):
+    resultado = correr(lambda c: c.en_lote((f"I{i}", {"price": i}) for i in range(40)), concurrencia=4, tasa=1000)
+    assert resultado["exitos"] == 40
+    assert meli_falso.estado["max_activas"] == 4
+
+def test_limite_de_tasa(meli_falso):
+    inicio = time.monotonic()
+    correr(lambda c: c.en_lote((f"I{i}", {}) for i in range(10)), concurrencia=10, tasa=5)
+    # Ráfaga inicial de 5 fichas; las otras 5 a 5 por segundo
+    assert time.monotonic() - inicio >= 0.9
+
+def test_en_lote_aisla_cualquier_error(meli_falso):
+    meli_falso.programar("/items/ROTO", {"status": 200, "cuerpo": "<html>no es JSON</html>"})
+    meli_falso.programar("/items/NO", 404)
+    resultado = correr(lambda c: c.en_lote([("OK1", {}), ("ROTO", {}), ("NO", {}), ("OK2", {})]))
+    assert resultado["completados"] == 4
+    assert resultado["exitos"] == 2
+    assert sorted(e["meli_id"] for e in resultado["errores"]) == ["NO", "ROTO"]
+
+def test_error_de_conexion(meli_falso):
+    with pytest.raises(meli.ErrorMeLi, match="conexión") as error:
+        correr(lambda c: c.editar("A", {}), base_url="http://127.0.0.1:9", reintentos=1)
+    assert error.value.status is None
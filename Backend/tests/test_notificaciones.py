@@ -0,0 +1,101 @@
+from datetime import datetime
+from app.models import models
+from app.core import notificaciones
+
+# Ingesta de órdenes del marketplace por webhook (core/notificaciones.py): la cola se
+# procesa con procesar_lote() directamente (sin los trabajadores de startup).
+
+def orden(id_, *items, status="paid"):
+    return {"id": id_, "status": status, "date_created": "2026-10-01T10:00:00.000-04:00", "order_items": list(items)}
+
+def item(meli_id, cantidad, precio=100):
+    return {"item": {"id": meli_id}, "quantity": cantidad, "unit_price": precio}
+
+def catalogo(db):
+    db.add_all([
+        models.CanalVenta(nombre=notificaciones.CANAL),
+        models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=120, stockActual=10, meli_id="MLR1"),
+    ])
+    db.commit()
+
+def estados(db):
+    n = models.NotificacionMarketplace
+    db.expire_all()
+    return {f.notificacion_id: f for f in db.query(n)}
+
+def stock(db):
+    db.expire_all()
+    return db.query(models.ProductoReventa).one().stockActual
+
+def test_procesa_el_lote_y_aisla_las_ordenes_invalidas(cliente, db, meli_falso):
+    catalogo(db)
+    meli_falso.estado["ordenes"]["600"] = orden(600, item("MLR1", 1))
+    meli_falso.estado["ordenes"]["601"] = orden(601, item("MLR1", 1), status="payment_required")
+    meli_falso.programar("/orders/602", {"status": 200, "cuerpo": ""}) # Cuerpo vacío
+    meli_falso.programar("/orders/603", {"status": 200, "cuerpo": "<html>no es JSON</html>"})
+    meli_falso.programar("/orders/604", *[503] * 5) # Transitorio: se reintenta más tarde
+
+    r = cliente.post("/sincronizacion/mercadolibre/notificaciones", json=[
+        {"_id": "e1", "order": orden(777, item("MLR1", 2))},
+        {"_id": "e2", "order": orden(777, item("MLR1", 2))}, # Otra notificación de la misma orden
+        {"_id": "e3", "order": orden(778, "no es un dict")},
+        {"_id": "e4", "order": orden(779, item("NOPE", 1))},
+        {"_id": "r0", "topic": "orders_v2", "resource": "/orders/600"},
+        {"_id": "r1", "topic": "orders_v2", "resource": "/orders/601"},
+        {"_id": "r2", "topic": "orders_v2", "resource": "/orders/602"},
+        {"_id": "r3", "topic": "orders_v2", "resource": "/orders/603"},
+        {"_id": "r4", "topic": "orders_v2", "resource": "/orders/604"},
+        {"_id": "r5", "topic": "orders_v2", "resource": "/orders/605"}, # 404
+        {"_id": "q1", "topic": "questions", "resource": "/questions/1"},
+    ])
+    assert r.json() == {"ok": True, "encoladas": 11}
+    assert notificaciones.procesar_lote(db) == 11
+
+    e = estados(db)
+    assert {k: f.estado for k, f in e.items()} == {
+        "e1": "Procesada", "e2": "Descartada", "e3": "Error", "e4": "Error",
+        "r0": "Procesada", "r1": "Descartada", "r2": "Error", "r3": "Error",
+        "r4": "Pendiente", "r5": "Error", "q1": "Descartada",
+    }
+    assert e["e2"].orden_venta_id == e["e1"].orden_venta_id
+    assert "SKU desconocido" in e["e4"].error
+    assert e["r4"].intentos == 1 and e["r4"].disponible > datetime.now()
+    assert stock(db) == 7
+    assert db.query(models.OrdenVenta).count() == 2
+
+def test_reentregas_no_duplican_ventas(cliente, db, meli_falso):
+    catalogo(db)
+    notificacion = {"_id": "e1", "order": orden(777, item("MLR1", 2))}
+    cliente.post("/sincronizacion/mercadolibre/notificaciones", json=notificacion)
+    notificaciones.procesar_lote(db)
+
+    # La misma notificación se ignora al encolar; otra de la misma orden se descarta
+    assert cliente.post("/sincronizacion/mercadolibre/notificaciones", json=notificacion).json()["encoladas"] == 0
+    cliente.post("/sincronizacion/mercadolibre/notificaciones", json={**notificacion, "_id": "e2"})
+    assert notificaciones.procesar_lote(db) == 1
+    assert estados(db)["e2"].estado == "Descartada"
+    assert stock(db) == 8
+    assert db.query(models.OrdenVenta).count() == 1
+
+def test_consulta_las_ordenes_sin_retener_la_transaccion(cliente, db, meli_falso, monkeypatch):
+    from sqlalchemy import text
+    from app.core.database import SessionLocal
+    catalogo(db)
+    meli_falso.estado["ordenes"]["600"] = orden(600, item("MLR1", 1))
+    cliente.post("/sincronizacion/mercadolibre/notificaciones", json={"_id": "r0", "topic": "orders_v2", "resource": "/orders/600"})
+
+    durante = {}
+    obtener = notificaciones._obtener_ordenes
+    def obtener_y_revisar(recursos):
+        with SessionLocal() as otra:
+            # Sin bloqueos sobre la fila, pero reservada: otro trabajador no la toma
+            otra.execute(text("SELECT id FROM notificacionmarketplace FOR UPDATE NOWAIT")).all()
+            otra.rollback()
+            durante["tomadas"] = notificaciones.procesar_lote(otra)
+        return obtener(recursos)
+    monkeypatch.setattr(notificaciones, "_obtener_ordenes", obtener_y_revisar)
+
+    assert notificaciones.procesar_lote(db) == 1
+    assert durante == {"tomadas": 0}
+    assert estados(db)["r0"].estado == "Procesada"
+    assert stock(db) == 9
@@ -0,0 +1,110 @@
+from app.models import models
+
+# Consumo de materia prima al terminar órdenes de producción (BOM en caché, core/bom.py).
+
+def catalogo(db, cantidad_requerida, stock_materia):
+    """Un producto con una variante y una materia prima en su BOM. Devuelve (variante_id, materia_id)."""
+    fabricado = models.ProductoFabricado(nombre="Playera", precioVenta=200)
+    materia = models.MateriaPrima(nombre="Tela", costo=10, unidadMedida="m", stockActual=stock_materia)
+    db.add_all([fabricado, materia])
+    db.flush()
+    variante = models.VarianteProducto(color="Rojo", talla="M", stockActual=0, producto_fabricado_id=fabricado.id)
+    db.add_all([variante, models.ListaMateriales(
+        cantidadRequerida=cantidad_requerida, producto_fabricado_id=fabricado.id, materia_prima_id=materia.id
+    )])
+    db.commit()
+    return variante.id, materia.id
+
+def stock(db, modelo, id_):
+    db.expire_all()
+    return db.get(modelo, id_).stockActual
+
+def test_terminar_trunca_el_consumo_decimal(cliente, db):
+    # 0.29 * 100 = 29 exacto (en float daría 28.999... y se truncaría a 28)
+    variante_id, materia_id = catalogo(db, "0.29", 29)
+    orden = cliente.post("/produccion/ordenes", json={"cantidadProducida": 100, "variante_producto_id": variante_id}).json()
+
+    assert cliente.get("/produccion/mrp").json()["items"][0]["requerido"] == 29
+    assert cliente.get("/produccion/capacidad").json()[0]["maximo_producible"] == 100
+    assert cliente.get("/produccion/asignacion").json()["completables"] == 1
+
+    r = cliente.put(f"/produccion/ordenes/{orden['id']}/terminar")
+    assert r.status_code == 200, r.text
+    assert stock(db, models.MateriaPrima, materia_id) == 0
+    assert stock(db, models.VarianteProducto, variante_id) == 100
+
+    # Revertir devuelve exactamente lo consumido
+    r = cliente.put(f"/produccion/ordenes/{orden['id']}", json={"estado": "En Proceso"})
+    assert r.status_code == 200, r.text
+    assert stock(db, models.MateriaPrima, materia_id) == 29
+    assert stock(db, models.VarianteProducto, variante_id) == 0
+
+# --- Terminar lote ---
+def ordenes(cliente, variante_id, *cantidades):
+    return [
+        cliente.post("/produccion/ordenes", json={"cantidadProducida": q, "variante_producto_id": variante_id}).json()["id"]
+        for q in cantidades
+    ]
+
+def test_terminar_lote(cliente, db):
+    variante_id, materia_id = catalogo(db, "1.5", 100)
+    ids = ordenes(cliente, variante_id, 3, 5)
+
+    r = cliente.put("/produccion/ordenes/terminar-lote", json={"ordenes": ids})
+    assert r.status_code == 200, r.text
+    assert [o["estado"] for o in r.json()] == ["Terminado", "Terminado"]
+    assert stock(db, models.VarianteProducto, variante_id) == 8
+    # Redondeo por orden, igual que al terminarlas una a una: int(4.5) + int(7.5) = 11
+    assert stock(db, models.MateriaPrima, materia_id) == 89
+
+    m = models.MovimientoInventario
+    movimientos = db.query(m.sku, m.cantidad, m.documento_id).filter(m.documento == "Producción").order_by(m.id).all()
+    assert sorted(movimientos) == sorted([
+        (f"var-{variante_id}", 3, ids[0]), (f"var-{variante_id}", 5, ids[1]),
+        (f"mat-{materia_id}", -4, ids[0]), (f"mat-{materia_id}", -7, ids[1]),
+    ])
+
+    r = cliente.put("/produccion/ordenes/terminar-lote", json={"ordenes": ids})
+    assert r.status_code == 400
+
+def test_terminar_lote_todo_o_nada(cliente, db):
+    variante_id, materia_id = catalogo(db, "2", 10)
+    ids = ordenes(cliente, variante_id, 4, 4) # Requieren 16, hay 10
+
+    r = cliente.put("/produccion/ordenes/terminar-lote", json={"ordenes": ids})
+    assert r.status_code == 400
+    assert "Tela" in r.json()["detail"]
+    assert stock(db, models.MateriaPrima, materia_id) == 10
+    assert stock(db, models.VarianteProducto, variante_id) == 0
+    assert {o.estado for o in db.query(models.OrdenProduccion)} == {"En Proceso"}
+    assert db.query(models.MovimientoInventario).filter_by(documento="Producción").count() == 0
+
+    assert cliente.put("/produccion/ordenes/terminar-lote", json={"ordenes": [ids[0], 999]}).status_code == 404
+
+def test_terminar_concurrente_no_duplica_stock(cliente, db):
+    import threading
+    import time
+    from app.core.database import SessionLocal
+    variante_id, materia_id = catalogo(db, "1", 10)
+    orden_id = ordenes(cliente, variante_id, 3)[0]
+
+    # Otra transacción termina la orden mientras la petición está en curso
+    with SessionLocal() as otra:
+        orden = otra.query(models.OrdenProduccion).filter_by(id=orden_id).with_for_update().one()
+        orden.estado = "Terminado"
+        otra.get(models.VarianteProducto, variante_id).stockActual += 3
+        otra.get(models.MateriaPrima, materia_id).stockActual -= 3
+        otra.flush()
+
+        respuesta = {}
+        hilo = threading.Thread(target=lambda: respuesta.update(
+            r=cliente.put(f"/produccion/ordenes/{orden_id}", json={"estado": "Terminado"})
+        ))
+        hilo.start()
+        time.sleep(0.2)
+        otra.commit()
+        hilo.join()
+
+    assert respuesta["r"].status_code == 200, respuesta["r"].text
+    assert stock(db, models.VarianteProducto, variante_id) == 3
+    assert stock(db, models.MateriaPrima, materia_id) == 7
@@ -0,0 +1,146 @@
+import json
+import time
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app.models import models
+from app.core import publicaciones
+
+# Conciliación contra las publicaciones remotas (core/publicaciones.py) y unicidad del
+# meli_id entre variantes y productos de reventa (models.PublicacionMeLi).
+
+def catalogo(db):
+    """Dos productos de reventa publicados (MLR1, MLR2) con stock 10 y precio 100."""
+    db.add_all([
+        models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=100, stockActual=10, meli_id="MLR1"),
+        models.ProductoReventa(nombre="Bolsa", costoCompra=5, precioVenta=100, stockActual=10, meli_id="MLR2"),
+    ])
+    db.commit()
+
+def remotas(meli_falso, **items):
+    """Publicaciones remotas: meli_id=(stock, precio)."""
+    for meli_id, (stock, precio) in items.items():
+        meli_falso.estado["publicaciones"][meli_id] = {"id": meli_id, "available_quantity": stock, "price": precio, "status": "active"}
+
+def remota(meli_falso, meli_id):
+    item = meli_falso.estado["publicaciones"][meli_id]
+    return item["available_quantity"], item["price"]
+
+def conciliar(cliente):
+    """POST /conciliar?corregir=true y espera el trabajo; devuelve su resultado."""
+    r = cliente.post("/sincronizacion/mercadolibre/conciliar?corregir=true")
+    assert r.status_code == 202, r.text
+    limite = time.monotonic() + 10
+    while (trabajo := cliente.get(f"/sincronizacion/mercadolibre/trabajos/{r.json()['id']}").json())["estado"] == "En curso":
+        assert time.monotonic() < limite, "El trabajo de conciliación no terminó"
+        time.sleep(0.02)
+    assert trabajo["estado"] == "Terminado"
+    return trabajo["conciliacion"]
+
+def test_la_conciliacion_periodica_solo_reporta(db, meli_falso, caplog):
+    catalogo(db)
+    remotas(meli_falso, MLR1=(7, 100), MLR2=(10, 100))
+
+    caplog.set_level("INFO", logger=publicaciones.__name__)
+    publicaciones.conciliar_periodico()
+    assert "1 diferencias" in caplog.text
+    assert meli_falso.solicitudes("/items/MLR1") == []
+    assert remota(meli_falso, "MLR1") == (7, 100)
+
+def test_corregir_difiere_el_stock_con_ordenes_pendientes(cliente, db, meli_falso):
+    catalogo(db)
+    remotas(meli_falso, MLR1=(7, 90), MLR2=(7, 100))
+    # Venta de MLR1 recibida por el webhook y aún sin registrar (stock local sin descontar)
+    cliente.post("/sincronizacion/mercadolibre/notificaciones", json={
+        "_id": "n1", "order": {"id": 1, "status": "paid", "order_items": [{"item": {"id": "MLR1"}, "quantity": 3, "unit_price": 100}]},
+    })
+
+    resultado = conciliar(cliente)
+    assert len(resultado["diferencias"]) == 2
+    assert resultado["diferidas"] == ["MLR1"]
+    assert resultado["corregidas"] == 2
+    assert remota(meli_falso, "MLR1") == (7, 100) # Solo el precio
+    assert remota(meli_falso, "MLR2") == (10, 100)
+
+def test_orden_pendiente_sin_detalle_difiere_todo_el_stock(cliente, db, meli_falso):
+    catalogo(db)
+    remotas(meli_falso, MLR1=(7, 100), MLR2=(7, 100))
+    # Solo el recurso: no se sabe qué publicaciones incluye
+    cliente.post("/sincronizacion/mercadolibre/notificaciones", json={"_id": "n1", "topic": "orders_v2", "resource": "/orders/1"})
+
+    resultado = conciliar(cliente)
+    assert sorted(resultado["diferidas"]) == ["MLR1", "MLR2"]
+    assert resultado["corregidas"] == 0
+    assert meli_falso.solicitudes("/items/MLR1") == meli_falso.solicitudes("/items/MLR2") == []
+
+    # Registrada la orden, la corrección se aplica
+    db.query(models.NotificacionMarketplace).update({"estado": "Procesada"})
+    db.commit()
+    assert conciliar(cliente)["diferidas"] == []
+    assert remota(meli_falso, "MLR1") == remota(meli_falso, "MLR2") == (10, 100)
+
+# --- Unicidad del meli_id ---
+def variante(db, meli_id):
+    fabricado = models.ProductoFabricado(nombre="Playera", precioVenta=200)
+    db.add(fabricado)
+    db.flush()
+    v = models.VarianteProducto(color="Rojo", talla="M", stockActual=0, producto_fabricado_id=fabricado.id, meli_id=meli_id)
+    db.add(v)
+    db.commit()
+    return v.id
+
+def test_meli_id_unico_entre_variantes_y_reventa(db):
+    variante_id = variante(db, "MLX")
+    db.add(models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=1, meli_id="MLX"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    assert publicaciones.resolver(db, ["MLX"]) == {"MLX": (models.VarianteProducto, variante_id)}
+
+    # Desvinculada la variante, la publicación puede pasar a otro producto
+    db.get(models.VarianteProducto, variante_id).meli_id = None
+    db.flush()
+    reventa = models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=1, meli_id="MLX")
+    db.add(reventa)
+    db.commit()
+    assert publicaciones.resolver(db, ["MLX", "OTRA"]) == {"MLX": (models.ProductoReventa, reventa.id)}
+
+    db.delete(reventa)
+    db.commit()
+    assert publicaciones.resolver(db, ["MLX"]) == {}
+
+def test_publicar_rechaza_meli_id_vinculado(cliente, db, meli_falso):
+    variante(db, "MLX")
+    reventa = models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=1)
+    db.add(reventa)
+    db.commit()
+    meli_falso.programar("/items", {"status": 201, "cuerpo": json.dumps({"id": "MLX", "status": "active"})})
+
+    r = cliente.post("/sincronizacion/mercadolibre/publicar", json={
+        "title": "Gorra", "category_id": "MLM1", "price": 10, "available_quantity": 1, "reventa_id": reventa.id,
+    })
+    assert r.status_code == 400
+    db.expire_all()
+    assert db.get(models.ProductoReventa, reventa.id).meli_id is None
+
+def test_publicar_producto_ya_publicado_no_crea_otra_publicacion(cliente, db, meli_falso):
+    catalogo(db)
+    reventa_id = db.query(models.ProductoReventa.id).filter_by(meli_id="MLR1").scalar()
+
+    r = cliente.post("/sincronizacion/mercadolibre/publicar", json={
+        "title": "Gorra", "category_id": "MLM1", "price": 10, "available_quantity": 1, "reventa_id": reventa_id,
+    })
+    assert r.status_code == 400
+    assert "MLR1" in r.json()["detail"]
+    assert meli_falso.solicitudes("/items") == []
+
+def test_vincula_los_meli_id_existentes(db):
+    from sqlalchemy import text
+    from app.core.database import Base
+    catalogo(db)
+    # Base anterior a PublicacionMeLi: sin triggers ni mapeo
+    db.execute(text("DROP TRIGGER tr_publicacion_meli_productoreventa ON productoreventa"))
+    db.execute(text("DELETE FROM publicacionmeli"))
+    db.commit()
+
+    Base.metadata.create_all(bind=db.get_bind())
+    assert sorted(publicaciones.resolver(db, ["MLR1", "MLR2"])) == ["MLR1", "MLR2"]
@@ -0,0 +1,115 @@
+from app.models import models
+
+# Recepción y reversión de órdenes de compra en bloque (core/recepcion.py).
+
+def compra(db, *lineas):
+    """Orden 'Solicitada' con (modelo, id, cantidad) por línea. Devuelve (orden_id, [detalle_id])."""
+    proveedor = db.query(models.Proveedor).first() or models.Proveedor(nombre="Proveedor")
+    db.add(proveedor)
+    db.flush()
+    orden = models.OrdenCompra(estado="Solicitada", proveedor_id=proveedor.id)
+    db.add(orden)
+    db.flush()
+    detalles = [
+        models.DetalleOrdenCompra(
+            orden_compra_id=orden.id, cantidad=cantidad, costoUnitario=1,
+            materia_prima_id=id_ if modelo is models.MateriaPrima else None,
+            producto_reventa_id=id_ if modelo is models.ProductoReventa else None,
+        )
+        for modelo, id_, cantidad in lineas
+    ]
+    db.add_all(detalles)
+    db.commit()
+    return orden.id, [d.id for d in detalles]
+
+def inventario(db):
+    """Una materia prima y un producto de reventa con stock 10. Devuelve (materia_id, reventa_id)."""
+    materia = models.MateriaPrima(nombre="Tela", costo=10, unidadMedida="m", stockActual=10)
+    reventa = models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=10)
+    db.add_all([materia, reventa])
+    db.commit()
+    return materia.id, reventa.id
+
+def stock(db, modelo, id_):
+    db.expire_all()
+    return db.get(modelo, id_).stockActual
+
+def movimientos(db):
+    m = models.MovimientoInventario
+    return sorted(db.query(m.sku, m.cantidad, m.documento_id).filter(m.documento == "Compra").all())
+
+def test_recibir_y_revertir_lote(cliente, db):
+    materia_id, reventa_id = inventario(db)
+    a, _ = compra(db, (models.MateriaPrima, materia_id, 5), (models.ProductoReventa, reventa_id, 2))
+    b, _ = compra(db, (models.MateriaPrima, materia_id, 7))
+
+    r = cliente.put("/compras/recibir-lote", json={"ordenes": [a, b]})
+    assert r.status_code == 200, r.text
+    assert [o["estado"] for o in r.json()] == ["Recibida", "Recibida"]
+    assert stock(db, models.MateriaPrima, materia_id) == 22
+    assert stock(db, models.ProductoReventa, reventa_id) == 12
+    assert movimientos(db) == sorted([(f"mat-{materia_id}", 5, a), (f"rev-{reventa_id}", 2, a), (f"mat-{materia_id}", 7, b)])
+
+    # Una orden recibida no se vuelve a recibir
+    assert cliente.put("/compras/recibir-lote", json={"ordenes": [a]}).status_code == 400
+
+    r = cliente.put("/compras/revertir-lote", json={"ordenes": [a, b]})
+    assert r.status_code == 200, r.text
+    assert [o["estado"] for o in r.json()] == ["Solicitada", "Solicitada"]
+    assert stock(db, models.MateriaPrima, materia_id) == 10
+    assert stock(db, models.ProductoReventa, reventa_id) == 10
+    assert all(d["cantidadRecibida"] == 0 for o in r.json() for d in o["detalles"])
+
+def test_recepcion_parcial(cliente, db):
+    materia_id, reventa_id = inventario(db)
+    a, (linea_materia, _) = compra(db, (models.MateriaPrima, materia_id, 5), (models.ProductoReventa, reventa_id, 2))
+
+    r = cliente.put("/compras/recibir-lote", json={"lineas": [{"detalle_id": linea_materia, "cantidad": 3}]})
+    assert r.status_code == 200, r.text
+    assert r.json()[0]["estado"] == "Parcial"
+    assert stock(db, models.MateriaPrima, materia_id) == 13
+
+    # No se puede recibir más de lo pendiente
+    r = cliente.put("/compras/recibir-lote", json={"lineas": [{"detalle_id": linea_materia, "cantidad": 3}]})
+    assert r.status_code == 400
+    assert stock(db, models.MateriaPrima, materia_id) == 13
+
+    # Completar recibe solo lo pendiente de cada línea
+    r = cliente.put("/compras/recibir-lote", json={"ordenes": [a]})
+    assert r.json()[0]["estado"] == "Recibida"
+    assert stock(db, models.MateriaPrima, materia_id) == 15
+    assert stock(db, models.ProductoReventa, reventa_id) == 12
+
+def test_revertir_sin_stock_no_modifica_nada(cliente, db):
+    materia_id, reventa_id = inventario(db)
+    a, _ = compra(db, (models.MateriaPrima, materia_id, 5))
+    b, _ = compra(db, (models.ProductoReventa, reventa_id, 4))
+    cliente.put("/compras/recibir-lote", json={"ordenes": [a, b]})
+    db.query(models.ProductoReventa).filter_by(id=reventa_id).update({"stockActual": 1}) # Se vendió lo recibido
+    db.commit()
+
+    r = cliente.put("/compras/revertir-lote", json={"ordenes": [a, b]})
+    assert r.status_code == 400
+    assert stock(db, models.MateriaPrima, materia_id) == 15
+    assert {o.estado for o in db.query(models.OrdenCompra)} == {"Recibida"}
+
+    assert cliente.put("/compras/revertir-lote", json={"ordenes": [a, 999]}).status_code == 404
+
+def test_revertir_orden_recibida_sin_cantidad_recibida(cliente, db):
+    # Orden recibida antes de existir cantidadRecibida (quedó en 0)
+    materia_id, _ = inventario(db)
+    a, _ = compra(db, (models.MateriaPrima, materia_id, 5))
+    db.query(models.OrdenCompra).filter_by(id=a).update({"estado": "Recibida"})
+    db.query(models.MateriaPrima).filter_by(id=materia_id).update({"stockActual": 15})
+    db.commit()
+
+    r = cliente.put("/compras/revertir-lote", json={"ordenes": [a]})
+    assert r.status_code == 200, r.text
+    assert stock(db, models.MateriaPrima, materia_id) == 10
+
+    # Eliminarla también devuelve lo recibido
+    cliente.put("/compras/recibir-lote", json={"ordenes": [a]})
+    db.query(models.DetalleOrdenCompra).update({"cantidadRecibida": 0})
+    db.commit()
+    assert cliente.delete(f"/compras/{a}").status_code == 200
+    assert stock(db, models.MateriaPrima, materia_id) == 10
@@ -0,0 +1,68 @@
+from sqlalchemy import text
+from app.models import models
+from app.core.database import SessionLocal
+
+# Catálogo de sincronización con ETag/304 (routers/sincronizacion.py, models.VersionCatalogo).
+
+def catalogo(db):
+    fabricado = models.ProductoFabricado(nombre="Playera", precioVenta=200)
+    db.add_all([fabricado, models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=120, stockActual=10)])
+    db.flush()
+    db.add(models.VarianteProducto(color="Rojo", talla="M", stockActual=3, producto_fabricado_id=fabricado.id))
+    db.commit()
+
+def etag(cliente, previo=None):
+    r = cliente.get("/sincronizacion/productos", headers={"If-None-Match": previo} if previo else {})
+    return r.status_code, r.headers["ETag"]
+
+def escribir(sql):
+    with SessionLocal() as otra:
+        otra.execute(text(sql))
+        otra.commit()
+
+def test_etag_y_304(cliente, db):
+    catalogo(db)
+    r = cliente.get("/sincronizacion/productos")
+    assert [p["unique_id"] for p in r.json()] == ["var-1", "rev-1"]
+    version = r.headers["ETag"]
+
+    r = cliente.get("/sincronizacion/productos", headers={"If-None-Match": f'W/{version}'})
+    assert r.status_code == 304
+    assert 'desc="1 consultas"' in r.headers["Server-Timing"]
+
+    # Stock, precio del fabricado, altas y bajas cambian la versión
+    for sql in (
+        "UPDATE varianteproducto SET stockactual = 4",
+        "UPDATE productofabricado SET precioventa = 210",
+        "INSERT INTO productoreventa (nombre, costocompra, precioventa, stockactual) VALUES ('Taza', 1, 2, 3)",
+        "DELETE FROM productoreventa WHERE nombre = 'Taza'",
+    ):
+        escribir(sql)
+        status, nuevo = etag(cliente, version)
+        assert status == 200, sql
+        version = nuevo
+
+    # Una transacción que no toca el catálogo, o solo columnas que no expone, no la cambia
+    escribir("UPDATE materiaprima SET stockactual = 1")
+    escribir("UPDATE productoreventa SET costocompra = 6, descripcion = 'x'; UPDATE varianteproducto SET stockactual = stockactual")
+    assert etag(cliente, version)[0] == 304
+
+def test_un_cambio_confirmado_tarde_no_queda_oculto(cliente, db):
+    catalogo(db)
+    lenta = SessionLocal()
+    lenta.execute(text("UPDATE varianteproducto SET stockactual = 0")) # Empieza primero, confirma al final
+    escribir("UPDATE productoreventa SET stockactual = 9")
+    _, version = etag(cliente)
+    lenta.commit()
+    lenta.close()
+
+    status, _ = etag(cliente, version)
+    assert status == 200
+    assert cliente.get("/sincronizacion/productos").json()[0]["stock"] == 0
+
+def test_una_version_por_transaccion(cliente, db):
+    catalogo(db)
+    inicial = db.execute(text("SELECT sum(version) FROM versioncatalogo")).scalar()
+    escribir("UPDATE varianteproducto SET stockactual = stockactual + 1; UPDATE productoreventa SET stockactual = 1")
+    db.rollback()
+    assert db.execute(text("SELECT sum(version) FROM versioncatalogo")).scalar() == inicial + 1
@@ -0,0 +1,55 @@
+from app.models import models
+
+# Rollup diario de ventas (core/rollup_ventas.py) mantenido por los endpoints de ventas.
+
+def catalogo(db):
+    canal = models.CanalVenta(nombre="Tienda")
+    reventa = models.ProductoReventa(nombre="Gorra", costoCompra=5, precioVenta=10, stockActual=10)
+    db.add_all([canal, reventa])
+    db.commit()
+    return canal.id, reventa.id
+
+def rollup(db):
+    vd = models.VentaDiaria
+    db.expire_all()
+    return db.query(vd.sku, vd.unidades, vd.unidadesDevueltas).all()
+
+def test_borrar_las_ventas_libera_canal_y_producto(cliente, db):
+    canal_id, reventa_id = catalogo(db)
+    venta = cliente.post("/ventas/", json={
+        "canal_venta_id": canal_id, "detalles": [{"cantidad": 2, "precioUnitario": 10, "producto_reventa_id": reventa_id}],
+    }).json()
+    assert rollup(db) == [(f"rev-{reventa_id}", 2, 0)]
+
+    r = cliente.put(f"/ventas/{venta['id']}", json={"estado": "Devolución"})
+    assert r.status_code == 200, r.text
+    assert rollup(db) == [(f"rev-{reventa_id}", 2, 2)]
+
+    assert cliente.delete(f"/ventas/{venta['id']}").status_code == 200
+    assert rollup(db) == []
+    assert cliente.delete(f"/ventas/canales/{canal_id}").status_code == 200
+    assert cliente.delete(f"/productos/reventa/{reventa_id}").status_code == 200
+
+# --- Importación masiva (core/importacion.py) ---
+def test_importar_rechaza_lineas_de_la_misma_orden_con_otra_cabecera(cliente, db):
+    canal_id, reventa_id = catalogo(db)
+    db.add(models.CanalVenta(nombre="Web"))
+    db.commit()
+    csv = "\n".join([
+        "orden,fecha,canal,estado,sku,cantidad,precio",
+        f"A,2024-01-01T10:00:00,Tienda,Pagada,rev-{reventa_id},1,",
+        f"A,2024-01-01T10:00:00,Web,Pagada,rev-{reventa_id},1,",
+        f"B,2024-01-01T10:00:00,Tienda,Pagada,rev-{reventa_id},1,",
+        f"B,2024-01-02T10:00:00,Tienda,Devolución,rev-{reventa_id},1,",
+        f"C,2024-01-01T10:00:00,Tienda,Pagada,rev-{reventa_id},1,",
+        f"C,2024-01-01T10:00:00,Tienda,Pagada,rev-{reventa_id},2,",
+    ])
+
+    r = cliente.post("/ventas/import", files={"archivo": ("ventas.csv", csv.encode())})
+    assert r.status_code == 200, r.text
+    assert r.json()["ordenes_importadas"] == 1
+    assert [(e["linea"], e["orden"], e["error"]) for e in r.json()["errores"]] == [
+        (3, "A", "Canal distinto de la línea 2 de la misma orden"),
+        (5, "B", "Fecha, estado distintos de la línea 4 de la misma orden"),
+    ]
+    assert db.query(models.DetalleOrdenVenta.cantidad).order_by(models.DetalleOrdenVenta.cantidad).all() == [(1,), (2,)]
@@ -17,6 +17,9 @@ import { Badge } from "@/components/ui/badge";
 import { PlusCircle, CheckCircle, Loader2, Trash2, ShoppingCart, Box, Layers, Eye, Pencil } from "lucide-react";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { fetchPaginado } from "@/lib/utils";
+import { usePaginado } from "@/lib/usePaginado";
+import { CargarMas, FiltrosHistorial, FiltrosHistorialBar, FILTROS_VACIOS } from "@/components/historial";
 
 // --- Interfaces ---
 interface ItemCompra {
@@ -38,7 +41,9 @@ interface OrdenCompra {
 
 export default function ComprasPage() {
   // Datos Maestros
-  const [ordenes, setOrdenes] = useState<OrdenCompra[]>([]);
+  const [filtros, setFiltros] = useState<FiltrosHistorial>(FILTROS_VACIOS);
+  const historial = usePaginado<OrdenCompra>("http://127.0.0.1:8000/compras/", filtros);
+  const ordenes = historial.items;
   const [proveedores, setProveedores] = useState<any[]>([]);
   const [materias, setMaterias] = useState<any[]>([]);
   const [productosRev, setProductosRev] = useState<any[]>([]);
@@ -74,15 +79,10 @@ export default function ComprasPage() {
         const token = localStorage.getItem("inventia_token");
         const headers = { 'Authorization': `Bearer ${token}` };
 
-        // Cargar Ordenes
-        const resOrd = await fetch("http://127.0.0.1:8000/compras/", { headers });
-        const dataOrd = await resOrd.json();
-        setOrdenes(dataOrd);
-
         // Cargar Maestros para el formulario
         const resProv = await fetch("http://127.0.0.1:8000/productos/proveedores", { headers });
-        const resMat = await fetch("http://127.0.0.1:8000/materia-prima", { headers });
-        const resProd = await fetch("http://127.0.0.1:8000/productos/reventa", { headers });
+        const resMat = await fetchPaginado("http://127.0.0.1:8000/materia-prima", { headers });
+        const resProd = await fetchPaginado("http://127.0.0.1:8000/productos/reventa", { headers });
 
         setProveedores(await resProv.json());
         setMaterias(await resMat.json());
@@ -99,6 +99,9 @@ export default function ComprasPage() {
     fetchData();
   }, []);
 
+  // Después de crear, recibir o editar: maestros (stock) y primera página del historial
+  const refrescar = () => { fetchData(); historial.recargar(); };
+
   // --- Lógica del Carrito ---
   const addItemToCart = () => {
     if (!itemId || !itemQty || !itemCost) return;
@@ -162,7 +165,7 @@ export default function ComprasPage() {
             setCreateDialogOpen(false);
             setCart([]);
             setSelectedProv("");
-            fetchData();
+            refrescar();
         } else {
             alert("Error al guardar la orden");
         }
@@ -185,7 +188,7 @@ export default function ComprasPage() {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         if (res.ok) {
-            fetchData();
+            refrescar();
         } else {
             const err = await res.json();
             alert(err.detail);
@@ -210,7 +213,7 @@ export default function ComprasPage() {
         }
       } catch (e) { console.error(e); }
       setEditDialogOpen(false);
-      fetchData();
+      refrescar();
   };
 
   const totalOrden = cart.reduce((acc, item) => acc + (item.cantidad * item.costo), 0);
@@ -221,7 +224,7 @@ export default function ComprasPage() {
         <h1 className="text-3xl font-bold">🚚 Gestión de Compras</h1>
         <Dialog open={createDialogOpen} onOpenChange={setCreateDialogOpen}>
           <DialogTrigger asChild>
-            <Button>
+            <Button disabled={isLoading}>
               <PlusCircle className="mr-2 h-4 w-4" />
               Nueva Orden de Compra
             </Button>
@@ -341,7 +344,8 @@ export default function ComprasPage() {
               <CardTitle>Órdenes Recientes</CardTitle>
             </CardHeader>
             <CardContent>
-              {isLoading ? <div className="text-center py-4">Cargando...</div> : 
+              <FiltrosHistorialBar filtros={filtros} onChange={setFiltros} estados={["Borrador", "Solicitada", "Parcial", "Recibida"]} />
+              {historial.error && <Alert variant="destructive"><AlertDescription>{historial.error}</AlertDescription></Alert>}
               <Table>
                 <TableHeader>
                   <TableRow>
@@ -385,7 +389,7 @@ export default function ComprasPage() {
                   ))}
                 </TableBody>
               </Table>
-              }
+              <CargarMas hayMas={historial.hayMas} cargando={historial.cargando} onClick={historial.cargarMas} />
             </CardContent>
           </Card>
         </TabsContent>
@@ -15,6 +15,7 @@ import { Label } from "@/components/ui/label";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { PlusCircle, Loader2, RefreshCw, Eye, Pencil, Trash2 } from "lucide-react";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { fetchPaginado } from "@/lib/utils";
 
 interface Proveedor { id: number; nombre: string; }
 interface MateriaPrima {
@@ -41,7 +42,7 @@ export default function InventarioMateriaPage() {
       const token = localStorage.getItem("inventia_token");
       const headers = { 'Authorization': `Bearer ${token}` };
       const [resMat, resProv] = await Promise.all([
-          fetch("http://127.0.0.1:8000/materia-prima", { headers }),
+          fetchPaginado("http://127.0.0.1:8000/materia-prima", { headers }),
           fetch("http://127.0.0.1:8000/productos/proveedores", { headers })
       ]);
       setMateriales(await resMat.json());
@@ -19,6 +19,7 @@ import { Badge } from "@/components/ui/badge";
 import { PlusCircle, Loader2, RefreshCw, Eye, Pencil, Trash2, Factory, Store, Layers } from "lucide-react";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { fetchPaginado } from "@/lib/utils";
 
 // --- Interfaces ---
 interface Proveedor { id: number; nombre: string; }
@@ -75,10 +76,10 @@ export default function InventarioProductoPage() {
       
       // Peticiones en paralelo para optimizar
       const [resFab, resRev, resProv, resVar] = await Promise.all([
-          fetch("http://127.0.0.1:8000/productos/fabricados", { headers }),
-          fetch("http://127.0.0.1:8000/productos/reventa", { headers }),
+          fetchPaginado("http://127.0.0.1:8000/productos/fabricados", { headers }),
+          fetchPaginado("http://127.0.0.1:8000/productos/reventa", { headers }),
           fetch("http://127.0.0.1:8000/productos/proveedores", { headers }),
-          fetch("http://127.0.0.1:8000/produccion/variantes", { headers })
+          fetchPaginado("http://127.0.0.1:8000/produccion/variantes", { headers })
       ]);
 
       const dataFab = await resFab.json();
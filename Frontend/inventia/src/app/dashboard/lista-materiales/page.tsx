@@ -8,6 +8,7 @@ import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
 import { PlusCircle, Trash2, Loader2, Pencil, Save } from "lucide-react";
+import { fetchPaginado } from "@/lib/utils";
 
 export default function ListaMaterialesPage() {
   const [bomItems, setBomItems] = useState<any[]>([]);
@@ -26,8 +27,8 @@ export default function ListaMaterialesPage() {
       const headers = { 'Authorization': `Bearer ${token}` };
       const [resBOM, resProd, resMat] = await Promise.all([
           fetch("http://127.0.0.1:8000/produccion/bom", { headers }),
-          fetch("http://127.0.0.1:8000/productos/fabricados", { headers }),
-          fetch("http://127.0.0.1:8000/materia-prima", { headers })
+          fetchPaginado("http://127.0.0.1:8000/productos/fabricados", { headers }),
+          fetchPaginado("http://127.0.0.1:8000/materia-prima", { headers })
       ]);
       setBomItems(await resBOM.json());
       setProductos(await resProd.json());
@@ -18,6 +18,9 @@ import { PlusCircle, AlertTriangle, CheckCircle, Loader2, Factory, RefreshCw, Se
 import { Eye, Pencil, ArrowRight } from "lucide-react";
 import { Badge } from "@/components/ui/badge";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { fetchPaginado } from "@/lib/utils";
+import { usePaginado } from "@/lib/usePaginado";
+import { CargarMas, FiltrosHistorial, FiltrosHistorialBar, FILTROS_VACIOS } from "@/components/historial";
 
 // --- Interfaces ---
 interface Variante {
@@ -43,7 +46,9 @@ interface ProductoFabricado {
 
 export default function ProduccionPage() {
   // Datos
-  const [ordenes, setOrdenes] = useState<OrdenProduccion[]>([]);
+  const [filtros, setFiltros] = useState<FiltrosHistorial>(FILTROS_VACIOS);
+  const historial = usePaginado<OrdenProduccion>("http://127.0.0.1:8000/produccion/ordenes", filtros);
+  const ordenes = historial.items;
   const [variantes, setVariantes] = useState<Variante[]>([]);
   const [productosFab, setProductosFab] = useState<ProductoFabricado[]>([]); // Para crear nuevas variantes
   
@@ -70,11 +75,9 @@ export default function ProduccionPage() {
         const token = localStorage.getItem("inventia_token");
         const headers = { 'Authorization': `Bearer ${token}` };
 
-        const resOrd = await fetch("http://127.0.0.1:8000/produccion/ordenes", { headers });
-        const resVar = await fetch("http://127.0.0.1:8000/produccion/variantes", { headers });
-        const resProd = await fetch("http://127.0.0.1:8000/productos/fabricados", { headers });
+        const resVar = await fetchPaginado("http://127.0.0.1:8000/produccion/variantes", { headers });
+        const resProd = await fetchPaginado("http://127.0.0.1:8000/productos/fabricados", { headers });
 
-        setOrdenes(await resOrd.json());
         setVariantes(await resVar.json());
         setProductosFab(await resProd.json());
     } catch (err) {
@@ -89,6 +92,9 @@ export default function ProduccionPage() {
     fetchData();
   }, []);
 
+  // Después de crear, terminar o eliminar: variantes de los selectores y primera página del historial
+  const refrescar = () => { fetchData(); historial.recargar(); };
+
   // --- Crear Orden ---
   const handleCreateOrder = async () => {
     setIsSaving(true);
@@ -108,7 +114,7 @@ export default function ProduccionPage() {
         
         setCreateDialogOpen(false);
         setNewOrder({ variante_id: "", cantidad: "" });
-        fetchData();
+        refrescar();
     } catch (err: any) {
         setError(err.message);
     } finally {
@@ -131,7 +137,7 @@ export default function ProduccionPage() {
             const errData = await res.json();
             alert("Error: " + errData.detail); // Mostrar error de stock insuficiente
         } else {
-            fetchData();
+            refrescar();
         }
     } catch (err) {
         console.error(err);
@@ -156,7 +162,7 @@ export default function ProduccionPage() {
         if (res.ok) {
             setVariantDialogOpen(false);
             setNewVariant({ producto_id: "", color: "", talla: "" });
-            fetchData();
+            refrescar();
         }
     } catch (err) { console.error(err); } finally { setIsSaving(false); }
   };
@@ -172,7 +178,7 @@ export default function ProduccionPage() {
               const err = await res.json();
               alert(err.detail);
           } else {
-              fetchData();
+              refrescar();
           }
       } catch(e) { console.error(e); }
   };
@@ -199,14 +205,14 @@ export default function ProduccionPage() {
         }
       } catch (e) { console.error(e); }
       setEditDialogOpen(false);
-      fetchData();
+      refrescar();
   };
 
   const handleDelete = async (id: number) => {
       if (!confirm("¿Eliminar orden? Se revertirá el inventario si ya estaba terminada.")) return;
       const token = localStorage.getItem("inventia_token");
       await fetch(`http://127.0.0.1:8000/produccion/ordenes/${id}`, { method: "DELETE", headers: { 'Authorization': `Bearer ${token}` }});
-      fetchData();
+      refrescar();
   };
 
   return (
@@ -214,7 +220,7 @@ export default function ProduccionPage() {
       <div className="flex justify-between items-center mb-6">
         <h1 className="text-3xl font-bold">🧵 Producción</h1>
         <div className="flex gap-2">
-            <Button variant="outline" onClick={fetchData} disabled={isLoading}>
+            <Button variant="outline" onClick={refrescar} disabled={isLoading}>
                 <RefreshCw className={`mr-2 h-4 w-4 ${isLoading ? 'animate-spin' : ''}`} />
             </Button>
 
@@ -317,6 +323,8 @@ export default function ProduccionPage() {
           <Card>
             <CardHeader><CardTitle>Lotes de Producción</CardTitle></CardHeader>
             <CardContent>
+              <FiltrosHistorialBar filtros={filtros} onChange={setFiltros} estados={["En Proceso", "Terminado"]} />
+              {historial.error && <Alert variant="destructive"><AlertDescription>{historial.error}</AlertDescription></Alert>}
               <Table>
                 <TableHeader>
                   <TableRow>
@@ -347,6 +355,7 @@ export default function ProduccionPage() {
                   ))}
                 </TableBody>
               </Table>
+              <CargarMas hayMas={historial.hayMas} cargando={historial.cargando} onClick={historial.cargarMas} />
             </CardContent>
           </Card>
         </TabsContent>
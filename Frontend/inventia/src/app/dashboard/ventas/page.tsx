@@ -14,6 +14,9 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { PlusCircle, ShoppingCart, Loader2, Trash2, Eye, Search, Store, Factory } from "lucide-react";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { fetchPaginado } from "@/lib/utils";
+import { usePaginado } from "@/lib/usePaginado";
+import { CargarMas, FiltrosHistorial, FiltrosHistorialBar, FILTROS_VACIOS } from "@/components/historial";
 
 // --- Interfaces ---
 interface Canal { id: number; nombre: string; }
@@ -37,7 +40,9 @@ interface Venta {
 
 export default function VentasPage() {
   // Datos
-  const [ventas, setVentas] = useState<Venta[]>([]);
+  const [filtros, setFiltros] = useState<FiltrosHistorial>(FILTROS_VACIOS);
+  const historial = usePaginado<Venta>("http://127.0.0.1:8000/ventas/", filtros);
+  const ventas = historial.items;
   const [canales, setCanales] = useState<Canal[]>([]);
   const [inventario, setInventario] = useState<any[]>([]); // Mezcla de Variantes y Prod Reventa
   
@@ -63,15 +68,13 @@ export default function VentasPage() {
         const token = localStorage.getItem("inventia_token");
         const headers = { 'Authorization': `Bearer ${token}` };
 
-        const [resVentas, resCanales, resVar, resRev, resFab] = await Promise.all([
-            fetch("http://127.0.0.1:8000/ventas/", { headers }),
+        const [resCanales, resVar, resRev, resFab] = await Promise.all([
             fetch("http://127.0.0.1:8000/ventas/canales", { headers }),
-            fetch("http://127.0.0.1:8000/produccion/variantes", { headers }),
-            fetch("http://127.0.0.1:8000/productos/reventa", { headers }),
-            fetch("http://127.0.0.1:8000/productos/fabricados", { headers })
+            fetchPaginado("http://127.0.0.1:8000/produccion/variantes", { headers }),
+            fetchPaginado("http://127.0.0.1:8000/productos/reventa", { headers }),
+            fetchPaginado("http://127.0.0.1:8000/productos/fabricados", { headers })
         ]);
 
-        setVentas(await resVentas.json());
         setCanales(await resCanales.json());
         
         // Construir inventario unificado para el selector
@@ -109,6 +112,9 @@ export default function VentasPage() {
 
   useEffect(() => { fetchData(); }, []);
 
+  // Después de registrar o cancelar: stock de los selectores y primera página del historial
+  const refrescar = () => { fetchData(); historial.recargar(); };
+
   // --- Carrito ---
   const addToCart = () => {
       if (!selectedItemJson || !qty) return;
@@ -171,7 +177,7 @@ export default function VentasPage() {
           setCreateDialogOpen(false);
           setCart([]);
           setSelectedCanal("");
-          fetchData();
+          refrescar();
       } catch (err: any) { setError(err.message); } finally { setIsSaving(false); }
   };
 
@@ -181,7 +187,7 @@ export default function VentasPage() {
       const token = localStorage.getItem("inventia_token");
       try {
           await fetch(`http://127.0.0.1:8000/ventas/${id}`, { method: "DELETE", headers: { 'Authorization': `Bearer ${token}` } });
-          fetchData();
+          refrescar();
       } catch (e) { console.error(e); }
   };
 
@@ -199,7 +205,7 @@ export default function VentasPage() {
         <h1 className="text-3xl font-bold">🛒 Ventas</h1>
         <Dialog open={createDialogOpen} onOpenChange={setCreateDialogOpen}>
             <DialogTrigger asChild>
-                <Button><PlusCircle className="mr-2 h-4 w-4" /> Nueva Venta Manual</Button>
+                <Button disabled={isLoading}><PlusCircle className="mr-2 h-4 w-4" /> Nueva Venta Manual</Button>
             </DialogTrigger>
             <DialogContent className="sm:max-w-[700px]">
                 <DialogHeader><DialogTitle>Registrar Venta</DialogTitle></DialogHeader>
@@ -303,7 +309,8 @@ export default function VentasPage() {
       <Card>
         <CardHeader><CardTitle>Historial de Ventas</CardTitle></CardHeader>
         <CardContent>
-            {isLoading ? <div className="text-center py-4"><Loader2 className="animate-spin h-8 w-8 mx-auto"/></div> : 
+            <FiltrosHistorialBar filtros={filtros} onChange={setFiltros} estados={["Pagada", "Devolución"]} />
+            {historial.error && <Alert variant="destructive"><AlertDescription>{historial.error}</AlertDescription></Alert>}
             <Table>
                 <TableHeader><TableRow><TableHead>ID</TableHead><TableHead>Fecha</TableHead><TableHead>Canal</TableHead><TableHead>Total Items</TableHead><TableHead>Total $</TableHead><TableHead>Estado</TableHead><TableHead className="text-right">Acciones</TableHead></TableRow></TableHeader>
                 <TableBody>
@@ -326,7 +333,7 @@ export default function VentasPage() {
                     })}
                 </TableBody>
             </Table>
-            }
+            <CargarMas hayMas={historial.hayMas} cargando={historial.cargando} onClick={historial.cargarMas} />
         </CardContent>
       </Card>
     </section>
@@ -0,0 +1,58 @@
+"use client";
+import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
+import { Label } from "@/components/ui/label";
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
+import { Loader2 } from "lucide-react";
+
+// Filtros de los historiales (estado y rango de fechas) y botón "Cargar más".
+// Los valores se mandan tal cual en la query: estado, fecha_desde, fecha_hasta.
+export type FiltrosHistorial = {
+  estado: string;
+  fecha_desde: string;
+  fecha_hasta: string;
+};
+
+export const FILTROS_VACIOS: FiltrosHistorial = { estado: "", fecha_desde: "", fecha_hasta: "" };
+const TODOS = "todos";
+
+export function FiltrosHistorialBar({ filtros, onChange, estados }: {
+  filtros: FiltrosHistorial;
+  onChange: (filtros: FiltrosHistorial) => void;
+  estados: string[];
+}) {
+  return (
+    <div className="flex flex-wrap items-end gap-3 mb-4">
+      <div className="grid gap-1">
+        <Label className="text-xs">Estado</Label>
+        <Select value={filtros.estado || TODOS} onValueChange={v => onChange({ ...filtros, estado: v === TODOS ? "" : v })}>
+          <SelectTrigger className="w-[160px]"><SelectValue /></SelectTrigger>
+          <SelectContent>
+            <SelectItem value={TODOS}>Todos</SelectItem>
+            {estados.map(e => <SelectItem key={e} value={e}>{e}</SelectItem>)}
+          </SelectContent>
+        </Select>
+      </div>
+      <div className="grid gap-1">
+        <Label className="text-xs">Desde</Label>
+        <Input type="date" className="w-[160px]" value={filtros.fecha_desde} onChange={e => onChange({ ...filtros, fecha_desde: e.target.value })} />
+      </div>
+      <div className="grid gap-1">
+        <Label className="text-xs">Hasta</Label>
+        <Input type="date" className="w-[160px]" value={filtros.fecha_hasta} onChange={e => onChange({ ...filtros, fecha_hasta: e.target.value })} />
+      </div>
+      {(filtros.estado || filtros.fecha_desde || filtros.fecha_hasta) &&
+        <Button variant="ghost" size="sm" onClick={() => onChange(FILTROS_VACIOS)}>Limpiar</Button>}
+    </div>
+  );
+}
+
+export function CargarMas({ hayMas, cargando, onClick }: { hayMas: boolean; cargando: boolean; onClick: () => void }) {
+  if (!hayMas && !cargando) return null;
+  return (
+    <div className="flex justify-center mt-4">
+      {cargando ? <Loader2 className="animate-spin h-6 w-6" /> :
+        <Button variant="outline" onClick={onClick}>Cargar más</Button>}
+    </div>
+  );
+}
@@ -0,0 +1,44 @@
+"use client";
+import { useCallback, useEffect, useRef, useState } from "react";
+import { fetchPagina } from "@/lib/utils";
+
+// Historial paginado por cursor: carga la primera página y agrega las siguientes con
+// cargarMas(). Los filtros van en la query (los aplica el servidor); al cambiarlos
+// se vuelve a la primera página. recargar() después de crear/editar/borrar.
+export function usePaginado<T>(url: string, filtros: Record<string, string> = {}) {
+  const [items, setItems] = useState<T[]>([]);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [cargando, setCargando] = useState(true);
+  const [error, setError] = useState("");
+  const clave = JSON.stringify(filtros);
+  const ultima = useRef(0); // Descarta respuestas de filtros anteriores
+
+  const cargar = useCallback(async (desde: string | null) => {
+    const solicitud = ++ultima.current;
+    setCargando(true);
+    setError("");
+    try {
+      const token = localStorage.getItem("inventia_token");
+      const pagina = await fetchPagina<T>(url, JSON.parse(clave), desde, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (solicitud !== ultima.current) return;
+      setItems(previos => desde ? [...previos, ...pagina.items] : pagina.items);
+      setCursor(pagina.cursor);
+    } catch (err) {
+      console.error(err);
+      if (solicitud === ultima.current) setError("Error de conexión con el servidor");
+    } finally {
+      if (solicitud === ultima.current) setCargando(false);
+    }
+  }, [url, clave]);
+
+  useEffect(() => { cargar(null); }, [cargar]);
+
+  return {
+    items,
+    hayMas: cursor !== null,
+    cargando,
+    error,
+    cargarMas: () => { if (cursor) cargar(cursor); },
+    recargar: () => cargar(null),
+  };
+}
@@ -17,4 +17,47 @@ export function parseJwt(token: string) {
     } catch (e) {
         return null;
     }
-}
\ No newline at end of file
+}
+// Los listados de la API se paginan por cursor (header X-Next-Cursor).
+// Los historiales (ventas, compras, producción) se leen página a página con
+// fetchPagina y "Cargar más" (ver usePaginado); los filtros van en la query.
+export interface Pagina<T> {
+    items: T[];
+    cursor: string | null; // Siguiente página; null si no hay más
+}
+
+export async function fetchPagina<T>(
+    url: string,
+    filtros: Record<string, string> = {},
+    cursor: string | null = null,
+    init?: RequestInit,
+    limite = 100
+): Promise<Pagina<T>> {
+    const pagina = new URL(url);
+    for (const [clave, valor] of Object.entries(filtros)) {
+        if (valor) pagina.searchParams.set(clave, valor);
+    }
+    pagina.searchParams.set("limite", String(limite));
+    if (cursor) pagina.searchParams.set("cursor", cursor);
+    const res = await fetch(pagina.toString(), init);
+    if (!res.ok) throw new Error(`Error ${res.status} al cargar ${url}`);
+    return { items: await res.json(), cursor: res.headers.get("X-Next-Cursor") };
+}
+
+// Catálogos para selectores y búsquedas (materias, productos, variantes): se
+// necesitan completos. Devuelve una Response con la lista entera, así los
+// llamadores siguen usando res.ok / res.json(). No usar para historiales.
+export async function fetchPaginado(url: string, init?: RequestInit): Promise<Response> {
+    const items: unknown[] = [];
+    let cursor: string | null = null;
+    do {
+        try {
+            const pagina: Pagina<unknown> = await fetchPagina(url, {}, cursor, init, 500);
+            items.push(...pagina.items);
+            cursor = pagina.cursor;
+        } catch {
+            return new Response(null, { status: 500 });
+        }
+    } while (cursor);
+    return new Response(JSON.stringify(items), { status: 200, headers: { "Content-Type": "application/json" } });
+}